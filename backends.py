@@ -0,0 +1,314 @@
+"""Screen grab and page turn backends used by CaptureSession.
+
+A grab backend takes a picture of the capture region, a page turner moves
+the viewer to the next page. Keeping them behind these small interfaces
+means the capture engine never has to know whether it is talking to the
+real screen, a fake in-memory book or something faster.
+"""
+import os
+import platform
+import time
+
+
+class GrabBackend:
+    """Base class for anything that can take a picture of the capture area"""
+
+    def grab(self, region):
+        """Return a PIL image of region = (x, y, width, height)"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release whatever the backend holds open (nothing by default)"""
+        pass
+
+
+class PageTurner:
+    """Base class for anything that can move the viewer to the next page"""
+
+    def turn(self):
+        raise NotImplementedError
+
+    def settings(self):
+        """JSON-friendly description, so the session journal can recreate the turner"""
+        return {"method": type(self).__name__}
+
+    def close(self):
+        pass
+
+
+class PyAutoGuiGrabber(GrabBackend):
+    """Grabs the screen through pyautogui (the original way the tool worked)"""
+
+    def grab(self, region):
+        # Imported here so headless runs with other backends never need a display
+        import pyautogui
+        return pyautogui.screenshot(region=region)
+
+
+def create_grabber():
+    """The fastest grab backend that works on this machine
+
+    On Linux with an X display that is the shared memory XShmGrabber,
+    everywhere else (or if X11 can't be used) pyautogui.
+    """
+    if platform.system() == "Linux" and os.environ.get("DISPLAY"):
+        try:
+            from x11_backends import XShmGrabber
+            return XShmGrabber()
+        except OSError:
+            pass
+    return PyAutoGuiGrabber()
+
+
+class KeyPressTurner(PageTurner):
+    """Turns the page by pressing a keyboard key"""
+
+    def __init__(self, key):
+        self.key = key
+
+    def turn(self):
+        import pyautogui
+        pyautogui.press(self.key)
+
+    def settings(self):
+        return {"method": "keyboard", "key": self.key}
+
+
+class MouseClickTurner(PageTurner):
+    """Turns the page by clicking on the viewer's 'Next Page' button"""
+
+    def __init__(self, position):
+        self.position = position
+
+    def turn(self):
+        import pyautogui
+        pyautogui.click(self.position[0], self.position[1])
+
+    def settings(self):
+        return {"method": "mouse", "position": list(self.position)}
+
+
+class ScrollTurner(PageTurner):
+    """Scrolls the viewer with the mouse wheel, for viewers without pages
+
+    clicks is how far one step goes (negative is down). With position the
+    mouse moves there first, so the wheel reaches the right window.
+    """
+
+    def __init__(self, clicks=-5, position=None):
+        self.clicks = clicks
+        self.position = position
+
+    def turn(self):
+        import pyautogui
+        if self.position:
+            pyautogui.scroll(self.clicks, x=self.position[0], y=self.position[1])
+        else:
+            pyautogui.scroll(self.clicks)
+
+    def settings(self):
+        return {"method": "scroll", "clicks": self.clicks,
+                "position": list(self.position) if self.position else None}
+
+
+MOUSE_BUTTONS = {"left": 1, "middle": 2, "right": 3}
+
+
+def parse_turn_steps(steps):
+    """Check and parse the steps of a page turn
+
+    steps is a list of step strings, or one string with the steps separated
+    by commas, like "ctrl+right, wait 0.05, right". A step is one of:
+
+        right, pagedown, ctrl+right   press a key or a key combination
+        click X Y [left|middle|right]
+        move X Y
+        scroll N [X Y]                mouse wheel, negative is down
+        wait SECONDS
+
+    Key names are pyautogui's (see KeyPressTurner). Returns a list of
+    tuples, raises ValueError for a step it doesn't understand.
+    """
+    if isinstance(steps, str):
+        steps = steps.split(",")
+    parsed = []
+    for step in steps:
+        words = step.split()
+        if not words:
+            continue
+        kind = words[0].lower()
+        try:
+            if kind == "wait" and len(words) == 2:
+                parsed.append(("wait", max(0.0, float(words[1]))))
+            elif kind == "click" and len(words) in (3, 4):
+                button = words[3].lower() if len(words) == 4 else "left"
+                if button not in MOUSE_BUTTONS:
+                    raise ValueError
+                parsed.append(("click", int(words[1]), int(words[2]), button))
+            elif kind == "move" and len(words) == 3:
+                parsed.append(("move", int(words[1]), int(words[2])))
+            elif kind == "scroll" and len(words) in (2, 4):
+                position = (int(words[2]), int(words[3])) if len(words) == 4 else None
+                parsed.append(("scroll", int(words[1]), position))
+            elif len(words) == 1 and all(kind.split("+")):
+                parsed.append(("key", tuple(kind.split("+"))))
+            else:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"Can't understand page turn step {step.strip()!r}") from None
+    if not parsed:
+        raise ValueError("A page turn needs at least one step")
+    return parsed
+
+
+def format_turn_steps(parsed):
+    """parse_turn_steps() the other way round - one step string per step"""
+    texts = []
+    for step in parsed:
+        if step[0] == "key":
+            texts.append("+".join(step[1]))
+        elif step[0] == "click":
+            texts.append(f"click {step[1]} {step[2]} {step[3]}")
+        elif step[0] == "move":
+            texts.append(f"move {step[1]} {step[2]}")
+        elif step[0] == "scroll":
+            texts.append(f"scroll {step[1]}" + (f" {step[2][0]} {step[2][1]}" if step[2] else ""))
+        else:
+            texts.append(f"wait {step[1]:g}")
+    return texts
+
+
+class StepTurner(PageTurner):
+    """Turns the page with a sequence of steps (see parse_turn_steps), through pyautogui
+
+    pyautogui normally sleeps pyautogui.PAUSE (0.1 s) after every call -
+    not here, so a turn takes only as long as its own wait steps. On X11,
+    create_turner() picks the faster XTestTurner instead.
+    """
+
+    def __init__(self, steps):
+        self.steps = parse_turn_steps(steps)
+
+    def turn(self):
+        import pyautogui
+        for step in self.steps:
+            kind = step[0]
+            if kind == "key":
+                pyautogui.hotkey(*step[1], _pause=False)
+            elif kind == "click":
+                pyautogui.click(step[1], step[2], button=step[3], _pause=False)
+            elif kind == "move":
+                pyautogui.moveTo(step[1], step[2], _pause=False)
+            elif kind == "scroll":
+                x, y = step[2] or (None, None)
+                pyautogui.scroll(step[1], x=x, y=y, _pause=False)
+            else:
+                time.sleep(step[1])
+
+    def settings(self):
+        return {"method": "steps", "steps": format_turn_steps(self.steps)}
+
+
+def create_turner(steps):
+    """The fastest page turner for steps that works on this machine
+
+    On Linux with an X display that is XTestTurner, everywhere else (or if
+    the XTest extension isn't there, or a key has no X keysym of its own)
+    StepTurner.
+    """
+    parse_turn_steps(steps)  # Bad steps are a ValueError whichever turner it is
+    if platform.system() == "Linux" and os.environ.get("DISPLAY"):
+        try:
+            from x11_backends import XTestTurner
+            return XTestTurner(steps)
+        except (OSError, ValueError):
+            pass  # ValueError - a key pyautogui knows but X11 doesn't, e.g. printscreen
+    return StepTurner(steps)
+
+
+def turner_from_settings(settings):
+    """Recreate a page turner from its settings() - None if it can't be"""
+    if settings.get("method") == "steps":
+        try:
+            return create_turner(settings.get("steps") or [])
+        except ValueError:
+            return None
+    if settings.get("method") == "keyboard":
+        return KeyPressTurner(settings["key"])
+    if settings.get("method") == "mouse":
+        return MouseClickTurner(tuple(settings["position"]))
+    if settings.get("method") == "scroll":
+        position = settings.get("position")
+        return ScrollTurner(settings.get("clicks", -5), tuple(position) if position else None)
+    return None
+
+
+class MemoryBook(GrabBackend, PageTurner):
+    """A fake book kept in memory - grabs return the current page, turns move forward
+
+    Useful for running captures without a screen (benchmarks, servers).
+    Turning past the last page stays on the last page, like a real viewer does.
+
+    With render_latency a turn takes that many seconds to show up, like a
+    viewer that is still drawing the next page - grabs in the meantime
+    still see the old one.
+    """
+
+    def __init__(self, pages, render_latency=0.0):
+        self.pages = list(pages)
+        self.render_latency = render_latency
+        self.index = 0
+        self.turns = 0
+        self._shown = 0  # Page on screen while the next one is still rendering
+        self._ready_at = 0.0
+
+    def grab(self, region):
+        if time.monotonic() < self._ready_at:
+            page = self.pages[self._shown]
+        else:
+            page = self.pages[self.index]
+        if region is None:
+            return page.copy()
+        x, y, width, height = region
+        return page.crop((x, y, x + width, y + height))
+
+    def turn(self):
+        self.turns += 1
+        if time.monotonic() >= self._ready_at:
+            self._shown = self.index
+        if self.index < len(self.pages) - 1:
+            self.index += 1
+        self._ready_at = time.monotonic() + self.render_latency
+
+
+class MemoryDocument(GrabBackend, PageTurner):
+    """A fake scrolling viewer - a tall image seen through a view_height window
+
+    Every turn scrolls down by step rows, and stops at the bottom like a
+    real viewer. The counterpart of MemoryBook for scroll captures.
+    """
+
+    def __init__(self, image, view_height, step, render_latency=0.0):
+        self.image = image
+        self.view_height = view_height
+        self.step = step
+        self.render_latency = render_latency
+        self.top = 0
+        self.turns = 0
+        self._shown = 0  # Scroll position still on screen while the new one renders
+        self._ready_at = 0.0
+
+    def grab(self, region):
+        top = self._shown if time.monotonic() < self._ready_at else self.top
+        view = self.image.crop((0, top, self.image.width, top + self.view_height))
+        if region is None:
+            return view
+        x, y, width, height = region
+        return view.crop((x, y, x + width, y + height))
+
+    def turn(self):
+        self.turns += 1
+        if time.monotonic() >= self._ready_at:
+            self._shown = self.top
+        self.top = min(self.top + self.step, self.image.height - self.view_height)
+        self._ready_at = time.monotonic() + self.render_latency
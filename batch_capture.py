@@ -0,0 +1,315 @@
+"""Captures a list of books one after the other, from the command line - no window.
+
+    python batch_capture.py jobs.json
+    python batch_capture.py jobs.json --check     (only validate the job file)
+
+The job file is JSON: a list of jobs, or {"defaults": {...}, "jobs": [...]}
+where every job is merged over the defaults. A job uses the same names as
+the settings in a capture's session journal:
+
+    {
+      "name": "Chemistry",                   shown in the log, optional
+      "folder": "C:/books/chemistry",        where the pages go (created if needed)
+      "region": [100, 80, 1200, 1600],       left, top, width, height on screen
+      "turner": {"method": "keyboard", "key": "right"},
+                or {"method": "mouse", "position": [1800, 900]}
+                or {"method": "steps", "steps": ["ctrl+right", "wait 0.05"]}
+                   (keys and clicks with no pause after them, see backends.parse_turn_steps)
+      "pages": 320,                          or null - keep going until the end
+      "end_after": 3,                        stop after the same page this many times
+      "delay": 2.0,
+      "wait_mode": "adaptive",               or "fixed"
+      "pdf_path": "chemistry.pdf",           relative to folder, null for no PDF
+      "pdf_profile": "auto", "pdf_dpi": 200,
+      "page_store": false, "auto_crop": true,
+      "spread": false, "rtl": false,         two pages side by side, right page first
+      "scroll": false, "page_height": null,  a scrolling viewer, stitched and cut into pages
+                with "turner": {"method": "scroll", "clicks": -5} or a key like "down"
+      "open": ["viewer.exe", "chemistry.epub"],   run before the capture, optional
+      "countdown": 5                         seconds to wait before the first page
+    }
+
+Jobs run in order. A job's PDF is not built during its capture but right
+after it, in the background, while the next job is already capturing -
+so the screen never sits idle waiting for a PDF. The exit code is 1 if
+any job failed.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+from backends import create_grabber, turner_from_settings
+from capture_session import CaptureSession, WAIT_ADAPTIVE, WAIT_FIXED
+from page_encoding import COMPRESSION_PROFILES, PROFILE_LOSSLESS
+from page_stitch import MIN_PAGE_HEIGHT
+from page_store import PageStore, pack_path
+from pdf_builder import build_pdf
+from stage_timings import format_duration, STAGE_TURN, STAGE_WAIT
+
+END_OF_BOOK_REPEATS = 3  # Same default as the window
+PROGRESS_EVERY = 10  # Print a progress line every this many pages
+CAPTURING = "📸"  # The per-page status lines, left out of the log
+
+JOB_DEFAULTS = {"name": None, "pages": None, "end_after": None, "delay": 2.0,
+                "wait_mode": WAIT_ADAPTIVE, "pdf_path": None,
+                "pdf_profile": PROFILE_LOSSLESS, "pdf_dpi": None, "page_store": False,
+                "auto_crop": False, "spread": False, "rtl": False, "scroll": False,
+                "page_height": None, "open": None, "countdown": 5}
+
+
+def load_jobs(path):
+    """The jobs in a job file, with defaults filled in - ValueError if one doesn't make sense"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {"jobs": data}
+    if not isinstance(data, dict):
+        raise ValueError("the job file must hold a list of jobs or {\"defaults\": ..., \"jobs\": [...]}")
+    if not isinstance(data.get("defaults", {}), dict):
+        raise ValueError("defaults must be an object")
+    if not isinstance(data.get("jobs", []), list):
+        raise ValueError("jobs must be a list")
+    defaults = dict(JOB_DEFAULTS, **data.get("defaults", {}))
+    jobs = []
+    for number, job in enumerate(data.get("jobs", []), 1):
+        if not isinstance(job, dict):
+            raise ValueError(f"job {number}: a job must be an object")
+        job = dict(defaults, **job)
+        if not job["name"]:
+            job["name"] = f"job {number}"
+        try:
+            problem = _check_job(job)
+        except TypeError as e:
+            problem = f"a setting has the wrong type ({e})"  # Inside the turner settings, say
+        if problem:
+            raise ValueError(f"{job['name']}: {problem}")
+        if job["pages"] is None and not job["end_after"]:
+            job["end_after"] = END_OF_BOOK_REPEATS  # Nothing else would ever stop it
+        if job["pdf_path"]:
+            job["pdf_path"] = os.path.join(job["folder"], job["pdf_path"])
+            if not job["pdf_path"].endswith(".pdf"):
+                job["pdf_path"] += ".pdf"
+        jobs.append(job)
+    if not jobs:
+        raise ValueError("the job file has no jobs")
+    return jobs
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_count(value, least=1):
+    """A whole number, at least least"""
+    return isinstance(value, int) and not isinstance(value, bool) and value >= least
+
+
+def _is_position(value):
+    return isinstance(value, list) and len(value) == 2 and all(map(_is_number, value))
+
+
+def _check_turner(settings):
+    """What is missing from a turner's settings, or None if turner_from_settings can take them"""
+    if not isinstance(settings, dict):
+        return 'must be an object like {"method": "keyboard", "key": "right"}'
+    method = settings.get("method")
+    if method == "keyboard" and not (isinstance(settings.get("key"), str) and settings["key"]):
+        return "a keyboard turner needs a key"
+    if method == "mouse" and not _is_position(settings.get("position")):
+        return "a mouse turner needs a position [x, y]"
+    if method == "scroll" and not isinstance(settings.get("clicks", -5), int):
+        return "clicks must be a whole number"
+    if method == "scroll" and settings.get("position") is not None \
+            and not _is_position(settings["position"]):
+        return "position must be [x, y], or null for wherever the mouse is"
+    if method == "steps" and not isinstance(settings.get("steps") or [], (list, str)):
+        return "steps must be a list"
+    return None
+
+
+def _check_job(job):
+    if not job.get("folder") or not isinstance(job["folder"], str):
+        return "no folder"
+    region = job.get("region")
+    if not isinstance(region, list) or len(region) != 4 or not all(map(_is_number, region)) \
+            or region[2] <= 0 or region[3] <= 0:
+        return "region must be [left, top, width, height]"
+    problem = _check_turner(job.get("turner"))
+    if problem:
+        return f"turner: {problem}"
+    turner = turner_from_settings(job["turner"])
+    if turner is None:
+        return ('turner must be {"method": "keyboard", "key": ...}, '
+                '{"method": "mouse", "position": [x, y]}, {"method": "scroll", "clicks": -5} '
+                'or {"method": "steps", "steps": [...]} with valid steps')
+    turner.close()
+    if job["pages"] is not None and not _is_count(job["pages"]):
+        return "pages must be a whole number above 0, or null for the whole book"
+    if job["end_after"] is not None and not _is_count(job["end_after"]):
+        return "end_after must be a whole number above 0, or null"
+    if job["page_height"] is not None and not _is_count(job["page_height"], MIN_PAGE_HEIGHT):
+        return f"page_height must be a whole number of at least {MIN_PAGE_HEIGHT}, or null"
+    if job["pdf_dpi"] is not None and not (_is_number(job["pdf_dpi"]) and job["pdf_dpi"] > 0):
+        return "pdf_dpi must be a number above 0, or null"
+    if not _is_number(job["delay"]) or job["delay"] < 0:
+        return "delay must be a number of seconds, not negative"
+    if not _is_number(job["countdown"]) or job["countdown"] < 0:
+        return "countdown must be a number of seconds, not negative"
+    if job["wait_mode"] not in (WAIT_ADAPTIVE, WAIT_FIXED):
+        return f"wait_mode must be {WAIT_ADAPTIVE} or {WAIT_FIXED}"
+    if not isinstance(job["pdf_profile"], str) or job["pdf_profile"] not in COMPRESSION_PROFILES:
+        return f"pdf_profile must be one of {', '.join(COMPRESSION_PROFILES)}"
+    return None
+
+
+def screen_backends(job):
+    """The real screen and page turner for a job"""
+    return create_grabber(), turner_from_settings(job["turner"])
+
+
+class PdfAssembler:
+    """Builds the PDFs of finished captures one at a time, on a background thread
+
+    add() returns at once, so the next capture can start while the PDF of
+    the last one is still being put together. build_pdf encodes in worker
+    processes - fewer than usual, so the running capture keeps some cores.
+    """
+
+    def __init__(self, workers=None, log=print):
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.log = log
+        self.failed = []  # Names of jobs whose PDF could not be built
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, job, pages):
+        """Queue the PDF of job, made of pages - the ones its capture saved"""
+        self._jobs.put((job, pages))
+
+    def _run(self):
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                return
+            job, pages = item
+            start = time.perf_counter()
+            try:
+                sink = build_pdf(pages, job["pdf_path"],
+                                 workers=self.workers, profile=job["pdf_profile"],
+                                 target_dpi=job["pdf_dpi"])
+            except Exception as e:
+                self.failed.append(job["name"])
+                self.log(f"[{job['name']}] PDF failed: {e}")
+                continue
+            self.log(f"[{job['name']}] PDF done: {os.path.basename(job['pdf_path'])}, "
+                     f"{sink.pages} pages, {sink.report.stored_bytes / (1024 * 1024):.1f} MB "
+                     f"in {format_duration(time.perf_counter() - start)}")
+
+    def close(self):
+        """Wait for the PDFs still being built"""
+        self._jobs.put(None)
+        self._thread.join()
+
+
+def run_job(job, make_backends=screen_backends, log=print):
+    """Capture one job (without its PDF), return the finished CaptureSession"""
+    name = job["name"]
+    os.makedirs(job["folder"], exist_ok=True)
+    if job["open"]:
+        subprocess.Popen(job["open"])
+
+    def on_progress(done, total):
+        if done % PROGRESS_EVERY and done != total:
+            return
+        rate = session.throughput.pages_per_minute
+        eta = session.eta()
+        line = f"[{name}] {done}" + (f"/{total}" if total else "") + " pages"
+        if rate:
+            line += f", {rate:.1f} pages/min"
+        if eta is not None:
+            line += f", ETA {format_duration(eta)}"
+        log(line)
+
+    def on_status(text):
+        if not text.startswith(CAPTURING):  # on_progress already says how far it is
+            log(f"[{name}] {text}")
+
+    grabber, turner = make_backends(job)
+    store = PageStore(pack_path(job["folder"])) if job["page_store"] else None
+    session = CaptureSession(grabber, turner, job["folder"], job["pages"], job["delay"],
+                             region=tuple(job["region"]), countdown=job["countdown"],
+                             wait_mode=job["wait_mode"], end_after=job["end_after"],
+                             pdf_profile=job["pdf_profile"], pdf_dpi=job["pdf_dpi"],
+                             page_store=store, auto_crop=job["auto_crop"],
+                             spread=job["spread"], rtl=job["rtl"],
+                             scroll=job["scroll"], page_height=job["page_height"],
+                             on_status=on_status,
+                             on_progress=on_progress)
+    session.run()
+    return session
+
+
+def run_jobs(jobs, make_backends=screen_backends, pdf_workers=None, log=print):
+    """Run all jobs in order, each PDF built while the next job captures
+
+    Returns the names of the jobs that failed.
+    """
+    assembler = PdfAssembler(pdf_workers, log=log)
+    failed = []
+    try:
+        for number, job in enumerate(jobs, 1):
+            log(f"[{job['name']}] Job {number} of {len(jobs)} -> {job['folder']}")
+            session = run_job(job, make_backends, log)
+            if session.error:
+                failed.append(job["name"])
+                log(f"[{job['name']}] Capture failed: {session.error}")
+            medians = session.timings.medians_text((STAGE_TURN, STAGE_WAIT))
+            log(f"[{job['name']}] Captured {len(session.screenshots)} pages"
+                + (f" (median {medians})" if medians else ""))
+            if job["pdf_path"] and session.screenshots:
+                # Only what this capture saved - not whatever else is in the folder
+                assembler.add(job, list(session.screenshots))
+    finally:
+        log("Waiting for the last PDFs...")
+        assembler.close()
+    return failed + [name for name in assembler.failed if name not in failed]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("job_file", help="JSON file with the list of books to capture")
+    parser.add_argument("--check", action="store_true", help="Only check the job file")
+    parser.add_argument("--pdf-workers", type=int, default=None,
+                        help="Processes for building PDFs (default: half the CPU cores)")
+    args = parser.parse_args(argv)
+    if hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(errors="replace")  # Status lines have emoji, consoles may not
+
+    try:
+        jobs = load_jobs(args.job_file)
+    except (OSError, ValueError) as e:
+        print(f"Bad job file: {e}", file=sys.stderr)
+        return 2
+    if args.check:
+        for job in jobs:
+            print(f"{job['name']}: {job['pages'] or 'whole book'} pages -> {job['folder']}")
+        return 0
+
+    failed = run_jobs(jobs, pdf_workers=args.pdf_workers)
+    if failed:
+        print(f"Failed: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    print(f"All {len(jobs)} jobs done")
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Needed for the PDF worker processes in the .exe
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""How many screenshots per second each grab backend manages.
+
+Needs an X display - on a headless machine run it under Xvfb:
+
+    xvfb-run -s "-screen 0 1920x1080x24" python benchmarks/bench_grab.py
+
+Optional arguments: number of grabs, then the region as x y width height.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import PyAutoGuiGrabber  # noqa: E402
+from x11_backends import XShmGrabber  # noqa: E402
+
+
+def bench(name, grab, region, count):
+    grab(region)  # The first grab sets things up (shared memory, connection...)
+    start = time.perf_counter()
+    for _ in range(count):
+        grab(region)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {count / elapsed:8.1f} grabs/s  {1000 * elapsed / count:7.2f} ms/grab")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    region = tuple(int(v) for v in sys.argv[2:6]) if len(sys.argv) >= 6 else None
+
+    shm = XShmGrabber()
+    if region is None:
+        region = (0, 0, shm.display.width, shm.display.height)
+    print(f"Region {region}, {count} grabs, MIT-SHM {'on' if shm.use_shm else 'off'}")
+    bench("XShmGrabber.grab (PIL)", shm.grab, region, count)
+    bench("XShmGrabber.grab_array", shm.grab_array, region, count)
+    shm.close()
+
+    try:
+        bench("PyAutoGuiGrabber.grab", PyAutoGuiGrabber().grab, region, max(1, count // 5))
+    except Exception as e:
+        print(f"PyAutoGuiGrabber not available: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Benchmark of the whole capture -> encode -> PDF pipeline, no screen needed.
+
+A synthetic book (text, greyscale and photo pages) is served by a fake
+screen that needs render_latency seconds to show each new page after a
+"key press", and captured with the real CaptureSession. Afterwards the PDF
+is built once more from the saved pages, like "Create PDF from Images".
+
+With --scroll the pages are stacked into one tall document instead, seen
+through a window two thirds of a page high that scrolls a third of a page
+per step, and captured in scroll mode (frames stitched and cut into pages).
+
+Each page size runs in its own process so peak memory is measured per run.
+Reported per size: pages/sec of the capture, peak RSS, bytes of pages and
+PDF, PDF build time, and the per-stage timings.
+
+    python benchmarks/bench_pipeline.py --pages 24 --sizes 1024x1280,1600x2000
+    python benchmarks/bench_pipeline.py --save baseline.json
+    python benchmarks/bench_pipeline.py --baseline baseline.json --tolerance 0.15
+
+With --baseline it works as a regression gate: the exit code is 1 if any
+number got worse than the baseline by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backends import MemoryBook, MemoryDocument  # noqa: E402
+from capture_session import CaptureSession, WAIT_ADAPTIVE, WAIT_FIXED  # noqa: E402
+from page_encoding import COMPRESSION_PROFILES, PROFILE_AUTO  # noqa: E402
+from page_store import PageStore, pack_path  # noqa: E402
+from pdf_builder import build_pdf, find_pages  # noqa: E402
+from synthetic_book import synthetic_book  # noqa: E402
+
+# Numbers checked by the regression gate, and whether bigger is better
+GATED = {"pages_per_s": True, "pdf_build_s": False, "peak_rss_mb": False, "pdf_bytes": False}
+
+
+def peak_rss_mb():
+    """Highest resident memory of this process (and its finished children) so far"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t),
+                        ("WorkingSetSize", ctypes.c_size_t)] + \
+                       [(name, ctypes.c_size_t) for name in
+                        ("QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                         "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage",
+                         "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                 ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / (1024 * 1024)
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def folder_bytes(folder, skip=()):
+    return sum(entry.stat().st_size for entry in os.scandir(folder)
+               if entry.is_file() and entry.name not in skip)
+
+
+def run_one(config):
+    """Capture one synthetic book with the given settings, return the numbers"""
+    width, height = config["size"]
+    book = synthetic_book(config["pages"], (width, height))
+    book_mb = config["pages"] * width * height * 3 / (1024 * 1024)
+    scroll = config.get("scroll", False)
+    if scroll:
+        document = Image.new("RGB", (width, height * len(book)), "white")
+        for number, page in enumerate(book):
+            document.paste(page, (0, height * number))
+        book = None
+        screen = MemoryDocument(document, height * 2 // 3, height // 3,
+                                render_latency=config["latency"])
+    else:
+        screen = MemoryBook(book, render_latency=config["latency"])
+
+    folder = tempfile.mkdtemp(prefix="bench_pipeline_")
+    try:
+        pdf_path = os.path.join(folder, "book.pdf")
+        store = PageStore(pack_path(folder)) if config["pack"] else None
+        session = CaptureSession(screen, screen, folder, None if scroll else config["pages"],
+                                 config["delay"], countdown=0, wait_mode=config["wait"],
+                                 scroll=scroll, page_height=height if scroll else None,
+                                 end_after=3 if scroll else None,
+                                 pdf_path=pdf_path, pdf_profile=config["profile"],
+                                 pdf_dpi=config["dpi"], page_store=store,
+                                 journal=config["journal"], export_timings=False)
+        start = time.perf_counter()
+        session.run()
+        capture_s = time.perf_counter() - start
+        if session.error:
+            raise session.error
+
+        rebuilt_path = os.path.join(folder, "rebuilt.pdf")
+        start = time.perf_counter()
+        build_pdf(find_pages(folder), rebuilt_path, profile=config["profile"],
+                  target_dpi=config["dpi"])
+        pdf_build_s = time.perf_counter() - start
+
+        return {"size": f"{width}x{height}",
+                "pages": len(session.screenshots),
+                "capture_s": round(capture_s, 3),
+                "pages_per_s": round(len(session.screenshots) / capture_s, 3),
+                "pdf_build_s": round(pdf_build_s, 3),
+                "pdf_bytes": os.path.getsize(pdf_path),
+                "page_bytes": folder_bytes(folder, skip=("book.pdf", "rebuilt.pdf")),
+                "peak_rss_mb": round(peak_rss_mb(), 1),
+                "book_mb": round(book_mb, 1),  # Part of peak RSS - the fake screen's pages
+                "stages": session.timings.summary()}
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run_isolated(config):
+    """run_one() in a fresh process, so its peak memory is its own"""
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one",
+                             json.dumps(config)], capture_output=True, text=True)
+    if output.returncode:
+        raise RuntimeError(f"Benchmark run failed:\n{output.stderr}")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def print_result(result):
+    print(f"{result['size']:>10}  {result['pages']:4d} pages  "
+          f"{result['pages_per_s']:7.2f} pages/s  PDF build {result['pdf_build_s']:6.2f} s  "
+          f"peak RSS {result['peak_rss_mb']:7.1f} MB (book {result['book_mb']:.0f} MB)  "
+          f"pages {result['page_bytes'] / 1e6:6.1f} MB  PDF {result['pdf_bytes'] / 1e6:6.1f} MB")
+    for stage in result["stages"]:
+        if stage["count"]:
+            print(f"{'':12}{stage['stage']:<11} mean {stage['mean_ms']:8.2f} ms  "
+                  f"p90 {stage['p90_ms']:8.2f} ms  total {stage['total_s']:7.2f} s")
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a baseline, as human readable lines"""
+    previous = {result["size"]: result for result in baseline}
+    problems = []
+    for result in results:
+        before = previous.get(result["size"])
+        if before is None:
+            continue
+        for key, bigger_is_better in GATED.items():
+            old, new = before[key], result[key]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (-change if bigger_is_better else change) > tolerance:
+                problems.append(f"{result['size']}: {key} {old} -> {new} ({change:+.0%})")
+    return problems
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=24)
+    parser.add_argument("--sizes", default="1024x1280,1600x2000",
+                        help="Comma separated page sizes, e.g. 1024x1280,1600x2000")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Seconds the fake viewer takes to show a new page")
+    parser.add_argument("--delay", type=float, default=1.0,
+                        help="Delay after each page turn (longest wait with adaptive)")
+    parser.add_argument("--wait", choices=(WAIT_ADAPTIVE, WAIT_FIXED), default=WAIT_ADAPTIVE)
+    parser.add_argument("--profile", choices=COMPRESSION_PROFILES, default=PROFILE_AUTO)
+    parser.add_argument("--dpi", type=int, default=None)
+    parser.add_argument("--pack", action="store_true", help="Save pages into one pack file")
+    parser.add_argument("--no-journal", action="store_true")
+    parser.add_argument("--scroll", action="store_true",
+                        help="One tall scrolling document instead of pages (scroll capture)")
+    parser.add_argument("--save", help="Write the results as JSON, e.g. to use as a baseline")
+    parser.add_argument("--baseline", help="Results JSON to compare against (regression gate)")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Allowed relative change before it counts as a regression")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_one(json.loads(args.run_one))))
+        return 0
+
+    results = []
+    for size in args.sizes.split(","):
+        config = {"size": parse_size(size), "pages": args.pages, "latency": args.latency,
+                  "delay": args.delay, "wait": args.wait, "profile": args.profile,
+                  "dpi": args.dpi, "pack": args.pack, "journal": not args.no_journal,
+                  "scroll": args.scroll}
+        result = run_isolated(config)
+        print_result(result)
+        results.append(result)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            return 1
+        print("No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
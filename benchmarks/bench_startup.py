@@ -0,0 +1,87 @@
+"""Time to first window of the GUI - with lazy imports, and with everything imported up front.
+
+Every run is a fresh Python process (nothing cached in sys.modules), so
+this is what starting the program costs. Reported per mode, as medians:
+
+    import  - importing book_screenshot (plus, for eager, the slow modules)
+    window  - until the main window is on screen, counted from the start
+              of the process's own code
+    wall    - from starting the process to the window, interpreter start-up
+              included - what the user actually waits for
+
+"eager" imports the warm-up modules (see warm_up) before creating the
+window, like the program did when everything was imported at the top.
+Needs a display for the window times - on a headless machine run it under
+Xvfb (without one only the import times are measured):
+
+    xvfb-run -s "-screen 0 1920x1080x24" python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_one(eager):
+    """Runs in the child process - prints import and first window times as JSON"""
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import book_screenshot
+    if eager:
+        from warm_up import import_modules
+        import_modules()
+    result = {"import_s": time.perf_counter() - start, "window_s": None}
+    try:
+        root = book_screenshot.tk.Tk()
+    except book_screenshot.tk.TclError:
+        print(json.dumps(result))  # No display
+        return
+    book_screenshot.ModernBookScreenshotTool(root, preload=False)
+    while not root.winfo_viewable():
+        root.update()
+    result["window_s"] = time.perf_counter() - start
+    root.destroy()
+    print(json.dumps(result))
+
+
+def run_isolated(eager):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one",
+                             "eager" if eager else "lazy"], capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if output.returncode:
+        raise RuntimeError(f"Benchmark run failed:\n{output.stderr}")
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result["wall_s"] = wall if result["window_s"] is not None else None
+    return result
+
+
+def median_ms(results, key):
+    values = [result[key] for result in results if result[key] is not None]
+    return f"{1000 * statistics.median(values):8.1f} ms" if values else "       - ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--run-one", choices=("lazy", "eager"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(args.run_one == "eager")
+        return 0
+
+    for mode in ("lazy", "eager"):
+        results = [run_isolated(mode == "eager") for _ in range(args.runs)]
+        print(f"{mode:<6} import {median_ms(results, 'import_s')}  "
+              f"window {median_ms(results, 'window_s')}  wall {median_ms(results, 'wall_s')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
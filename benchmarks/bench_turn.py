@@ -0,0 +1,77 @@
+"""How long a page turn takes with each page turner.
+
+Needs an X display - on a headless machine run it under Xvfb:
+
+    xvfb-run -s "-screen 0 1920x1080x24" python benchmarks/bench_turn.py
+
+Optional arguments: number of turns, then the turn steps, e.g.
+    python benchmarks/bench_turn.py 200 "ctrl+right, wait 0.01"
+
+Every turner also moves the mouse to a new spot on each turn, and the
+pointer is checked afterwards - so a turner that returns before its events
+have arrived shows up as "not delivered".
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import StepTurner  # noqa: E402
+from stage_timings import StageHistogram  # noqa: E402
+from x11_backends import X11Display, XTestTurner  # noqa: E402
+
+
+class PausingTurner(StepTurner):
+    """StepTurner the way pyautogui is normally used - with PAUSE after every call"""
+
+    def turn(self):
+        import pyautogui
+        for step in self.steps:
+            if step[0] == "key":
+                pyautogui.hotkey(*step[1])
+            elif step[0] == "click":
+                pyautogui.click(step[1], step[2], button=step[3])
+            elif step[0] == "move":
+                pyautogui.moveTo(step[1], step[2])
+            elif step[0] == "scroll":
+                x, y = step[2] or (None, None)
+                pyautogui.scroll(step[1], x=x, y=y)
+            else:
+                time.sleep(step[1])
+
+
+def bench(name, make_turner, steps, count, display):
+    # Two turners that leave the pointer in different spots, used in turn
+    targets = [(10, 20), (11, 20)]
+    turners = [make_turner(f"{steps}, move {x} {y}") for x, y in targets]
+    histogram = StageHistogram(name)
+    delivered = 0
+    for turn in range(count):
+        start = time.perf_counter()
+        turners[turn % 2].turn()
+        histogram.add(time.perf_counter() - start)
+        delivered += display.pointer() == targets[turn % 2]
+    for turner in turners:
+        turner.close()
+    summary = histogram.summary()
+    print(f"{name:<24} mean {summary['mean_ms']:8.3f} ms  p50 {summary['p50_ms']:8.3f} ms  "
+          f"p99 {summary['p99_ms']:8.3f} ms  delivered {delivered}/{count}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    steps = sys.argv[2] if len(sys.argv) > 2 else "right"
+    display = X11Display()
+    print(f"{count} turns of {steps!r} on a {display.width}x{display.height} screen")
+    bench("XTestTurner", lambda s: XTestTurner(s, display), steps, count, display)
+    try:
+        bench("StepTurner (pyautogui)", StepTurner, steps, count, display)
+        bench("pyautogui with PAUSE", PausingTurner, steps, max(1, count // 5), display)
+    except Exception as e:
+        print(f"pyautogui not available: {e}")
+    display.close()
+
+
+if __name__ == "__main__":
+    main()
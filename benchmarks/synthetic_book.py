@@ -0,0 +1,69 @@
+"""A made-up book to benchmark the capture pipeline with, no e-book viewer needed.
+
+Pages cycle through the three kinds a real book has:
+    text  - black lines of text on white (most pages)
+    gray  - a greyscale diagram or scanned-looking page
+    photo - a full colour picture, with detail everywhere
+Every page is different, so nothing gets deduplicated by accident, and the
+same seed always gives the same book.
+"""
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+PAGE_KINDS = ("text", "text", "text", "gray", "text", "photo")  # Mostly text, like a book
+WORDS = ("the", "capture", "page", "book", "screen", "viewer", "chapter", "light", "of",
+         "and", "a", "reading", "margin", "paper", "story", "line", "quietly", "river")
+
+
+def _text_page(size, number, rng):
+    width, height = size
+    page = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(page)
+    margin = width // 10
+    line_height = max(12, height // 45)
+    draw.text((margin, line_height), f"Chapter {number // 20 + 1}", fill="black")
+    y = line_height * 3
+    while y < height - line_height * 2:
+        words = []
+        while len(" ".join(words)) * 6 < width - 2 * margin:
+            words.append(rng.choice(WORDS))
+        draw.text((margin, y), " ".join(words[:-1]), fill="black")
+        y += line_height
+    draw.text((width // 2, height - line_height), str(number + 1), fill="black")
+    return page
+
+
+def _gray_page(size, number, rng):
+    width, height = size
+    ramp = np.linspace(40, 230, width, dtype=np.float32)[None, :]
+    noise = np.random.default_rng(number).normal(0, 12, (height, width))
+    pixels = np.clip(ramp + noise, 0, 255).astype(np.uint8)
+    page = Image.fromarray(pixels, "L")
+    draw = ImageDraw.Draw(page)
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.ellipse((x, y, x + width // 8, y + width // 8), outline=0, width=3)
+    return page.convert("RGB")
+
+
+def _photo_page(size, number, rng):
+    width, height = size
+    # Blurred colour noise looks enough like a photo to defeat Flate and favour JPEG
+    small = np.random.default_rng(number).integers(0, 256, (height // 16 + 1, width // 16 + 1, 3),
+                                                   dtype=np.uint8)
+    page = Image.fromarray(small, "RGB").resize(size, Image.BICUBIC)
+    grain = np.random.default_rng(number + 1).integers(-10, 11, (height, width, 3))
+    pixels = np.clip(np.asarray(page, dtype=np.int16) + grain, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels, "RGB").filter(ImageFilter.SMOOTH)
+
+
+PAGE_MAKERS = {"text": _text_page, "gray": _gray_page, "photo": _photo_page}
+
+
+def synthetic_book(pages, size=(1280, 1600), kinds=PAGE_KINDS, seed=1):
+    """List of pages PIL images of the given size, cycling through kinds"""
+    rng = random.Random(seed)
+    return [PAGE_MAKERS[kinds[number % len(kinds)]](size, number, rng)
+            for number in range(pages)]
@@ -1,15 +1,24 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
-import pyautogui
-import time
 import os
 import subprocess
 import platform
-from PIL import Image, ImageTk
 import threading
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-import glob
+import multiprocessing
+# Only modules that are quick to import up here, so the window shows up
+# straight away. NumPy, Pillow, reportlab and pyautogui are imported where
+# they're first used - and warmed up in the background (see warm_up).
+from backends import create_grabber, create_turner, turner_from_settings, ScrollTurner
+from capture_settings import COMPRESSION_PROFILES, PROFILE_LOSSLESS, WAIT_ADAPTIVE, WAIT_FIXED
+from pdf_writer import pdf_page_count
+from stage_timings import format_duration, STAGE_TURN, STAGE_WAIT
+from ui_events import UiEventPump
+from warm_up import warm_up
+
+END_OF_BOOK_REPEATS = 3  # Same picture this many times in a row = last page
+UI_REFRESH_RATE = 10  # Most progress/status redraws per second during a capture
+RECAPTURE_DELAY_MS = 500  # Time for the windows to get out of the way before a page is grabbed again
+DELETED_FOLDER = "deleted"  # Where pages deleted in the review go, in the save folder
 
 class RegionSelector:
     """Handles selecting what part of the screen to capture"""
@@ -86,7 +95,7 @@ class RegionSelector:
         self.callback(None)
 
 class ModernBookScreenshotTool:
-    def __init__(self, root):
+    def __init__(self, root, preload=True):
         self.root = root
         self.root.title("📖 Book Screenshot Tool")
         self.root.geometry("850x830")
@@ -101,8 +110,14 @@ class ModernBookScreenshotTool:
         self.region = None  # The area of screen to capture
         self.screenshots = []  # List of screenshot file paths
         self.click_position = None  # Where to click for page turning
+        self.session = None  # The CaptureSession that is currently running
+        self.review = None  # The ReviewWindow, while it is open
         self.countdown = 10
         
+        # Worker threads never touch Tk - they post here, and the window
+        # picks the updates up at most UI_REFRESH_RATE times per second
+        self.events = UiEventPump(self.root, max_rate=UI_REFRESH_RATE)
+        
         # Define all the colors used in the interface
         self.colors = {
             'bg': '#f8f9fa',
@@ -118,9 +133,11 @@ class ModernBookScreenshotTool:
             'border': '#e5e7eb'
         }
         
-        # Safety feature - move mouse to corner to stop the program
-        pyautogui.FAILSAFE = True
         self.create_ui()
+        
+        # Import what a capture needs while the user is still setting it up
+        if preload:
+            self.root.after_idle(warm_up)
     
     def create_ui(self):
         # Create the top header with title
@@ -232,7 +249,7 @@ class ModernBookScreenshotTool:
         pages_frame = tk.Frame(inputs_frame, bg=self.colors['surface'])
         pages_frame.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
         
-        tk.Label(pages_frame, text="Pages:", font=('Segoe UI', 9, 'bold'),
+        tk.Label(pages_frame, text="Pages (0 = until end):", font=('Segoe UI', 9, 'bold'),
                 bg=self.colors['surface'], fg=self.colors['text']).pack(anchor=tk.W, pady=(0, 2))
         
         self.pages_var = tk.StringVar(value="10")
@@ -254,6 +271,56 @@ class ModernBookScreenshotTool:
                               relief='solid', bd=1, width=8)
         delay_entry.pack(anchor=tk.W)
         
+        # Checkbox to go on as soon as the new page has finished drawing
+        self.adaptive_wait_var = tk.BooleanVar(value=False)
+        adaptive_check = tk.Checkbutton(settings_frame, text="Adaptive wait (delay = max wait)",
+                                       variable=self.adaptive_wait_var,
+                                       font=('Segoe UI', 9),
+                                       bg=self.colors['surface'], fg=self.colors['text'])
+        adaptive_check.pack(anchor=tk.W, pady=(0, 5))
+        
+        # Checkbox to skip pages that didn't turn and stop when the book ends
+        self.detect_end_var = tk.BooleanVar(value=False)
+        detect_end_check = tk.Checkbutton(settings_frame, text="Stop at end of book (retry repeated pages)",
+                                         variable=self.detect_end_var,
+                                         font=('Segoe UI', 9),
+                                         bg=self.colors['surface'], fg=self.colors['text'])
+        detect_end_check.pack(anchor=tk.W, pady=(0, 5))
+        
+        # Checkbox to keep all pages in one file instead of one PNG per page
+        self.pack_pages_var = tk.BooleanVar(value=False)
+        pack_check = tk.Checkbutton(settings_frame, text="Save pages into one file (pages.pack)",
+                                   variable=self.pack_pages_var,
+                                   font=('Segoe UI', 9),
+                                   bg=self.colors['surface'], fg=self.colors['text'])
+        pack_check.pack(anchor=tk.W, pady=(0, 5))
+        
+        # Checkbox to cut the viewer's toolbars and the empty margins off every page
+        self.auto_crop_var = tk.BooleanVar(value=False)
+        crop_check = tk.Checkbutton(settings_frame, text="Trim toolbars and margins (auto-crop)",
+                                   variable=self.auto_crop_var,
+                                   font=('Segoe UI', 9),
+                                   bg=self.colors['surface'], fg=self.colors['text'])
+        crop_check.pack(anchor=tk.W, pady=(0, 5))
+        
+        # Two pages side by side: one grab and one page turn for both
+        spread_frame = tk.Frame(settings_frame, bg=self.colors['surface'])
+        spread_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        self.spread_var = tk.BooleanVar(value=False)
+        spread_check = tk.Checkbutton(spread_frame, text="Two-page spreads (split at the middle)",
+                                     variable=self.spread_var,
+                                     font=('Segoe UI', 9),
+                                     bg=self.colors['surface'], fg=self.colors['text'])
+        spread_check.pack(side=tk.LEFT)
+        
+        self.rtl_var = tk.BooleanVar(value=False)
+        rtl_check = tk.Checkbutton(spread_frame, text="Right-to-left book",
+                                  variable=self.rtl_var,
+                                  font=('Segoe UI', 9),
+                                  bg=self.colors['surface'], fg=self.colors['text'])
+        rtl_check.pack(side=tk.LEFT, padx=(10, 0))
+        
         # PDF creation options
         pdf_frame = tk.Frame(settings_frame, bg=self.colors['surface'])
         pdf_frame.pack(fill=tk.X)
@@ -272,6 +339,29 @@ class ModernBookScreenshotTool:
                             font=('Segoe UI', 9), bg=self.colors['surface'],
                             relief='solid', bd=1)
         pdf_entry.pack(fill=tk.X)
+        
+        # How to compress the pages inside the PDF
+        compression_frame = tk.Frame(pdf_frame, bg=self.colors['surface'])
+        compression_frame.pack(fill=tk.X, pady=(10, 0))
+        
+        tk.Label(compression_frame, text="Compression:", font=('Segoe UI', 9),
+                bg=self.colors['surface'], fg=self.colors['text']).pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.compression_var = tk.StringVar(value=PROFILE_LOSSLESS)
+        compression_combo = ttk.Combobox(compression_frame, textvariable=self.compression_var,
+                                        values=list(COMPRESSION_PROFILES),
+                                        font=('Segoe UI', 9), width=12, state='readonly')
+        compression_combo.pack(side=tk.LEFT)
+        
+        # Scale pages down to a print resolution - "Full" keeps every pixel
+        tk.Label(compression_frame, text="DPI:", font=('Segoe UI', 9),
+                bg=self.colors['surface'], fg=self.colors['text']).pack(side=tk.LEFT, padx=(15, 10))
+        
+        self.dpi_var = tk.StringVar(value="Full")
+        dpi_combo = ttk.Combobox(compression_frame, textvariable=self.dpi_var,
+                                values=['Full', '300', '200', '150'],
+                                font=('Segoe UI', 9), width=6, state='readonly')
+        dpi_combo.pack(side=tk.LEFT)
     
     def create_method_section(self, parent):
         """Creates the page turning method card"""
@@ -294,7 +384,14 @@ class ModernBookScreenshotTool:
                                     variable=self.method_var, value="mouse",
                                     font=('Segoe UI', 9, 'bold'),
                                     bg=self.colors['surface'], fg=self.colors['text'])
-        mouse_radio.pack(anchor=tk.W)
+        mouse_radio.pack(anchor=tk.W, pady=(0, 5))
+        
+        # For viewers that only scroll - frames are stitched together and cut into pages
+        scroll_radio = tk.Radiobutton(method_frame, text="Mouse Wheel Scroll (no pages)",
+                                     variable=self.method_var, value="scroll",
+                                     font=('Segoe UI', 9, 'bold'),
+                                     bg=self.colors['surface'], fg=self.colors['text'])
+        scroll_radio.pack(anchor=tk.W)
         
         # Options for each method
         options_frame = tk.Frame(content, bg=self.colors['surface'])
@@ -304,15 +401,28 @@ class ModernBookScreenshotTool:
         key_frame = tk.Frame(options_frame, bg=self.colors['surface'])
         key_frame.pack(fill=tk.X, pady=(0, 10))
         
-        tk.Label(key_frame, text="Key:", font=('Segoe UI', 9),
+        tk.Label(key_frame, text="Keys:", font=('Segoe UI', 9),
                 bg=self.colors['surface'], fg=self.colors['text']).pack(side=tk.LEFT, padx=(0, 10))
         
+        # Editable - a key combination or several steps can be typed in,
+        # like "ctrl+right" or "right, wait 0.05, right" (see parse_turn_steps)
         self.key_var = tk.StringVar(value="right")
         key_combo = ttk.Combobox(key_frame, textvariable=self.key_var,
-                                values=['right', 'left', 'space', 'pagedown', 'pageup', 'enter'],
-                                font=('Segoe UI', 9), width=12, state='readonly')
+                                values=['right', 'left', 'space', 'pagedown', 'pageup', 'enter',
+                                        'ctrl+right', 'right, right'],
+                                font=('Segoe UI', 9), width=16)
         key_combo.pack(side=tk.LEFT)
         
+        # How far one scroll step goes, in mouse wheel clicks
+        tk.Label(key_frame, text="Scroll:", font=('Segoe UI', 9),
+                bg=self.colors['surface'], fg=self.colors['text']).pack(side=tk.LEFT, padx=(15, 10))
+        
+        self.scroll_var = tk.StringVar(value="5")
+        scroll_combo = ttk.Combobox(key_frame, textvariable=self.scroll_var,
+                                   values=['2', '3', '5', '10', '15'],
+                                   font=('Segoe UI', 9), width=5, state='readonly')
+        scroll_combo.pack(side=tk.LEFT)
+        
         # Button to set where to click for mouse method
         self.click_var = tk.StringVar(value="Click to set position...")
         click_btn = tk.Button(options_frame, textvariable=self.click_var,
@@ -363,12 +473,21 @@ class ModernBookScreenshotTool:
         self.progress = ttk.Progressbar(progress_frame, length=200, mode='determinate')
         self.progress.pack(fill=tk.X, pady=(0, 5))
         
-        # Text showing progress numbers
+        # Text showing progress numbers, with the pace and time left next to it
+        progress_text_frame = tk.Frame(progress_frame, bg=self.colors['surface'])
+        progress_text_frame.pack(fill=tk.X)
+        
         self.progress_text_var = tk.StringVar(value="0 / 0 pages")
-        progress_label = tk.Label(progress_frame, textvariable=self.progress_text_var,
+        progress_label = tk.Label(progress_text_frame, textvariable=self.progress_text_var,
                                  font=('Segoe UI', 8), bg=self.colors['surface'],
                                  fg=self.colors['text_muted'])
-        progress_label.pack(anchor=tk.W)
+        progress_label.pack(side=tk.LEFT)
+        
+        self.rate_var = tk.StringVar(value="")
+        rate_label = tk.Label(progress_text_frame, textvariable=self.rate_var,
+                             font=('Segoe UI', 8), bg=self.colors['surface'],
+                             fg=self.colors['text_muted'])
+        rate_label.pack(side=tk.RIGHT)
         
         # Button to create PDF from images that already exist
         pdf_btn = tk.Button(content, text="📄 Create PDF from Images",
@@ -377,12 +496,31 @@ class ModernBookScreenshotTool:
                            padx=20, pady=10, cursor='hand2',
                            command=self.create_pdf_from_existing)
         pdf_btn.pack(fill=tk.X)
+        
+        # Button to carry on with a capture that crashed or was stopped
+        resume_btn = tk.Button(content, text="⏯️ Resume Session",
+                              font=('Segoe UI', 9), bg=self.colors['surface'],
+                              fg=self.colors['primary'], relief='solid', bd=1,
+                              padx=20, pady=10, cursor='hand2',
+                              command=self.resume_session)
+        resume_btn.pack(fill=tk.X, pady=(10, 0))
+        
+        # Button to look through the pages, and fix bad ones before the PDF is built
+        review_btn = tk.Button(content, text="🖼️ Review Pages",
+                              font=('Segoe UI', 9), bg=self.colors['surface'],
+                              fg=self.colors['primary'], relief='solid', bd=1,
+                              padx=20, pady=10, cursor='hand2',
+                              command=self.open_review)
+        review_btn.pack(fill=tk.X, pady=(10, 0))
     
     def browse_folder(self):
         """Opens a dialog to let user pick where to save files"""
         folder = filedialog.askdirectory()
         if folder:
             self.save_folder = folder
+            self.screenshots = []  # Pages of another folder
+            if self.review:
+                self.review.close()
             # Show just the folder name, not the full path
             display_path = os.path.basename(folder) if folder else "..."
             self.folder_var.set(f"📁 {display_path}")
@@ -408,12 +546,20 @@ class ModernBookScreenshotTool:
         result = messagebox.askokcancel("Set Click Position", 
                                        "Position your mouse on the 'Next Page' button and click OK")
         if result:
-            time.sleep(2)  # Give user time to position their mouse
-            x, y = pyautogui.position()  # Get current mouse position
-            self.click_position = (x, y)
-            self.click_var.set(f"✅ Position: {x}, {y}")
+            # Give user time to position their mouse - without freezing the window
+            self.click_var.set("⏳ Reading position in 2 seconds...")
+            self.root.after(2000, self.read_click_position)
         else:
             self.click_var.set("❌ Position not set")
+            # Show the main window again
+            self.root.deiconify()
+    
+    def read_click_position(self):
+        """Second half of set_click_position, once the user had time to move the mouse"""
+        import pyautogui
+        x, y = pyautogui.position()  # Get current mouse position
+        self.click_position = (x, y)
+        self.click_var.set(f"✅ Position: {x}, {y}")
         # Show the main window again
         self.root.deiconify()
     
@@ -436,75 +582,191 @@ class ModernBookScreenshotTool:
         try:
             pages = int(self.pages_var.get())
             delay = float(self.delay_var.get())
-            if pages <= 0 or delay < 0:
+            if pages < 0 or delay < 0:
                 raise ValueError()
         except ValueError:
             messagebox.showerror("Error", "Please enter valid numbers")
             return
         
-        # Change the UI to show we're running
+        # 0 pages means keep going until the end of the book is detected
+        if pages == 0:
+            pages = None
+        end_after = END_OF_BOOK_REPEATS if pages is None or self.detect_end_var.get() else None
+        
+        from capture_session import CaptureSession
+        from page_store import PageStore, pack_path
+        
+        # Typed in key names and steps are checked before anything starts
+        try:
+            turner = self.create_page_turner()
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        
+        # The PDF is built page by page during the capture if user wants it
+        pdf_path = self.get_pdf_path() if self.create_pdf_var.get() else None
+        page_store = PageStore(pack_path(self.save_folder)) if self.pack_pages_var.get() else None
+        
+        # The capture engine does the actual work in a separate thread so UI doesn't freeze
+        self.run_session(CaptureSession(
+            create_grabber(), turner,
+            self.save_folder, pages, delay, region=self.region,
+            wait_mode=WAIT_ADAPTIVE if self.adaptive_wait_var.get() else WAIT_FIXED,
+            end_after=end_after, pdf_path=pdf_path, pdf_profile=self.compression_var.get(),
+            pdf_dpi=self.get_pdf_dpi(), page_store=page_store,
+            auto_crop=self.auto_crop_var.get(),
+            spread=self.spread_var.get(), rtl=self.rtl_var.get(),
+            scroll=self.method_var.get() == "scroll",
+            on_status=self.post_status,
+            on_progress=self.post_progress,
+            on_finished=self.post_finished))
+    
+    def resume_session(self):
+        """Carry on with the capture saved in the folder's session journal"""
+        if not self.save_folder:
+            messagebox.showerror("Error", "Please select the folder of the capture to resume")
+            return
+        
+        from capture_session import CaptureSession
+        from page_store import PageStore, pack_path
+        from session_journal import load_session
+        
+        saved = load_session(self.save_folder)
+        if saved is None:
+            messagebox.showerror("Error", "There is no capture session to resume in this folder")
+            return
+        if saved.finished and saved.finished.get("reached_end"):
+            messagebox.showinfo("Resume Session", "This capture already reached the end of the book.")
+            return
+        
+        settings = saved.settings
+        turner = turner_from_settings(settings.get("turner", {}))
+        if turner is None or not settings.get("region"):
+            messagebox.showerror("Error", "The session journal is missing the capture settings")
+            return
+        
+        done = len(saved.pages)
+        if not messagebox.askyesno("Resume Session",
+                                   f"{done} pages are already saved.\n\n"
+                                   f"Open the book at page {done + 1} and click Yes - "
+                                   f"the capture carries on after the countdown."):
+            return
+        
+        page_store = PageStore(pack_path(self.save_folder)) if settings.get("page_store") else None
+        self.run_session(CaptureSession(
+            create_grabber(), turner, self.save_folder,
+            settings.get("pages"), settings.get("delay", 2.0),
+            region=tuple(settings["region"]),
+            wait_mode=settings.get("wait_mode", WAIT_FIXED),
+            end_after=settings.get("end_after"), pdf_path=settings.get("pdf_path"),
+            pdf_profile=settings.get("pdf_profile", PROFILE_LOSSLESS),
+            pdf_dpi=settings.get("pdf_dpi"), page_store=page_store,
+            auto_crop=settings.get("auto_crop", False),
+            spread=settings.get("spread", False), rtl=settings.get("rtl", False),
+            scroll=settings.get("scroll", False), page_height=settings.get("page_height"),
+            resume_from=saved,
+            on_status=self.post_status,
+            on_progress=self.post_progress,
+            on_finished=self.post_finished))
+    
+    def run_session(self, session):
+        """Switch the UI into capture mode and start the session"""
         self.is_running = True
         self.start_button.config(state=tk.DISABLED, bg='#d1d5db')
         self.stop_button.config(state=tk.NORMAL, bg=self.colors['danger'])
-        self.progress['maximum'] = pages
-        self.progress['value'] = 0
-        self.screenshot_count = 0
-        self.screenshots = []
-        
-        # Start the actual work in a separate thread so UI doesn't freeze
-        thread = threading.Thread(target=self.screenshot_process, args=(pages, delay))
-        thread.daemon = True  # Thread will close when main program closes
-        thread.start()
+        if session.pages is None:
+            # We don't know how long the book is, so just show activity
+            self.progress.config(mode='indeterminate')
+            self.progress.start(50)
+        else:
+            self.progress.config(mode='determinate')
+            self.progress['maximum'] = session.pages
+            self.progress['value'] = len(session.screenshots)
+        self.screenshot_count = len(session.screenshots)
+        self.screenshots = list(session.screenshots)
+        self.rate_var.set("")
+        if self.review:
+            self.review.set_pages(self.screenshots)
+        
+        self.session = session
+        self.session.start()
     
-    def screenshot_process(self, pages, delay):
-        """This is the main work function that takes all the screenshots"""
-        # Give user 3 seconds to get ready
-        for i in range(3, 0, -1):
-            if not self.is_running:  # User clicked stop
-                return
-            self.status_var.set(f"⏱️ Starting in {i} seconds...")
-            time.sleep(1)
-        
-        # Take screenshots of each page
-        for page in range(pages):
-            if not self.is_running:  # User clicked stop
-                break
-            
-            # Update status to show current progress
-            self.status_var.set(f"📸 Capturing page {page + 1}...")
-            self.progress_text_var.set(f"{page + 1} / {pages} pages")
-            
-            # Take the actual screenshot
-            screenshot = pyautogui.screenshot(region=self.region)
-            filename = f"page_{page + 1:03d}.png"  # page_001.png, page_002.png, etc.
-            filepath = os.path.join(self.save_folder, filename)
-            screenshot.save(filepath)
-            
-            # Keep track of what we've done
-            self.screenshots.append(filepath)
-            self.screenshot_count += 1
-            self.progress['value'] = self.screenshot_count
-            self.root.update_idletasks()  # Refresh the UI
+    def create_page_turner(self):
+        """Build the page turner for the method picked in the UI"""
+        # Keys and clicks go through XTest where there is X11, with no pause after them
+        if self.method_var.get() == "keyboard":
+            return create_turner(self.key_var.get())
+        if self.method_var.get() == "scroll":
+            # Scroll with the mouse over the middle of the capture region
+            x, y, width, height = self.region
+            return ScrollTurner(-int(self.scroll_var.get()), (x + width // 2, y + height // 2))
+        x, y = self.click_position
+        return create_turner([f"click {x} {y}"])
+    
+    def post_status(self, text):
+        """Status line update from any thread - only the newest one gets shown"""
+        self.events.latest("status", self.status_var.set, text)
+    
+    def post_progress(self, done, total):
+        """Capture engine callback after every saved page (capture thread)"""
+        self.events.latest("progress", self.on_capture_progress, done, total)
+    
+    def post_finished(self, session):
+        """Capture engine callback once the capture loop is over (capture thread)"""
+        self.events.call(self.on_capture_finished, session)
+    
+    def on_capture_progress(self, done, total):
+        """Show the capture progress - runs on the Tk thread, a few times per second"""
+        self.screenshot_count = done
+        if total is None:
+            self.progress_text_var.set(f"{done} pages")
+        else:
+            self.progress_text_var.set(f"{done} / {total} pages")
+            self.progress['value'] = done
+        
+        # Live pace: pages per minute and, if we know the page count, time left
+        if self.session:
+            rate = self.session.throughput.pages_per_minute
+            eta = self.session.eta()
+            text = f"{rate:.1f} pages/min" if rate else ""
+            if eta is not None:
+                text += f" • ETA {format_duration(eta)}"
+            self.rate_var.set(text)
             
-            # Turn to next page (except on the last page)
-            if page < pages - 1:
-                if self.method_var.get() == "keyboard":
-                    pyautogui.press(self.key_var.get())
-                else:
-                    pyautogui.click(self.click_position[0], self.click_position[1])
-                time.sleep(delay)  # Wait before taking next screenshot
-        
-        # Create PDF if user wants it
-        pdf_created = False
-        pdf_name = ""
-        
-        if self.create_pdf_var.get() and self.screenshots:
-            self.status_var.set("📄 Creating PDF...")
-            self.root.update_idletasks()
-            pdf_created, pdf_name = self.create_pdf(self.screenshots)
-        
-        # Show the completion message
-        self.show_completion_dialog(self.screenshot_count, pdf_created, pdf_name)
+            # New pages show up in the review window as they are saved
+            if self.review:
+                self.review.set_pages(self.session.screenshots)
+    
+    def on_capture_finished(self, session):
+        """Wrap up after the capture - runs on the Tk thread"""
+        self.screenshots = list(session.screenshots)
+        if self.review:
+            self.review.set_pages(self.screenshots)
+        if session.pages is None:
+            self.progress.stop()
+            self.progress.config(mode='determinate')
+            self.progress['maximum'] = max(1, len(self.screenshots))
+            self.progress['value'] = len(self.screenshots)
+        
+        # Nothing to report if the user stopped during the countdown
+        if session.stopped and not self.screenshots:
+            return
+        
+        if session.error:
+            messagebox.showerror("Capture Error", f"Error during capture: {str(session.error)}")
+        
+        # The PDF was already built during the capture
+        pdf_created = bool(session.pdf_path and session.pdf_pages)
+        pdf_name = os.path.basename(session.pdf_path) if pdf_created else ""
+        if pdf_created:
+            self.status_var.set(f"✅ PDF created: {pdf_name}")
+        
+        # Show the completion message - unless the capture failed
+        if not session.error:
+            self.show_completion_dialog(self.screenshot_count, pdf_created, pdf_name,
+                                        session.pdf_report,
+                                        (session.duplicate_pages, session.duplicate_bytes),
+                                        session.cropper, session.timings)
         
         # Put the UI back to normal
         self.is_running = False
@@ -514,55 +776,24 @@ class ModernBookScreenshotTool:
     def stop_screenshot(self):
         """Stop the screenshot process when user clicks stop button"""
         self.is_running = False
+        if self.session:
+            self.session.stop()
         self.start_button.config(state=tk.NORMAL, bg=self.colors['success'])
         self.stop_button.config(state=tk.DISABLED, bg='#f3f4f6')
         self.status_var.set("⏹️ Stopped by user")
     
-    def create_pdf(self, image_paths):
-        """Convert all the screenshot images into one PDF file"""
-        try:
-            # Make sure filename ends with .pdf
-            pdf_filename = self.pdf_name_var.get()
-            if not pdf_filename.endswith('.pdf'):
-                pdf_filename += '.pdf'
-            
-            # Create the PDF
-            pdf_path = os.path.join(self.save_folder, pdf_filename)
-            c = canvas.Canvas(pdf_path, pagesize=A4)
-            page_width, page_height = A4
-            
-            # Add each image as a page in the PDF
-            for i, image_path in enumerate(image_paths):
-                if not os.path.exists(image_path):
-                    continue
-                
-                self.status_var.set(f"📄 Adding page {i+1}/{len(image_paths)} to PDF...")
-                self.root.update_idletasks()
-                
-                img = Image.open(image_path)
-                img_width, img_height = img.size
-                
-                # Figure out how much to shrink/expand the image to fit the page
-                scale_x = page_width / img_width
-                scale_y = page_height / img_height
-                scale = min(scale_x, scale_y)  # Use smaller scale so image fits
-                
-                # Center the image on the page
-                scaled_width = img_width * scale
-                scaled_height = img_height * scale
-                x = (page_width - scaled_width) / 2
-                y = (page_height - scaled_height) / 2
-                
-                c.drawImage(image_path, x, y, width=scaled_width, height=scaled_height)
-                c.showPage()  # Move to next page
-            
-            c.save()  # Finish and save the PDF
-            self.status_var.set(f"✅ PDF created: {pdf_filename}")
-            return True, pdf_filename
-            
-        except Exception as e:
-            messagebox.showerror("PDF Error", f"Error creating PDF: {str(e)}")
-            return False, ""
+    def get_pdf_path(self):
+        """Full path of the PDF to create, from the filename the user typed"""
+        # Make sure filename ends with .pdf
+        pdf_filename = self.pdf_name_var.get()
+        if not pdf_filename.endswith('.pdf'):
+            pdf_filename += '.pdf'
+        return os.path.join(self.save_folder, pdf_filename)
+    
+    def get_pdf_dpi(self):
+        """Target DPI picked for the PDF, or None to keep full resolution"""
+        dpi = self.dpi_var.get()
+        return int(dpi) if dpi.isdigit() else None
     
     def create_pdf_from_existing(self):
         """Create PDF from images that are already saved in the folder"""
@@ -570,20 +801,22 @@ class ModernBookScreenshotTool:
             messagebox.showerror("Error", "Please select a folder first")
             return
         
-        # Look for all types of image files
-        image_extensions = ['*.png', '*.jpg', '*.jpeg', '*.bmp', '*.tiff']
-        image_files = []
+        # The capture is still adding pages to this folder - its own PDF comes at the end
+        capture_folder = self.session.save_folder if self.session else self.save_folder
+        if self.is_running and os.path.abspath(capture_folder) == os.path.abspath(self.save_folder):
+            messagebox.showwarning("Capture Running",
+                                   "Wait for the capture to finish (or stop it) before making a PDF of its folder")
+            return
         
-        for ext in image_extensions:
-            image_files.extend(glob.glob(os.path.join(self.save_folder, ext)))
+        from pdf_builder import find_pages
+        
+        # The folder's page pack, or else all types of image files
+        image_files = find_pages(self.save_folder)
         
         if not image_files:
             messagebox.showwarning("No Images", "No image files found in the selected folder")
             return
         
-        # Put files in order (page_001.png comes before page_002.png)
-        image_files.sort()
-        
         # Ask user what to name the PDF
         pdf_name = simpledialog.askstring("PDF Name", 
                                         "Enter PDF filename:", 
@@ -595,53 +828,201 @@ class ModernBookScreenshotTool:
         if not pdf_name.endswith('.pdf'):
             pdf_name += '.pdf'
         
+        # A PDF from an earlier build can just get the pages added since
+        append = False
+        existing = pdf_page_count(os.path.join(self.save_folder, pdf_name))
+        if existing and existing < len(image_files):
+            append = messagebox.askyesnocancel(
+                "Add Pages",
+                f"{pdf_name} already has {existing} pages.\n\n"
+                f"Add the {len(image_files) - existing} newer images to the end of it?\n"
+                f"(No rebuilds the whole PDF)")
+            if append is None:
+                return
+            if append:
+                image_files = image_files[existing:]
+        
+        self.start_pdf_build(image_files, pdf_name, append)
+    
+    def start_pdf_build(self, image_files, pdf_name, append=False):
+        """Build the PDF from image_files in the background, with progress in the window"""
+        self.status_var.set("📄 Creating PDF from existing images...")
+        self.progress.config(mode='determinate')
+        self.progress['maximum'] = len(image_files)
+        self.progress['value'] = 0
+        
+        # Images are decoded and compressed in worker processes, and this
+        # thread keeps the window responsive while they do it. Tk variables
+        # can only be read here, on the Tk thread
+        profile = self.compression_var.get()
+        target_dpi = self.get_pdf_dpi()
+        thread = threading.Thread(target=self.build_pdf_process,
+                                  args=(image_files, pdf_name, profile, target_dpi, append))
+        thread.daemon = True
+        thread.start()
+    
+    def build_pdf_process(self, image_files, pdf_name, profile, target_dpi, append=False):
+        """Background part of create_pdf_from_existing"""
+        from encode_cache import EncodeCache, cache_folder
+        from pdf_builder import build_pdf
+        
+        def show_progress(done, total):
+            self.status_var.set(f"📄 Adding page {done}/{total} to PDF...")
+            self.progress_text_var.set(f"{done} / {total} pages")
+            self.progress['value'] = done
+        
+        def on_progress(done, total):
+            self.events.latest("progress", show_progress, done, total)
+        
         try:
-            self.status_var.set("📄 Creating PDF from existing images...")
-            self.root.update_idletasks()
-            
-            # Same PDF creation process as before
             pdf_path = os.path.join(self.save_folder, pdf_name)
-            c = canvas.Canvas(pdf_path, pagesize=A4)
-            page_width, page_height = A4
-            
-            for i, image_path in enumerate(image_files):
-                self.status_var.set(f"📄 Adding page {i+1}/{len(image_files)} to PDF...")
-                self.root.update_idletasks()
-                
-                try:
-                    img = Image.open(image_path)
-                    img_width, img_height = img.size
-                    
-                    # Scale and center image on PDF page
-                    scale_x = page_width / img_width
-                    scale_y = page_height / img_height
-                    scale = min(scale_x, scale_y)
-                    
-                    scaled_width = img_width * scale
-                    scaled_height = img_height * scale
-                    x = (page_width - scaled_width) / 2
-                    y = (page_height - scaled_height) / 2
-                    
-                    c.drawImage(image_path, x, y, width=scaled_width, height=scaled_height)
-                    c.showPage()
-                    
-                except Exception as e:
-                    print(f"Error processing {image_path}: {e}")
-                    continue  # Skip this image and try the next one
-            
-            c.save()
-            
-            # Tell user it worked
-            self.status_var.set(f"✅ PDF created: {pdf_name}")
-            messagebox.showinfo("Success", 
-                               f"PDF created successfully!\n\n"
-                               f"File: {pdf_name}\n"
-                               f"Pages: {len(image_files)}\n"
-                               f"Location: {self.save_folder}")
-            
+            # Pages encoded by an earlier build are reused, only new or changed ones are encoded
+            with EncodeCache(cache_folder(self.save_folder)) as cache:
+                sink = build_pdf(image_files, pdf_path, on_progress=on_progress,
+                                 profile=profile, target_dpi=target_dpi, cache=cache,
+                                 append=append)
+        except Exception as e:
+            self.post_status("❌ PDF creation failed")
+            message = f"Error creating PDF: {str(e)}"
+            self.events.call(lambda: messagebox.showerror("PDF Error", message))
+            return
+        
+        # Tell user it worked
+        self.post_status(f"✅ PDF created: {pdf_name}")
+        self.events.call(lambda: messagebox.showinfo("Success", 
+                                                       f"PDF created successfully!\n\n"
+                                                       f"File: {pdf_name}\n"
+                                                       f"Pages: {sink.pages}{' added' if append else ''} "
+                                                       f"({cache.hits} unchanged)\n"
+                                                       f"Size: {sink.report.stored_bytes / (1024 * 1024):.1f} MB\n"
+                                                       f"Location: {self.save_folder}"))
+    
+    def open_review(self):
+        """Show thumbnails of the pages - the capture's, or else the folder's"""
+        if self.review:
+            self.review.window.lift()
+            return
+        if not self.save_folder:
+            messagebox.showerror("Error", "Please select a folder first")
+            return
+        
+        if self.is_running:
+            pages = self.session.screenshots
+        else:
+            if not self.screenshots:
+                from pdf_builder import find_pages
+                self.screenshots = find_pages(self.save_folder)
+            pages = self.screenshots
+            if not pages:
+                messagebox.showwarning("No Images", "No image files found in the selected folder")
+                return
+        
+        from review_window import ReviewWindow
+        self.review = ReviewWindow(self.root, self.events, pages, self.colors,
+                                   on_delete=self.delete_page, on_recapture=self.recapture_page,
+                                   on_build_pdf=self.build_reviewed_pdf,
+                                   on_close=self.on_review_closed, follow=self.is_running)
+    
+    def on_review_closed(self):
+        self.review = None
+    
+    def pages_editable(self):
+        """Pages can't be changed while the capture is still adding to them"""
+        if self.is_running:
+            messagebox.showwarning("Capture Running",
+                                   "Wait for the capture to finish (or stop it) first",
+                                   parent=self.review.window)
+            return False
+        return True
+    
+    def delete_page(self, index):
+        """Leave one page out of the book - called from the review window"""
+        from page_store import StoredPage
+        if not self.pages_editable():
+            return
+        source = self.screenshots[index]
+        if isinstance(source, StoredPage):
+            # A pack can't have holes - the page is only left out of the list
+            note = "it stays in the page pack, so build the PDF from the review window"
+        else:
+            # Moved, not deleted, so a page deleted by mistake can be put back by hand
+            folder = os.path.join(self.save_folder, DELETED_FOLDER)
+            try:
+                os.makedirs(folder, exist_ok=True)
+                os.replace(source, os.path.join(folder, os.path.basename(source)))
+            except OSError as e:
+                messagebox.showerror("Delete Page", f"Could not delete the page: {e}",
+                                     parent=self.review.window)
+                return
+            note = f"moved to the {DELETED_FOLDER} folder"
+        del self.screenshots[index]
+        self.screenshot_count = len(self.screenshots)
+        self.review.set_pages(self.screenshots)
+        self.status_var.set(f"🗑️ Page {index + 1} deleted ({note})")
+    
+    def recapture_page(self, index):
+        """Take one page again - called from the review window"""
+        from page_store import StoredPage
+        if not self.pages_editable():
+            return
+        source = self.screenshots[index]
+        session = self.session
+        if isinstance(source, StoredPage) or (session and (session.spread or session.scroll)):
+            messagebox.showerror("Recapture Page",
+                                 "Only pages saved as image files can be captured again - "
+                                 "not pages in a page pack, of spreads or of a scroll capture",
+                                 parent=self.review.window)
+            return
+        region = session.region if session else self.region
+        if not region:
+            messagebox.showerror("Error", "Please select screenshot region",
+                                 parent=self.review.window)
+            return
+        if not messagebox.askokcancel("Recapture Page",
+                                      f"Show page {index + 1} in the viewer, then click OK.\n\n"
+                                      f"The windows hide for a moment while it is captured.",
+                                      parent=self.review.window):
+            return
+        self.review.window.withdraw()
+        self.root.withdraw()
+        self.root.after(RECAPTURE_DELAY_MS, self.grab_page_again, index, source, region)
+    
+    def grab_page_again(self, index, source, region):
+        """Second half of recapture_page, once the windows are out of the way"""
+        error = None
+        try:
+            grabber = create_grabber()
+            try:
+                image = grabber.grab(region)
+            finally:
+                grabber.close()
+            # Cropped like the rest of the capture
+            cropper = self.session.cropper if self.session else None
+            if cropper and cropper.box and image.size == cropper.size:
+                image = image.crop(cropper.box)
+            # Saved next to it first, then swapped in - the old file may be a
+            # hard link shared with a repeated page, which must stay as it is
+            base, extension = os.path.splitext(source)
+            temp_path = f"{base}.recapture{extension}"
+            image.save(temp_path)
+            os.replace(temp_path, source)
         except Exception as e:
-            messagebox.showerror("PDF Error", f"Error creating PDF: {str(e)}")
-            self.status_var.set("❌ PDF creation failed")
+            error = e
+        
+        self.root.deiconify()
+        if self.review:
+            self.review.window.deiconify()
+            self.review.refresh(source)
+        if error:
+            messagebox.showerror("Recapture Page", f"Could not capture the page: {error}")
+        else:
+            self.status_var.set(f"📸 Page {index + 1} captured again")
+    
+    def build_reviewed_pdf(self):
+        """Build the PDF from the pages as they are after the review"""
+        if not self.pages_editable() or not self.screenshots:
+            return
+        self.start_pdf_build(list(self.screenshots), os.path.basename(self.get_pdf_path()))
     
     def open_folder(self, folder_path):
         """Open the save folder in Windows Explorer, Mac Finder, or Linux file manager"""
@@ -655,12 +1036,13 @@ class ModernBookScreenshotTool:
         except Exception as e:
             messagebox.showerror("Error", f"Could not open folder: {str(e)}")
     
-    def show_completion_dialog(self, screenshots_count, pdf_created=False, pdf_name=""):
+    def show_completion_dialog(self, screenshots_count, pdf_created=False, pdf_name="", report=None,
+                               duplicates=None, cropper=None, timings=None):
         """Show a nice dialog when everything is finished"""
         # Create popup window
         dialog = tk.Toplevel(self.root)
         dialog.title("✅ Capture Complete")
-        dialog.geometry("400x300")
+        dialog.geometry("400x390")
         dialog.configure(bg=self.colors['surface'])
         dialog.resizable(False, False)
         dialog.transient(self.root)  # Keep it connected to main window
@@ -669,8 +1051,8 @@ class ModernBookScreenshotTool:
         # Put dialog in center of screen
         dialog.update_idletasks()
         x = (dialog.winfo_screenwidth() // 2) - (400 // 2)
-        y = (dialog.winfo_screenheight() // 2) - (300 // 2)
-        dialog.geometry(f"400x300+{x}+{y}")
+        y = (dialog.winfo_screenheight() // 2) - (390 // 2)
+        dialog.geometry(f"400x390+{x}+{y}")
         
         # Green header section
         header_frame = tk.Frame(dialog, bg=self.colors['success'], height=60)
@@ -698,8 +1080,28 @@ class ModernBookScreenshotTool:
         summary_text = f"• {screenshots_count} screenshots captured\n"
         summary_text += f"• Saved to: {os.path.basename(self.save_folder)}\n"
         
+        # Repeated pages (blank pages, double captures) are only stored once
+        if duplicates and duplicates[0]:
+            pages, saved = duplicates
+            summary_text += f"• {pages} repeated pages stored once (saved {saved / (1024 * 1024):.1f} MB)\n"
+        
+        # How much the auto-crop cut off
+        if cropper and cropper.box and cropper.pixels_before:
+            left, top, right, bottom = cropper.box
+            percent = 100 * cropper.pixels_saved / cropper.pixels_before
+            summary_text += (f"• Cropped to {right - left} × {bottom - top} "
+                             f"({percent:.0f}% fewer pixels)\n")
+        
+        # What a page turn cost, and how long the viewer took to show the page
+        if timings and timings.stages[STAGE_TURN].count:
+            summary_text += f"• Median {timings.medians_text((STAGE_TURN, STAGE_WAIT))}\n"
+        
         if pdf_created:
             summary_text += f"• PDF created: {pdf_name}"
+            # How much each compression profile saved
+            if report:
+                for line in report.lines():
+                    summary_text += f"\n   {line}"
         else:
             summary_text += "• No PDF created"
         
@@ -760,6 +1162,7 @@ class ModernBookScreenshotTool:
 
 # This runs when the script is started directly (not imported)
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Needed for the PDF worker processes in the .exe
     root = tk.Tk()
     app = ModernBookScreenshotTool(root)
     root.mainloop()  # Start the GUI
\ No newline at end of file
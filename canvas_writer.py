@@ -0,0 +1,88 @@
+"""The reportlab route for PdfSink - writer="reportlab".
+
+reportlab's Canvas keeps the whole document in memory and takes a while to
+import, so it lives here and pdf_builder only imports it when it's asked
+for. pdf_writer.PdfWriter is the default.
+"""
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfgen import canvas
+
+
+class _EncodedImageXObject(pdfdoc.PDFImageXObject):
+    """A reportlab image XObject built from data that is already compressed"""
+
+    def __init__(self, name, encoded):
+        self.name = name
+        self.width = encoded.width
+        self.height = encoded.height
+        self.bitsPerComponent = encoded.bits
+        self.colorSpace = encoded.color_space
+        self._filters = (encoded.filter_name,)
+        self.streamContent = encoded.data
+        self.mask = None
+        self._decode_parms = encoded.decode_parms
+
+    def format(self, document):
+        # Like PDFImageXObject.format, plus the /DecodeParms that CCITT data needs
+        stream = pdfdoc.PDFStream(content=self.streamContent)
+        dictionary = stream.dictionary
+        dictionary["Type"] = pdfdoc.PDFName("XObject")
+        dictionary["Subtype"] = pdfdoc.PDFName("Image")
+        dictionary["Width"] = self.width
+        dictionary["Height"] = self.height
+        dictionary["BitsPerComponent"] = self.bitsPerComponent
+        dictionary["ColorSpace"] = pdfdoc.PDFName(self.colorSpace)
+        # A single filter, not an array - /DecodeParms has to match its shape
+        dictionary["Filter"] = pdfdoc.PDFName(self._filters[0])
+        if self._decode_parms:
+            dictionary["DecodeParms"] = pdfdoc.PDFDictionary(dict(self._decode_parms))
+        dictionary["Length"] = len(self.streamContent)
+        return stream.format(document)
+
+
+class CanvasPdfWriter:
+    """PdfWriter look-alike on top of reportlab's Canvas
+
+    Keeps the whole document in memory until close(), so it is only meant
+    for small PDFs or as a fallback - PdfWriter is the default.
+    """
+
+    def __init__(self, pdf_path, pagesize):
+        self.pdf_path = pdf_path
+        self.pagesize = pagesize
+        self.pages = 0
+        self._images = 0
+        self._canvas = canvas.Canvas(pdf_path, pagesize=pagesize)
+
+    def add_image(self, encoded):
+        # Same steps as Canvas.drawImage, minus reading and compressing the
+        # image - that has already been done by page_encoding
+        c = self._canvas
+        self._images += 1
+        name = f"image{self._images}"
+        reg_name = c._doc.getXObjectName(name)
+        image_object = _EncodedImageXObject(name, encoded)
+        c._setXObjects(image_object)
+        c._doc.Reference(image_object, reg_name)
+        c._doc.addForm(name, image_object)
+        return name
+
+    def add_page(self, name, x, y, width, height):
+        c = self._canvas
+        c.saveState()
+        c.translate(x, y)
+        c.scale(width, height)
+        c._code.append(f"/{c._doc.getXObjectName(name)} Do")
+        c.restoreState()
+        c._formsinuse.append(name)
+
+        c.showPage()  # Move to next page
+        self.pages += 1
+
+    def add_image_page(self, encoded, x, y, width, height):
+        self.add_page(self.add_image(encoded), x, y, width, height)
+
+    def close(self):
+        if self.pages:
+            self._canvas.save()
+        return self.pages
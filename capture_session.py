@@ -0,0 +1,441 @@
+"""The capture engine - takes screenshots page by page without any GUI.
+
+The Tk window (or anything else) creates a CaptureSession, hands it a grab
+backend and a page turner, and listens to the callbacks to show progress.
+"""
+import os
+import threading
+import time
+
+from capture_settings import WAIT_FIXED, WAIT_ADAPTIVE, PROFILE_LOSSLESS
+from page_analysis import small_gray, frame_difference, difference_hash, hash_distance
+from page_crop import AutoCrop
+from page_spread import SpreadSplitter
+from page_stitch import ScrollStitcher, check_page_height
+from page_writer import PageWriter
+from pdf_builder import PdfSink
+from session_journal import SessionJournal
+from stage_timings import StageTimings, ThroughputMeter, STAGE_GRAB, STAGE_TURN, STAGE_WAIT, \
+    STAGE_STITCH
+
+TIMINGS_NAME = "timings"  # timings.json and timings.csv in the save folder
+SCROLL_END_FRAMES = 3  # Frames in a row the view didn't move = end of the document, even without end_after
+
+
+class CaptureSession:
+    """Runs one capture from start to finish
+
+    With wait_mode=WAIT_ADAPTIVE the delay becomes the longest we are willing
+    to wait: after a page turn the region is polled until it has changed
+    from the previous page and then stayed the same for stable_frames polls.
+
+    Every grab is fingerprinted with a difference hash. With end_after=K it
+    is compared with the last saved page. A repeat is never saved - the page is turned again instead,
+    and once the same picture has been seen K times in a row we take it as
+    the end of the book and stop. pages=None means "keep going until the
+    end", which needs end_after to be set (scroll captures always stop at
+    the end).
+
+    With pdf_path set, every page is added to the PDF as soon as it is on
+    disk, and the PDF is saved when the capture ends - also when it ends
+    early because of stop() or an error.
+
+    With journal=True every saved page is noted in a crash-safe journal in
+    save_folder (see session_journal). resume_from takes the SavedSession
+    loaded from such a journal and carries on after its last saved page -
+    the pages already on disk are kept, and so is the unfinished PDF if it
+    is still intact.
+
+    With page_store (a page_store.PageStore) the pages are appended to that
+    one pack file instead of being saved as page_NNN.png files, and
+    screenshots holds their StoredPages.
+
+    With dedup=True a page whose pixels exactly match an earlier page's is
+    stored only once (hard link or pack record) and shares its image in the
+    PDF - duplicate_pages and duplicate_bytes say how much that saved.
+
+    With auto_crop=True the toolbars and empty margins are trimmed off the
+    saved pages, with one crop locked from the first few pages (see
+    page_crop). cropper holds the AutoCrop, and its numbers, afterwards.
+
+    With spread=True the region holds two pages side by side: every grab
+    is split at the gutter into two pages (right one first with rtl=True,
+    see page_spread) and the book is turned once per spread. pages still
+    counts pages, not spreads. A spread counts as a repeat only if both
+    its pages match the last two saved ones.
+
+    With scroll=True the viewer scrolls instead of turning pages (the
+    turner is usually a ScrollTurner). Every frame is matched against the
+    last one, the new rows are stitched onto a strip and the strip is cut
+    into pages page_height rows high (see page_stitch) - A4 proportions by
+    default. The end is reached when the view stops moving for
+    SCROLL_END_FRAMES frames (or end_after, if fewer). stitcher holds
+    the ScrollStitcher, and its numbers, afterwards.
+
+    timings records how long each stage took for every page (grab, encode,
+    write, turn, wait, pdf_append). With export_timings it is saved as
+    timings.json and timings.csv in save_folder at the end. throughput and
+    eta() give the live pace.
+
+    The session closes the grabber, turner and page store when the capture
+    is over.
+
+    Callbacks (all optional, called from the capture thread):
+        on_status(text)            - a short human readable status line
+        on_progress(done, total)   - after every page is written to disk
+        on_finished(session)       - once, when the capture ends or is stopped
+    """
+
+    def __init__(self, grabber, turner, save_folder, pages, delay,
+                 region=None, countdown=3, writer_workers=2, max_pending=8,
+                 wait_mode=WAIT_FIXED, stable_frames=3, poll_interval=0.05,
+                 change_threshold=1.0, end_after=None, hash_threshold=8,
+                 pdf_path=None, pdf_profile=PROFILE_LOSSLESS, pdf_dpi=None,
+                 page_store=None, dedup=True, auto_crop=False, spread=False, rtl=False,
+                 scroll=False, page_height=None,
+                 journal=True, resume_from=None, export_timings=True,
+                 on_status=None, on_progress=None, on_finished=None):
+        self.grabber = grabber
+        self.turner = turner
+        self.save_folder = save_folder
+        self.pages = pages
+        self.delay = delay
+        self.region = region
+        self.countdown = countdown
+        self.writer_workers = writer_workers
+        self.max_pending = max_pending  # Grabs allowed to wait for the encoders
+        self.wait_mode = wait_mode
+        self.stable_frames = stable_frames
+        self.poll_interval = poll_interval
+        self.change_threshold = change_threshold  # Mean pixel difference (0-255)
+        self.end_after = end_after  # Identical grabs in a row that mean "last page"
+        self.hash_threshold = hash_threshold  # Differing hash bits still called "same"
+        self.pdf_path = pdf_path
+        self.pdf_profile = pdf_profile  # Compression profile for the PDF pages
+        self.pdf_dpi = pdf_dpi  # Scale PDF pages down to this many pixels per inch
+        self.page_store = page_store
+        self.dedup = dedup
+        self.auto_crop = auto_crop
+        self.spread = spread
+        self.rtl = rtl  # Right-to-left book - with spread, the right page comes first
+        self.scroll = scroll
+        self.page_height = page_height  # Rows per page with scroll, None for A4 proportions
+        self.export_timings = export_timings
+        self.journal = journal
+        self.resume_from = resume_from
+        if pages is None and not end_after and not scroll:
+            raise ValueError("Capturing until the end of the book needs end_after")
+        if scroll:
+            check_page_height(page_height)  # Here, not in the capture thread
+
+        self.on_status = on_status
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+
+        self.screenshots = []  # File paths of the saved pages, in page order
+        self.page_hashes = []  # difference_hash() of every saved page, in page order
+        self.reached_end = False  # True if we stopped because the book ended
+        self.pdf_pages = 0  # Pages that made it into the PDF
+        self.pdf_report = None  # CompressionReport for the PDF pages
+        self.duplicate_pages = 0  # Pages stored as a repeat of an earlier page
+        self.duplicate_bytes = 0  # Disk space saved by that
+        self.cropper = None  # The AutoCrop used for the pages, with auto_crop
+        self.stitcher = None  # The ScrollStitcher used for the pages, with scroll
+        self.timings = StageTimings()
+        self.throughput = ThroughputMeter()
+        self._pdf = None
+        self._writer = None
+        self._journal = None
+        if resume_from is not None:
+            self.screenshots = resume_from.paths
+            self.page_hashes = resume_from.hashes
+        self.stopped = False  # True if the capture was stopped before the end
+        self.error = None  # The exception that ended the capture, if any
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Run the capture in a background thread and return straight away"""
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True  # Thread will close when main program closes
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """Ask the capture to stop after the current page"""
+        self._stop_event.set()
+
+    def wait(self, timeout=None):
+        """Block until a capture started with start() has finished"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        """Do the whole capture in the calling thread"""
+        try:
+            self._capture()
+        except Exception as e:
+            self.error = e
+            self._status(f"❌ Capture failed: {e}")
+        finally:
+            self.grabber.close()
+            if self.turner is not self.grabber:
+                self.turner.close()
+            self.stopped = self._stop_event.is_set()
+            if self.on_finished:
+                self.on_finished(self)
+
+    def journal_settings(self):
+        """The settings written at the top of the journal"""
+        return {"pages": self.pages, "delay": self.delay,
+                "region": list(self.region) if self.region else None,
+                "turner": self.turner.settings(), "wait_mode": self.wait_mode,
+                "end_after": self.end_after, "page_store": self.page_store is not None,
+                "auto_crop": self.auto_crop, "spread": self.spread, "rtl": self.rtl,
+                "scroll": self.scroll, "page_height": self.page_height,
+                "pdf_path": self.pdf_path,
+                "pdf_profile": self.pdf_profile, "pdf_dpi": self.pdf_dpi}
+
+    def eta(self):
+        """Seconds left at the current pace, or None if not known (yet)"""
+        if self.pages is None:
+            return None
+        return self.throughput.eta(self.pages - len(self.screenshots))
+
+    def save_timings(self, folder=None):
+        """Write timings.json and timings.csv, return their paths"""
+        base = os.path.join(folder or self.save_folder, TIMINGS_NAME)
+        self.timings.to_json(base + ".json")
+        self.timings.to_csv(base + ".csv")
+        return base + ".json", base + ".csv"
+
+    def _status(self, text):
+        if self.on_status:
+            self.on_status(text)
+
+    def _capture(self):
+        # Give user a few seconds to get ready
+        for i in range(self.countdown, 0, -1):
+            self._status(f"⏱️ Starting in {i} seconds...")
+            if self._stop_event.wait(1):  # User clicked stop
+                return
+
+        if self.page_store is not None:
+            # Pages the journal doesn't know about are captured again
+            self.page_store.truncate(len(self.screenshots))
+        if self.journal:
+            self._journal = SessionJournal(self.save_folder, self.journal_settings(),
+                                           resume=self.resume_from)
+        try:
+            if self.pdf_path:
+                self._open_pdf()
+            self._capture_pages()
+        finally:
+            if self._pdf:
+                self._status("📄 Finishing PDF...")
+                self.pdf_pages = self._pdf.close()
+                self.pdf_report = self._pdf.report
+            if self.page_store is not None:
+                self.page_store.close()
+            if self._journal:
+                self._journal.finish(pages=len(self.screenshots), reached_end=self.reached_end,
+                                     stopped=self._stop_event.is_set())
+                self._journal.close()
+            if self.export_timings and self.screenshots:
+                self.save_timings()
+
+    def _open_pdf(self):
+        resume_state = None
+        if self.resume_from is not None:
+            resume_state = self.resume_from.pdf_resume_state(self.pdf_path)
+        # Reopen the unfinished PDF if we can, else start it again from the saved files
+        first_item = len(resume_state[1]) if resume_state else 0
+        self._pdf = PdfSink(self.pdf_path, profile=self.pdf_profile, target_dpi=self.pdf_dpi,
+                            on_written=self._journal.record_pdf if self._journal else None,
+                            resume_state=resume_state, first_item=first_item,
+                            timings=self.timings)
+        for path in self.screenshots[first_item:]:
+            self._pdf.add_page(path)
+
+    def _capture_pages(self):
+        # Pages are saved in the background while we turn to the next one.
+        # Closing the writer waits for every pending page, so by the time
+        # on_finished runs all files are on disk.
+        if self.auto_crop:
+            # A resumed capture keeps the crop it had, so all pages match
+            saved = self.resume_from.crop if self.resume_from is not None else None
+            self.cropper = AutoCrop(box=saved and saved["box"], size=saved and saved["size"],
+                                    on_locked=self._journal.record_crop if self._journal else None)
+        splitter = SpreadSplitter(self.rtl) if self.spread else None
+        with PageWriter(self.writer_workers, self.max_pending, on_saved=self._page_saved,
+                        store=self.page_store, dedup=self.dedup, cropper=self.cropper,
+                        timings=self.timings) as writer:
+            self._writer = writer
+            settled = None  # Frame the adaptive wait already grabbed for us
+            repeats = 0  # How many grabs in a row showed the last saved page again
+            first_page = page = len(self.screenshots)  # Not 0 when resuming
+            if first_page and self.on_progress:
+                self.on_progress(first_page, self.pages)  # Pages kept from before
+            if self.scroll:
+                self._scroll_pages(writer, first_page)
+                return
+            while self.pages is None or page < self.pages:
+                if self._stop_event.is_set():
+                    break
+
+                self._status(f"📸 Capturing page {page + 1}...")
+
+                if settled is not None:
+                    screenshot = settled
+                else:
+                    with self.timings.measure(STAGE_GRAB):
+                        screenshot = self.grabber.grab(self.region)
+
+                # A spread is two pages, in reading order
+                grabbed = splitter.split(screenshot) if splitter else [screenshot]
+
+                # Fingerprint every grab so repeats of the last saved page(s) stand out
+                hashes = [difference_hash(image) for image in grabbed]
+                last = self.page_hashes[-len(hashes):]
+                if self.end_after and len(last) == len(hashes) and \
+                        all(hash_distance(new, old) <= self.hash_threshold
+                            for new, old in zip(hashes, last)):
+                    repeats += 1
+                    if repeats + 1 >= self.end_after:
+                        self.reached_end = True
+                        self._status(f"🏁 End of book reached after {page} pages")
+                        break
+                    # The page probably didn't turn - try turning it again
+                    self._status(f"🔁 Page {page + 1} didn't change, turning again...")
+                else:
+                    repeats = 0
+                    for image, page_hash in zip(grabbed, hashes):
+                        if self.pages is not None and page >= self.pages:
+                            break  # Page count reached half way through a spread
+                        self.page_hashes.append(page_hash)
+                        filename = f"page_{page + 1:03d}.png"  # page_001.png, page_002.png, etc.
+                        filepath = os.path.join(self.save_folder, filename)
+                        writer.submit(page - first_page, image, filepath)
+                        page += 1
+
+                    # No page turn after the last page
+                    if self.pages is not None and page >= self.pages:
+                        break
+
+                with self.timings.measure(STAGE_TURN):
+                    self.turner.turn()
+                with self.timings.measure(STAGE_WAIT):
+                    if self.wait_mode == WAIT_ADAPTIVE:
+                        settled = self._wait_for_new_page(screenshot)
+                    else:
+                        # Wait before taking next screenshot (wakes up early on stop)
+                        self._stop_event.wait(self.delay)
+
+    def _scroll_pages(self, writer, first_page):
+        """The capture loop for scrolling viewers - frames stitched together and cut into pages"""
+        self.stitcher = ScrollStitcher(self.page_height)
+        settled = None
+        repeats = 0  # How many grabs in a row the view didn't move
+        page = first_page
+
+        def save(images):
+            nonlocal page
+            for image in images:
+                if self.pages is not None and page >= self.pages:
+                    return
+                self.page_hashes.append(difference_hash(image))
+                filepath = os.path.join(self.save_folder, f"page_{page + 1:03d}.png")
+                writer.submit(page - first_page, image, filepath)
+                page += 1
+
+        while self.pages is None or page < self.pages:
+            if self._stop_event.is_set():
+                break
+
+            self._status(f"📸 Capturing page {page + 1}...")
+
+            if settled is not None:
+                screenshot = settled
+            else:
+                with self.timings.measure(STAGE_GRAB):
+                    screenshot = self.grabber.grab(self.region)
+
+            with self.timings.measure(STAGE_STITCH):
+                moved, images = self.stitcher.add(screenshot)
+            save(images)
+            if moved == 0:
+                repeats += 1
+                if repeats + 1 >= min(self.end_after or SCROLL_END_FRAMES, SCROLL_END_FRAMES):
+                    self.reached_end = True
+                    self._status(f"🏁 End of document reached after {page} pages")
+                    break
+                self._status("🔁 The view didn't move, scrolling again...")
+            else:
+                repeats = 0
+                if moved is None and self.stitcher.frames > 1:
+                    self._status("⚠️ Scrolled past the last frame - some rows may be missing")
+                if self.pages is not None and page >= self.pages:
+                    break
+
+            with self.timings.measure(STAGE_TURN):
+                self.turner.turn()
+            with self.timings.measure(STAGE_WAIT):
+                if self.wait_mode == WAIT_ADAPTIVE:
+                    settled = self._wait_for_new_page(screenshot)
+                else:
+                    self._stop_event.wait(self.delay)
+
+        # Whatever is left of the strip is the last page
+        save(self.stitcher.flush())
+
+    def _wait_for_new_page(self, previous):
+        """Poll the screen until the page has changed and stopped changing
+
+        Returns the last full size frame so it can be used as the next
+        screenshot, or None if we gave up after self.delay seconds.
+        """
+        deadline = time.monotonic() + self.delay
+        reference = small_gray(previous)
+        changed = False
+        steady = 0
+
+        while not self._stop_event.wait(self.poll_interval):
+            frame = self.grabber.grab(self.region)
+            small = small_gray(frame)
+            difference = frame_difference(small, reference)
+
+            if not changed:
+                # Still showing the old page - wait for it to change
+                changed = difference > self.change_threshold
+                steady = 1 if changed else 0
+            elif difference <= self.change_threshold:
+                steady += 1
+            else:
+                steady = 1  # Still rendering, start counting again
+
+            if changed:
+                if steady >= self.stable_frames:
+                    return frame
+                reference = small
+
+            if time.monotonic() >= deadline:
+                break
+        return None
+
+    def _page_saved(self, index, filepath, key=None):
+        # Called by the writer in page order once the file is on disk
+        if self._journal:
+            self._journal.record_page(len(self.screenshots), filepath,
+                                      self.page_hashes[len(self.screenshots)])
+        self.screenshots.append(filepath)
+        self.throughput.add()
+        self.duplicate_pages = self._writer.duplicates
+        self.duplicate_bytes = self._writer.duplicate_bytes
+        if self._pdf:
+            self._pdf.add_page(filepath, key)
+        if self.on_progress:
+            self.on_progress(len(self.screenshots), self.pages)
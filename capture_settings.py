@@ -0,0 +1,20 @@
+"""Names of the capture and PDF settings the window offers.
+
+They live apart from the modules that act on them (capture_session,
+page_encoding) because those pull in NumPy, Pillow and reportlab - and the
+window needs the names before anything is captured, to fill in its
+choices. Import them from here or from those modules, it's the same.
+"""
+
+# How long to wait after a page turn before taking the next screenshot
+WAIT_FIXED = "fixed"  # Always sleep for the full delay
+WAIT_ADAPTIVE = "adaptive"  # Watch the screen and go as soon as the page settles
+
+# How pages are compressed in the PDF - see page_encoding
+PROFILE_LOSSLESS = "lossless"
+PROFILE_GRAY = "gray"
+PROFILE_BILEVEL = "bilevel"
+PROFILE_JPEG = "jpeg"
+PROFILE_AUTO = "auto"
+COMPRESSION_PROFILES = (PROFILE_LOSSLESS, PROFILE_AUTO, PROFILE_GRAY,
+                        PROFILE_BILEVEL, PROFILE_JPEG)
@@ -0,0 +1,152 @@
+"""Keeps the encoded pages of earlier PDF builds, so a rebuild only encodes what changed.
+
+Decoding and compressing the pages is nearly all the work of "Create PDF
+from Images". Most of the time the folder has only changed a little since
+the last build - a few pages added or captured again - so the encoded
+page streams are kept in a cache folder next to the pages:
+
+    .pdf_cache/index.json     key -> size, last use and image details
+    .pdf_cache/<key>.bin      the compressed pixel data, as the PDF stores it
+
+A page file is known by its path, size and modification time, a page in a
+pack by a hash of its bytes - plus the compression settings, since the
+same page encodes differently for another profile or DPI. A page that was
+replaced gets a new key, and its old entry drops out once the cache goes
+over its size cap (least recently used first).
+"""
+import hashlib
+import json
+import os
+
+from page_encoding import EncodedImage
+from page_store import StoredPage, read_page_bytes
+
+CACHE_NAME = ".pdf_cache"
+INDEX_NAME = "index.json"
+CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB of encoded pages
+
+
+def cache_folder(folder):
+    return os.path.join(folder, CACHE_NAME)
+
+
+def page_key(source, settings):
+    """Cache key of one page (a file path or a StoredPage) encoded with settings"""
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(source, StoredPage):
+        digest.update(b"pack ")
+        digest.update(read_page_bytes(source))
+    else:
+        stat = os.stat(source)
+        digest.update(f"file {os.path.abspath(source)} {stat.st_size} {stat.st_mtime_ns}"
+                      .encode("utf-8"))
+    digest.update(repr(settings).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EncodeCache:
+    """Encoded pages on disk, with least-recently-used eviction past max_bytes
+
+    Only used from one thread. The index is written by save() (or when
+    used as a context manager); a crash before that just loses the entries
+    added since - their .bin files are cleaned up on the next open.
+    """
+
+    def __init__(self, folder, max_bytes=CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+        self._entries = self._load()  # key -> {"bytes", "used", "image"}
+        self._clock = max((entry["used"] for entry in self._entries.values()), default=0)
+        self.total_bytes = sum(entry["bytes"] for entry in self._entries.values())
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.folder, INDEX_NAME), encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+        # Drop entries whose data is gone, and data nobody points to
+        files = {name for name in os.listdir(self.folder) if name.endswith(".bin")}
+        entries = {key: entry for key, entry in entries.items()
+                   if f"{key}.bin" in files
+                   and os.path.getsize(self._data_path(key)) == entry["bytes"]}
+        for name in files - {f"{key}.bin" for key in entries}:
+            os.remove(os.path.join(self.folder, name))
+        return entries
+
+    def _data_path(self, key):
+        return os.path.join(self.folder, f"{key}.bin")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """The cached EncodedImage for key, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        try:
+            with open(self._data_path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            data = b""
+        if len(data) != entry["bytes"]:
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._clock += 1
+        entry["used"] = self._clock
+        self.hits += 1
+        image = entry["image"]
+        return EncodedImage(image["width"], image["height"], image["color_space"],
+                            image["bits"], image["filter"], data,
+                            decode_parms=image["decode_parms"], profile=image["profile"])
+
+    def put(self, key, encoded):
+        """Keep an encoded page, making room by dropping the least recently used ones"""
+        if len(encoded.data) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        path = self._data_path(key)
+        with open(path + ".tmp", "wb") as f:
+            f.write(encoded.data)
+        os.replace(path + ".tmp", path)
+        self._clock += 1
+        self._entries[key] = {"bytes": len(encoded.data), "used": self._clock,
+                              "image": {"width": encoded.width, "height": encoded.height,
+                                        "color_space": encoded.color_space,
+                                        "bits": encoded.bits, "filter": encoded.filter_name,
+                                        "decode_parms": encoded.decode_parms,
+                                        "profile": encoded.profile}}
+        self.total_bytes += len(encoded.data)
+        if self.total_bytes > self.max_bytes:
+            for old in sorted(self._entries, key=lambda k: self._entries[k]["used"]):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self._remove(old)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry["bytes"]
+        try:
+            os.remove(self._data_path(key))
+        except OSError:
+            pass
+
+    def save(self):
+        """Write the index (atomically - a crash leaves the old one)"""
+        path = os.path.join(self.folder, INDEX_NAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(path + ".tmp", path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.save()
@@ -0,0 +1,64 @@
+"""Small, fast image checks used while capturing.
+
+Everything here works on tiny greyscale copies of the screenshots as NumPy
+arrays, so it is cheap enough to run many times per page.
+"""
+import hashlib
+
+import numpy as np
+from PIL import Image
+
+THUMB_WIDTH = 96  # Width of the greyscale copies used for comparing frames
+
+
+def small_gray(image, width=THUMB_WIDTH):
+    """Shrink a screenshot to a small greyscale float array for comparisons"""
+    # reduce() is a fast box filter by a whole factor - good enough here,
+    # and shrinking first means the greyscale conversion touches few pixels
+    factor = max(1, image.width // width)
+    if factor > 1:
+        image = image.reduce(factor)
+    return np.asarray(image.convert("L"), dtype=np.float32)
+
+
+def frame_difference(a, b):
+    """Mean absolute difference (0-255) between two small_gray() arrays"""
+    if a.shape != b.shape:
+        return 255.0
+    return float(np.abs(a - b).mean())
+
+
+def difference_hash(image, hash_size=32):
+    """Perceptual "difference hash" of a screenshot, as an int of hash_size**2 bits
+
+    The image is shrunk to (hash_size + 1) x hash_size greyscale pixels and
+    each bit says whether a pixel is brighter than its right-hand neighbour.
+    Re-grabbing the same page gives the same hash. Pages of text all look
+    alike when shrunk a lot, so the hash is bigger than the usual 8x8 -
+    at 32x32 two different text pages still differ in 100+ bits.
+    """
+    # draft-sized copy first so the final resize only filters a few pixels
+    factor = max(1, image.width // (THUMB_WIDTH * 2))
+    if factor > 1:
+        image = image.reduce(factor)
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hash_distance(a, b):
+    """Number of bits that differ between two difference_hash() values"""
+    return bin(a ^ b).count("1")
+
+
+def content_key(image):
+    """Exact fingerprint of a screenshot's pixels - equal keys mean identical pages
+
+    Unlike difference_hash() this looks at every pixel, so it is only
+    equal for true duplicates (blank pages, repeated separators, double
+    captures), never for two pages that merely look alike.
+    """
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+    digest.update(f"{image.mode} {image.width}x{image.height}".encode("ascii"))
+    return digest.hexdigest()
@@ -0,0 +1,182 @@
+"""Trims viewer chrome and empty margins off the captured pages.
+
+The region picked on screen usually has more in it than the page: the
+viewer's toolbar, a grey background around the page, wide white margins.
+Storing and embedding all of that on every page is wasted space.
+
+find_crop() works out the content box from the brightness spread (standard
+deviation) of every row and column:
+    - a row or column with almost no spread is blank (margin, background)
+    - a band at the edge that is not blank but never changes between pages
+      is viewer chrome, as long as a blank line separates it from the page
+Rows and columns are trimmed in turn until nothing changes, since a grey
+background only looks blank once the toolbar above it is gone.
+
+AutoCrop locks one crop from the first few pages so every page keeps the
+same geometry, and only lets a page have a bigger box of its own when its
+content would otherwise be cut off.
+"""
+import threading
+
+import numpy as np
+
+CROP_SAMPLES = 5  # Pages looked at before the crop is locked
+BLANK_SPREAD = 4.0  # Brightness std dev (0-255) below which a line counts as blank
+STATIC_TOLERANCE = 8  # Max brightness change between pages for "never changes"
+CROP_PADDING = 4  # Pixels of margin left around the content
+
+
+def _gray(image):
+    return np.asarray(image.convert("L"))
+
+
+def _edge(blank, static):
+    """How many lines to trim from the start of a run of rows or columns"""
+    count = len(blank)
+    start = 0
+    # Chrome: lines that are never blank and never change, up to a blank line
+    while start < count and static[start] and not blank[start]:
+        start += 1
+    if start == count or not blank[start]:
+        start = 0  # No blank line after it - could be part of the page, keep it
+    while start < count and blank[start]:
+        start += 1
+    return start
+
+
+def find_crop(grays, padding=CROP_PADDING, blank_spread=BLANK_SPREAD):
+    """Content box (left, top, right, bottom) shared by greyscale pages of the same size
+
+    grays are 2D uint8 arrays. With only one page nothing counts as
+    chrome, so only the blank margins are trimmed.
+    """
+    stack = np.stack(grays)
+    height, width = stack.shape[1:]
+    changes = stack.max(axis=0).astype(np.int16) - stack.min(axis=0)
+    if len(grays) < 2:
+        changes = np.full(changes.shape, 255, dtype=np.int16)
+    left, top, right, bottom = 0, 0, width, height
+
+    while True:
+        area = stack[:, top:bottom, left:right].astype(np.float32)
+        moving = changes[top:bottom, left:right] > STATIC_TOLERANCE
+        # A line is blank only if it is blank on every sample page
+        blank_rows = (area.std(axis=2) < blank_spread).all(axis=0)
+        blank_columns = (area.std(axis=1) < blank_spread).all(axis=0)
+        static_rows = ~moving.any(axis=1)
+        static_columns = ~moving.any(axis=0)
+
+        new_top = top + _edge(blank_rows, static_rows)
+        new_bottom = bottom - _edge(blank_rows[::-1], static_rows[::-1])
+        new_left = left + _edge(blank_columns, static_columns)
+        new_right = right - _edge(blank_columns[::-1], static_columns[::-1])
+        if new_top >= new_bottom or new_left >= new_right:
+            return 0, 0, width, height  # All blank - nothing sensible to crop to
+        if (new_left, new_top, new_right, new_bottom) == (left, top, right, bottom):
+            break
+        left, top, right, bottom = new_left, new_top, new_right, new_bottom
+
+    return (max(0, left - padding), max(0, top - padding),
+            min(width, right + padding), min(height, bottom + padding))
+
+
+def _union(a, b):
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+class AutoCrop:
+    """Crops every page of a capture to one box, locked from the first pages
+
+    add() is called from the encoder threads with every page. Until
+    samples pages have come in they are held back and add() returns
+    nothing; the call that brings in the last sample locks the crop and
+    returns all held pages, cropped. After that each page comes straight
+    back. flush() locks the crop with what it has (short captures) and
+    returns whatever was held back.
+
+    A page that has something new outside the locked crop - a wide
+    picture, say - gets a box that also covers that, so nothing is ever
+    cut off. "New" means different from the first page, so the chrome and
+    margins that were cropped away don't count.
+    """
+
+    def __init__(self, samples=CROP_SAMPLES, padding=CROP_PADDING, box=None, size=None,
+                 on_locked=None):
+        self.samples = samples
+        self.padding = padding
+        self.box = tuple(box) if box else None  # The locked crop, once there is one
+        self.size = tuple(size) if size else None  # Size of the pages the crop was locked for
+        self.on_locked = on_locked  # on_locked(box, size), e.g. to note it in the journal
+        self.pages = 0
+        self.overrides = 0  # Pages that needed a bigger box than the locked one
+        self.pixels_before = 0
+        self.pixels_after = 0
+        self._lock = threading.Lock()
+        self._held = []  # (index, image, context) waiting for the crop
+        self._grays = []
+        self._reference = None  # First page in greyscale, to spot new content outside the box
+
+    @property
+    def pixels_saved(self):
+        return self.pixels_before - self.pixels_after
+
+    def add(self, index, image, context=None):
+        """Hand in one page - returns a list of (index, cropped image, context) ready to save"""
+        with self._lock:
+            locked = self.box is not None
+            if not locked:
+                self._held.append((index, image, context))
+                self._grays.append(_gray(image))
+                if len(self._held) < self.samples:
+                    return []
+                held = self._lock_crop()
+        if locked:
+            return [(index, self._crop(image), context)]
+        return [(i, self._crop(page), c) for i, page, c in held]
+
+    def flush(self):
+        """Lock the crop now if it isn't yet, return the pages that were waiting"""
+        with self._lock:
+            if self.box is not None or not self._held:
+                return []
+            held = self._lock_crop()
+        return [(i, self._crop(page), c) for i, page, c in held]
+
+    def _lock_crop(self):
+        # Pages of a different size (window resized) can't be compared
+        size = self._grays[0].shape
+        grays = [gray for gray in self._grays if gray.shape == size]
+        self.box = find_crop(grays, self.padding)
+        self.size = size[1], size[0]
+        self._reference = grays[0].astype(np.int16)
+        held, self._held, self._grays = self._held, [], []
+        if self.on_locked:
+            self.on_locked(self.box, self.size)
+        return held
+
+    def _crop(self, image):
+        if image.size != self.size:
+            box = (0, 0) + image.size
+        elif self._reference is None:
+            box = self.box  # Crop given up front (resumed capture) - nothing to compare with
+        else:
+            box = self.box
+            left, top, right, bottom = box
+            outside = np.abs(_gray(image) - self._reference) > STATIC_TOLERANCE
+            outside[top:bottom, left:right] = False
+            if outside.any():
+                # Content outside the locked crop - widen the box for this page
+                rows = np.flatnonzero(outside.any(axis=1))
+                columns = np.flatnonzero(outside.any(axis=0))
+                extra = (max(0, columns[0] - self.padding), max(0, rows[0] - self.padding),
+                         min(image.width, columns[-1] + 1 + self.padding),
+                         min(image.height, rows[-1] + 1 + self.padding))
+                box = _union(box, tuple(int(v) for v in extra))
+                with self._lock:
+                    self.overrides += 1
+        cropped = image.crop(box) if box != (0, 0) + image.size else image
+        with self._lock:
+            self.pages += 1
+            self.pixels_before += image.width * image.height
+            self.pixels_after += cropped.width * cropped.height
+        return cropped
@@ -0,0 +1,280 @@
+"""Turns page images into ready-to-embed PDF image streams.
+
+Decoding an image and compressing its pixels is the slow part of building
+a PDF, and it doesn't depend on any other page - so it is done here, in
+plain functions that can run in a pool of worker processes. The PDF side
+only has to copy the finished bytes into the file.
+
+Pages can be stored with different compression profiles:
+    lossless - full colour, Flate (zip) compressed - what a screenshot is
+    gray     - 8-bit greyscale, Flate compressed
+    bilevel  - black and white only, CCITT G4 (fax) or 1-bit Flate
+    jpeg     - full colour JPEG, for photos and illustrations
+    auto     - picks one of the above for each page from its histogram
+
+With a target DPI, pages that have more pixels than the printed page can
+show are scaled down first - a 4K screenshot printed on A4 needs far fewer
+pixels than it has.
+"""
+import hashlib
+import io
+import zlib
+
+import numpy as np
+from PIL import Image, ImageOps, features
+
+from capture_settings import (PROFILE_LOSSLESS, PROFILE_GRAY, PROFILE_BILEVEL,  # noqa: F401
+                              PROFILE_JPEG, PROFILE_AUTO, COMPRESSION_PROFILES)
+from page_store import open_page, read_page_bytes
+
+EXIF_ORIENTATION = 0x0112
+TIFF_PHOTOMETRIC = 262
+TIFF_STRIP_OFFSETS = 273
+TIFF_ROWS_PER_STRIP = 278
+TIFF_STRIP_BYTE_COUNTS = 279
+FLATE_LEVEL = 6  # zlib level - good size/speed balance for screenshots
+JPEG_QUALITY = 85
+A4_POINTS = (210 * (72 / 25.4), 297 * (72 / 25.4))  # Exactly reportlab's A4, in 1/72 inch
+
+# Thresholds for classify_page(), measured on a shrunken copy of the page
+COLOUR_SPREAD = 24  # Max - min of R, G, B above this counts as a coloured pixel
+COLOUR_FRACTION = 0.02  # More coloured pixels than this = colour page
+TEXT_FRACTION = 0.97  # Near-black or near-white pixels needed for a text page
+PHOTO_FRACTION = 0.25  # Mid-tone pixels that make a colour page a photo
+
+
+class EncodedImage:
+    """One page image, already compressed the way the PDF will store it"""
+
+    def __init__(self, width, height, color_space, bits, filter_name, data,
+                 decode_parms=None, profile=PROFILE_LOSSLESS):
+        self.width = width
+        self.height = height
+        self.color_space = color_space  # 'DeviceRGB' or 'DeviceGray'
+        self.bits = bits  # Bits per colour component
+        self.filter_name = filter_name  # 'FlateDecode', 'DCTDecode' or 'CCITTFaxDecode'
+        self.data = data  # The compressed pixel data
+        self.decode_parms = decode_parms  # Extra /DecodeParms for the filter, if any
+        self.profile = profile  # The profile that was used to encode it
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def raw_bytes(self):
+        """Size of the page as uncompressed RGB - the baseline for savings"""
+        return self.width * self.height * 3
+
+    @property
+    def content_key(self):
+        """Hash of the encoded image - pages with equal keys can share one PDF image"""
+        digest = hashlib.blake2b(self.data, digest_size=16)
+        digest.update(f"{self.width}x{self.height} {self.color_space} {self.bits} "
+                      f"{self.filter_name} {self.decode_parms}".encode("ascii"))
+        return digest.hexdigest()
+
+
+def classify_page(img):
+    """Guess the best profile for a page: bilevel, gray, jpeg or lossless
+
+    Colour is checked on a small copy, so it costs a few milliseconds per page.
+    """
+    small = img.convert("RGB")
+    factor = max(1, small.width // 256)
+    if factor > 1:
+        small = small.reduce(factor)
+
+    rgb = np.asarray(small, dtype=np.int16)
+    # A pixel has colour if its channels are far apart (grey has R = G = B)
+    coloured = int(np.count_nonzero(rgb.max(axis=2) - rgb.min(axis=2) > COLOUR_SPREAD))
+    coloured_fraction = coloured / (rgb.shape[0] * rgb.shape[1])
+
+    # Brightness histogram of the full page - shrinking would blur the text
+    # into grey. Histograms are computed in C, so this is still quick.
+    histogram = img.convert("L").histogram()
+    pixels = img.width * img.height
+    extremes = sum(histogram[:64]) + sum(histogram[192:])
+    midtones = pixels - extremes
+
+    if coloured_fraction > COLOUR_FRACTION:
+        return PROFILE_JPEG if midtones > pixels * PHOTO_FRACTION else PROFILE_LOSSLESS
+    if extremes >= pixels * TEXT_FRACTION:
+        return PROFILE_BILEVEL
+    return PROFILE_GRAY
+
+
+def _encode_flate(img):
+    """Flate (zip) compressed pixels of an RGB, L or 1 mode image"""
+    if img.mode == "1":
+        color_space, bits, profile = "DeviceGray", 1, PROFILE_BILEVEL
+    elif img.mode == "L":
+        color_space, bits, profile = "DeviceGray", 8, PROFILE_GRAY
+    else:
+        color_space, bits, profile = "DeviceRGB", 8, PROFILE_LOSSLESS
+    data = zlib.compress(img.tobytes(), FLATE_LEVEL)
+    return EncodedImage(img.width, img.height, color_space, bits, "FlateDecode", data,
+                        profile=profile)
+
+
+def _encode_g4(img):
+    """CCITT Group 4 - the fax compression, made for black and white text"""
+    buffer = io.BytesIO()
+    # One strip for the whole page, so the strip is exactly the PDF stream.
+    # Min-is-white is the fax convention, and what a PDF reader expects.
+    img.save(buffer, "TIFF", compression="group4",
+             tiffinfo={TIFF_ROWS_PER_STRIP: img.height, TIFF_PHOTOMETRIC: 0})
+    buffer.seek(0)
+    with Image.open(buffer) as tiff:
+        offset = tiff.tag_v2[TIFF_STRIP_OFFSETS][0]
+        length = tiff.tag_v2[TIFF_STRIP_BYTE_COUNTS][0]
+    data = buffer.getvalue()[offset:offset + length]
+    decode_parms = {"K": -1, "Columns": img.width, "Rows": img.height}
+    return EncodedImage(img.width, img.height, "DeviceGray", 1, "CCITTFaxDecode", data,
+                        decode_parms=decode_parms, profile=PROFILE_BILEVEL)
+
+
+def to_bilevel(img, threshold=128):
+    """Black and white copy of a page ('1' mode, no dithering)"""
+    return img.convert("L").point(lambda v: 255 if v >= threshold else 0, "1")
+
+
+def target_size(img_width, img_height, pagesize, dpi):
+    """Pixel size an image needs to print at dpi when fitted to the page
+
+    Returns the original size if the image already has few enough pixels.
+    """
+    page_width, page_height = pagesize
+    scale = min(page_width / img_width, page_height / img_height)
+    # Printed width is img_width * scale / 72 inches, so at dpi the image
+    # needs img_width * scale / 72 * dpi pixels across
+    factor = scale / 72 * dpi
+    if factor >= 1:
+        return img_width, img_height
+    return max(1, round(img_width * factor)), max(1, round(img_height * factor))
+
+
+def downsample(img, pagesize, dpi):
+    """Scale a page image down so it has no more than dpi pixels per inch on paper"""
+    size = target_size(img.width, img.height, pagesize, dpi)
+    if size == img.size:
+        return img
+    # reducing_gap shrinks by whole factors first (very fast), then does
+    # the last bit with a proper filter
+    return img.resize(size, Image.BICUBIC, reducing_gap=2.0)
+
+
+def encode_image(img, profile=PROFILE_LOSSLESS, jpeg_quality=JPEG_QUALITY,
+                 target_dpi=None, pagesize=A4_POINTS):
+    """Compress a PIL image's pixels with the given profile
+
+    With target_dpi the image is first scaled down to what pagesize needs.
+    """
+    if target_dpi:
+        img = downsample(img, pagesize, target_dpi)
+
+    if profile == PROFILE_AUTO:
+        profile = classify_page(img)
+
+    if profile == PROFILE_BILEVEL:
+        img = to_bilevel(img)
+        flate = _encode_flate(img)
+        if not features.check("libtiff"):
+            return flate
+        # G4 usually wins on real text, but tiny bitmap fonts can do better
+        # with Flate - both are cheap on a 1-bit image, so keep the smaller
+        g4 = _encode_g4(img)
+        return g4 if len(g4.data) < len(flate.data) else flate
+
+    if profile == PROFILE_GRAY or img.mode in ("1", "I", "I;16", "F", "LA"):
+        img = img.convert("L")  # Greyscale-ish pages stay grey whatever the profile
+    elif img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")  # RGBA, P, CMYK...
+
+    if profile == PROFILE_JPEG:
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=jpeg_quality)
+        color_space = "DeviceGray" if img.mode == "L" else "DeviceRGB"
+        return EncodedImage(img.width, img.height, color_space, 8, "DCTDecode",
+                            buffer.getvalue(), profile=PROFILE_JPEG)
+    return _encode_flate(img)
+
+
+def encode_image_file(path, profile=PROFILE_LOSSLESS, jpeg_quality=JPEG_QUALITY,
+                      target_dpi=None, pagesize=A4_POINTS, auto_rotate=True):
+    """Read an image file (or a StoredPage from a pack) and return it as an EncodedImage
+
+    JPEG files that need no changes are passed through untouched - a PDF
+    can hold JPEG data as-is, and compressing them again only loses more
+    quality. auto_rotate applies the camera's EXIF orientation, which
+    matters for photographed or scanned pages.
+    """
+    with open_page(path) as img:
+        orientation = img.getexif().get(EXIF_ORIENTATION, 1) if auto_rotate else 1
+        is_jpeg = img.format == "JPEG"
+
+        keeps_jpeg = (profile in (PROFILE_LOSSLESS, PROFILE_JPEG, PROFILE_AUTO)
+                      or (profile == PROFILE_GRAY and img.mode == "L"))
+        too_big = bool(target_dpi) and \
+            target_size(img.width, img.height, pagesize, target_dpi) != img.size
+        if is_jpeg and img.mode in ("RGB", "L") and orientation == 1 and keeps_jpeg \
+                and not too_big:
+            data = read_page_bytes(path)
+            color_space = "DeviceGray" if img.mode == "L" else "DeviceRGB"
+            return EncodedImage(img.width, img.height, color_space, 8, "DCTDecode", data,
+                                profile=PROFILE_JPEG)
+
+        if is_jpeg and too_big:
+            # Don't turn a JPEG into a much bigger lossless page, and let the
+            # JPEG decoder do most of the shrinking (much faster)
+            if profile == PROFILE_LOSSLESS:
+                profile = PROFILE_JPEG
+            if orientation == 1:
+                img.draft(img.mode, target_size(img.width, img.height, pagesize, target_dpi))
+
+        if orientation != 1:
+            img = ImageOps.exif_transpose(img)
+        return encode_image(img, profile, jpeg_quality, target_dpi, pagesize)
+
+
+class CompressionReport:
+    """Adds up how much each profile saved compared to uncompressed RGB"""
+
+    def __init__(self):
+        self.profiles = {}  # profile -> [pages, raw bytes, stored bytes]
+        self.shared_pages = 0  # Pages that reuse the image of an identical earlier page
+        self.shared_bytes = 0  # Bytes those pages would have added
+
+    def add(self, encoded):
+        totals = self.profiles.setdefault(encoded.profile, [0, 0, 0])
+        totals[0] += 1
+        totals[1] += encoded.raw_bytes
+        totals[2] += len(encoded.data)
+
+    def add_shared(self, stored_bytes):
+        """Count a page that reuses an image already in the PDF"""
+        self.shared_pages += 1
+        self.shared_bytes += stored_bytes
+
+    @property
+    def stored_bytes(self):
+        return sum(totals[2] for totals in self.profiles.values())
+
+    @property
+    def saved_bytes(self):
+        return sum(totals[1] - totals[2] for totals in self.profiles.values())
+
+    def lines(self):
+        """One human readable line per profile, biggest saving first"""
+        rows = sorted(self.profiles.items(), key=lambda item: item[1][2] - item[1][1])
+        lines = [f"{profile}: {pages} pages, {_megabytes(stored)} "
+                 f"(saved {_megabytes(raw - stored)}, {100 * (raw - stored) / raw:.0f}%)"
+                 for profile, (pages, raw, stored) in rows if raw]
+        if self.shared_pages:
+            lines.append(f"repeated: {self.shared_pages} pages share an image "
+                         f"(saved {_megabytes(self.shared_bytes)})")
+        return lines
+
+
+def _megabytes(count):
+    return f"{count / (1024 * 1024):.1f} MB"
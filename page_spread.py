@@ -0,0 +1,88 @@
+"""Splits a two-page spread into its two pages.
+
+Viewers that show two pages side by side let one grab and one page turn
+cover two pages. The pages are separated at the gutter, found from the
+column profile of a small greyscale copy: the spread of brightness down
+every column. Columns of text or pictures vary a lot, the blank margins
+either side of the fold (or the fold's shadow) hardly at all. The run of
+such quiet columns nearest the middle holds the gutter: at the line or
+shadow the viewer draws for the fold if there is one, else halfway.
+
+Both pages are cut to the same width, centred on the gutter, so they line
+up in the PDF and page_crop can treat them alike.
+"""
+import numpy as np
+
+GUTTER_SEARCH = 0.2  # Look for the gutter this far (of the width) either side of the middle
+GUTTER_TOLERANCE = 2.0  # Brightness std dev above the quietest column that still counts as gutter
+QUIET_SPREAD = 6.0  # No column quieter than this in the search band - no gutter to be seen
+FOLD_CONTRAST = 12.0  # How much darker/lighter than the margins a fold line or shadow is
+PROFILE_WIDTH = 800  # Rough width of the copy the profile is taken from
+
+
+def find_gutter(image, search=GUTTER_SEARCH):
+    """x of the gutter in a spread, and whether it was actually seen
+
+    Returns (x, True) for a clear gutter. If there is no quiet run of
+    columns, or it runs off the search band (a blank page next to the
+    cover, say, where the fold can't be told from the empty page), returns
+    (middle, False).
+    """
+    middle = image.width // 2
+    factor = max(1, image.width // PROFILE_WIDTH)
+    small = image.reduce(factor) if factor > 1 else image
+    gray = np.asarray(small.convert("L"), dtype=np.float32)
+    width = gray.shape[1]
+    start = int(width * (0.5 - search))
+    end = max(start + 1, int(width * (0.5 + search)))
+    band = gray[:, start:end]
+    profile = band.std(axis=0)
+    lowest = float(profile.min())
+    if lowest > QUIET_SPREAD:
+        return middle, False
+
+    quiet = np.concatenate(([False], profile <= lowest + GUTTER_TOLERANCE, [False]))
+    edges = np.flatnonzero(quiet[1:] != quiet[:-1])
+    runs = list(zip(edges[::2], edges[1::2]))  # [first, last + 1) of every quiet run
+    centre = middle / factor - start
+    first, stop = min(runs, key=lambda run: max(run[0] - centre, centre - run[1] + 1, 0))
+    if first == 0 or stop == end - start:
+        return middle, False
+
+    # A fold line or shadow shows up as columns brighter or darker than the margins
+    means = band[:, first:stop].mean(axis=0)
+    contrast = np.abs(means - np.median(means))
+    if contrast.max() > FOLD_CONTRAST:
+        fold = np.flatnonzero(contrast >= contrast.max() - FOLD_CONTRAST / 2)
+        x = (start + first + (fold[0] + fold[-1] + 1) / 2) * factor
+    else:
+        x = (start + (first + stop) / 2) * factor
+    return int(x), True
+
+
+class SpreadSplitter:
+    """Cuts every spread of a capture into pages in reading order
+
+    The gutter is looked for on every spread until it is seen clearly once,
+    then kept for all spreads of the same size so every page comes out the
+    same width. With rtl=True (right-to-left books: Arabic, Hebrew, manga)
+    the right page comes first.
+    """
+
+    def __init__(self, rtl=False):
+        self.rtl = rtl
+        self.gutter = None  # Locked gutter x, once seen
+        self.size = None  # Size of the spreads the gutter was seen on
+
+    def split(self, spread):
+        """The two pages of a spread, in reading order"""
+        if self.gutter is not None and spread.size == self.size:
+            gutter = self.gutter
+        else:
+            gutter, seen = find_gutter(spread)
+            if seen:
+                self.gutter, self.size = gutter, spread.size
+        half = min(gutter, spread.width - gutter)
+        left = spread.crop((gutter - half, 0, gutter, spread.height))
+        right = spread.crop((gutter, 0, gutter + half, spread.height))
+        return [right, left] if self.rtl else [left, right]
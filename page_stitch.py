@@ -0,0 +1,173 @@
+"""Stitches the frames of a scrolling viewer into one long strip, cut into pages.
+
+Some viewers have no pages to turn - the document just scrolls. Every
+frame then shows part of the last one again, shifted up by however far the
+scroll went. To find that shift, each row of a frame is boiled down to a
+short signature (its brightness in a few bands across), and a textured
+band of rows near the bottom of the last frame is looked for among the
+rows of the new one - all positions at once with NumPy. The full overlap
+is checked before a shift is believed.
+
+Only the rows below the overlap are new. They are added to the strip, and
+whenever the strip is a page high a page is cut off it, at a blank row
+near the page height so lines of text are not cut in half. The strip is
+never longer than a page plus a frame, however long the document.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from PIL import Image
+
+SIGNATURE_BANDS = 32  # Brightness values per row signature - enough to tell lines of text apart
+ANCHOR_ROWS = 32  # Height of the band of rows looked for in the next frame
+ANCHOR_PARTS = (12, 6, 3, 2)  # Anchor bands come from the bottom 1/12, 1/6, 1/3, 1/2 of a frame
+TEXTURE_SPREAD = 2.0  # Anchor bands flatter than this (std dev) can't be placed
+MATCH_ERROR = 3.0  # Mean signature difference (0-255) still counted as the same rows
+MATCH_CANDIDATES = 8  # Best anchor positions whose whole overlap is checked
+CUT_SEARCH = 0.08  # Look this far (of the page height) back for a blank row to cut at
+PAGE_RATIO = 297 / 210  # Default page height for a given width - A4
+MIN_PAGE_HEIGHT = 16  # Fewer rows than this leave nothing to search for a cut
+
+
+def row_signatures(image, bands=SIGNATURE_BANDS):
+    """(rows, bands) float array - mean brightness of each row in bands side by side"""
+    gray = np.asarray(image.convert("L"), dtype=np.float32)
+    width = gray.shape[1] // bands * bands
+    return gray[:, :width].reshape(gray.shape[0], bands, -1).mean(axis=2)
+
+
+def _anchors(signatures, rows):
+    """Starts of textured bands of rows to look for, lowest first
+
+    The lower the band, the further a scroll can go and still leave it on
+    screen - so the most textured band of the bottom twelfth comes first,
+    then of the bottom sixth, third and half. Flat bands are no use.
+    """
+    height = len(signatures)
+    if height < rows:
+        return []
+    windows = sliding_window_view(signatures, (rows, signatures.shape[1]))[:, 0]
+    spreads = windows.std(axis=(1, 2))
+    anchors = []
+    for part in ANCHOR_PARTS:
+        first = max(0, height - height // part - rows)
+        best = first + int(spreads[first:].argmax())
+        if spreads[best] > TEXTURE_SPREAD and best not in anchors:
+            anchors.append(best)
+    return anchors
+
+
+def find_shift(previous, current, expected=None):
+    """How many rows the content moved up from one frame to the next
+
+    previous and current are row_signatures() of two frames of the same
+    size. Returns 0 if nothing moved, None if no overlap could be found
+    (scrolled more than a frame, or nothing to go by). If a few shifts fit,
+    the one nearest expected (the last scroll's) wins.
+    """
+    height = len(previous)
+    if len(current) != height:
+        return None
+    if np.array_equal(previous, current):
+        return 0  # Same frame again - the view is at the end (or blank), don't invent a scroll
+    rows = min(ANCHOR_ROWS, height // 4)
+    anchors = _anchors(previous, rows)
+    if not anchors:
+        # Nothing but blank rows - if the new frame is blank too, assume the usual scroll
+        if current.std() <= TEXTURE_SPREAD:
+            return expected
+        return None
+
+    windows = sliding_window_view(current, (rows, current.shape[1]))[:, 0]
+    for start in anchors:
+        errors = np.abs(windows - previous[start:start + rows]).mean(axis=(1, 2))
+        shifts = start - np.arange(len(errors))  # Band found at row p means a shift of start - p
+        best = None
+        for i in np.argsort(errors)[:MATCH_CANDIDATES]:
+            shift = int(shifts[i])
+            if errors[i] > MATCH_ERROR or shift < 0:
+                continue
+            # The whole overlap has to fit, not just the band - best fit wins,
+            # and of two equally good fits the one nearer the last scroll
+            overlap = float(np.abs(previous[shift:] - current[:height - shift]).mean())
+            score = (overlap, abs(shift - expected) if expected is not None else 0)
+            if overlap <= MATCH_ERROR and (best is None or score < best[0]):
+                best = score, shift
+        if best:
+            return best[1]
+    return None
+
+
+def check_page_height(page_height):
+    """ValueError unless page_height is None (A4) or a whole number of at least MIN_PAGE_HEIGHT rows"""
+    if page_height is not None and (not isinstance(page_height, int) or isinstance(page_height, bool)
+                                    or page_height < MIN_PAGE_HEIGHT):
+        raise ValueError(f"page_height must be at least {MIN_PAGE_HEIGHT} rows")
+
+
+class ScrollStitcher:
+    """Turns a stream of scrolled frames into pages of page_height rows
+
+    add(frame) takes the next frame and returns (moved, pages): how many
+    new rows the frame brought (0 if the view didn't move, None if it
+    didn't overlap the last frame and was added whole) and the pages that
+    got completed. flush() returns the last, shorter page. A page_height
+    below MIN_PAGE_HEIGHT is a ValueError.
+    """
+
+    def __init__(self, page_height=None, cut_search=CUT_SEARCH):
+        check_page_height(page_height)
+        self.page_height = page_height  # None - A4 proportions for the frame width
+        self.cut_search = cut_search
+        self.frames = 0
+        self.gaps = 0  # Frames that didn't overlap the one before
+        self.rows = 0  # Rows of the strip so far
+        self._previous = None  # Signatures of the last frame
+        self._expected = None  # Last shift, the likely next one
+        self._strip = None  # RGB rows not cut into pages yet
+
+    def add(self, frame):
+        frame = frame.convert("RGB")
+        signatures = row_signatures(frame)
+        if self.page_height is None:
+            self.page_height = max(MIN_PAGE_HEIGHT, int(frame.width * PAGE_RATIO))
+        shift = None
+        if self._previous is not None and self._previous.shape == signatures.shape:
+            shift = find_shift(self._previous, signatures, self._expected)
+        self._previous = signatures
+        self.frames += 1
+
+        if shift == 0:
+            return 0, []
+        pixels = np.asarray(frame)
+        if shift is None:
+            if self._strip is not None:
+                self.gaps += 1
+            new = pixels
+        else:
+            self._expected = shift
+            new = pixels[len(pixels) - shift:]
+        if self._strip is not None and self._strip.shape[1:] != new.shape[1:]:
+            pages = self.flush()  # Window resized - start a new strip
+        else:
+            pages = []
+        self._strip = new if self._strip is None else np.concatenate((self._strip, new))
+        self.rows += len(new)
+        while len(self._strip) >= self.page_height:
+            pages.append(self._cut())
+        return shift, pages
+
+    def _cut(self):
+        """Cut one page off the top of the strip, at a blank row near the page height"""
+        low = max(1, int(self.page_height * (1 - self.cut_search)))
+        spreads = self._strip[low:self.page_height].std(axis=(1, 2))
+        quiet = np.flatnonzero(spreads <= spreads.min() + 1.0)
+        cut = low + int(quiet[-1]) + 1 if len(quiet) else self.page_height
+        page, self._strip = self._strip[:cut], self._strip[cut:]
+        return Image.fromarray(page)
+
+    def flush(self):
+        """The rest of the strip as a last page - empty list if there is nothing on it"""
+        strip, self._strip = self._strip, None
+        if strip is None or not len(strip) or strip.std() <= TEXTURE_SPREAD:
+            return []
+        return [Image.fromarray(strip)]
@@ -0,0 +1,231 @@
+"""Keeps all the pages of a capture in one container file.
+
+Saving every page as its own page_NNN.png means an open, write and close
+per page - thousands of them for a big book, which gets slow on network
+and synced folders. A PageStore appends the encoded pages (PNG bytes, the
+same as the loose files would hold) to a single pack file instead:
+
+    b"BKPAGES1"                                         file header
+    b"PAGE" index:uint32 length:uint64 crc32:uint32     record header
+    <length bytes of PNG data>                          record data
+    ...
+
+A page that is identical to an earlier one is stored as a b"SAME" record
+instead, whose 16 bytes of data are the offset and length of the earlier
+page's data - so repeated pages take up no space.
+
+The offset index is rebuilt when the pack is opened, by hopping from one
+record header to the next - a record that was only half written when the
+app crashed fails its length or CRC check and is cut off. Reading goes
+through mmap, so the PDF builder can take each page's bytes straight from
+the mapped file.
+"""
+import io
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from PIL import Image
+
+PACK_NAME = "pages.pack"
+PACK_MAGIC = b"BKPAGES1"
+RECORD_MAGIC = b"PAGE"
+SAME_MAGIC = b"SAME"
+RECORD_HEADER = struct.Struct("<4sIQI")  # magic, page index, data length, crc32
+SAME_DATA = struct.Struct("<QQ")  # offset, length of the page data it repeats
+
+
+class StoredPage:
+    """Where one page lives inside a pack file - small, and picklable for worker processes"""
+
+    __slots__ = ("pack_path", "index", "offset", "length")
+
+    def __init__(self, pack_path, index, offset, length):
+        self.pack_path = pack_path
+        self.index = index  # Page number, from 0
+        self.offset = offset  # Start of the page's data in the pack
+        self.length = length
+
+    def __repr__(self):
+        return f"{os.path.basename(self.pack_path)}#{self.index + 1}"
+
+    def __eq__(self, other):
+        return isinstance(other, StoredPage) and \
+            (self.pack_path, self.index, self.offset) == (other.pack_path, other.index, other.offset)
+
+    def __hash__(self):
+        return hash((self.pack_path, self.index, self.offset))
+
+
+# Read-only maps of the pack files, shared by every reader in this process
+_maps = {}
+_maps_lock = threading.Lock()
+
+
+def _mapped(page):
+    end = page.offset + page.length
+    with _maps_lock:
+        mapped = _maps.get(page.pack_path)
+        if mapped is None or len(mapped) < end:
+            # First page from this pack, or the pack has grown since we mapped it
+            with open(page.pack_path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            _maps[page.pack_path] = mapped
+    return mapped
+
+
+def _forget_map(path):
+    # A map must not outlive a truncate (and Windows won't truncate a mapped file)
+    with _maps_lock:
+        mapped = _maps.pop(path, None)
+    if mapped is not None:
+        mapped.close()
+
+
+def read_page_bytes(source):
+    """The encoded bytes of a page - source is a file path or a StoredPage"""
+    if isinstance(source, StoredPage):
+        return _mapped(source)[source.offset:source.offset + source.length]
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def open_page(source):
+    """Image.open() for a file path or a StoredPage"""
+    if isinstance(source, StoredPage):
+        return Image.open(io.BytesIO(read_page_bytes(source)))
+    return Image.open(source)
+
+
+def page_name(source):
+    """Short name of a page for messages"""
+    return repr(source) if isinstance(source, StoredPage) else os.path.basename(source)
+
+
+class PageStore:
+    """An append-only pack of page images
+
+    append() is not thread-safe on its own - the PageWriter only calls it
+    from under its lock, in page order.
+
+    With read_only=True the pack is only looked at: nothing is written,
+    truncated or synced, and the shared maps are left alone - safe to use
+    on a pack that a running capture is still appending to.
+    """
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.pages = []  # StoredPage for every complete record, in page order
+        self._records = []  # Where each page's record starts
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if read_only:
+            self._file = open(path, "rb")
+            if exists:
+                self._load()
+        elif exists:
+            self._file = open(path, "r+b")
+            self._load()
+        else:
+            self._file = open(path, "w+b")
+            self._file.write(PACK_MAGIC)
+            self._file.flush()
+        self._end = self._file.seek(0, os.SEEK_END)
+
+    def _load(self):
+        with mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(PACK_MAGIC)] != PACK_MAGIC:
+                raise ValueError(f"{self.path} is not a page pack")
+            position = len(PACK_MAGIC)
+            while position + RECORD_HEADER.size <= len(data):
+                magic, index, length, crc = RECORD_HEADER.unpack_from(data, position)
+                start = position + RECORD_HEADER.size
+                if magic not in (RECORD_MAGIC, SAME_MAGIC) or index != len(self.pages) \
+                        or start + length > len(data) \
+                        or zlib.crc32(data[start:start + length]) != crc:
+                    break
+                if magic == SAME_MAGIC:
+                    page = StoredPage(self.path, index, *SAME_DATA.unpack_from(data, start))
+                else:
+                    page = StoredPage(self.path, index, start, length)
+                self.pages.append(page)
+                self._records.append(position)
+                position = start + length
+        if self.read_only:
+            return  # A half written record may just be one still being written
+        # Cut off a torn record so new pages go straight after the good ones
+        _forget_map(self.path)
+        self._file.truncate(position)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __iter__(self):
+        return iter(self.pages)
+
+    def __getitem__(self, index):
+        return self.pages[index]
+
+    def _write_record(self, magic, data):
+        self._records.append(self._end)
+        self._file.seek(self._end)
+        self._file.write(RECORD_HEADER.pack(magic, len(self.pages), len(data), zlib.crc32(data)))
+        self._file.write(data)
+        self._file.flush()  # Readers go through their own map of the file
+        start = self._end + RECORD_HEADER.size
+        self._end = start + len(data)
+        return start
+
+    def append(self, data):
+        """Add the encoded bytes of the next page, return its StoredPage"""
+        index = len(self.pages)
+        page = StoredPage(self.path, index, self._write_record(RECORD_MAGIC, data), len(data))
+        self.pages.append(page)
+        return page
+
+    def append_same(self, original):
+        """Add a page identical to the earlier StoredPage original, without storing it again"""
+        index = len(self.pages)
+        self._write_record(SAME_MAGIC, SAME_DATA.pack(original.offset, original.length))
+        page = StoredPage(self.path, index, original.offset, original.length)
+        self.pages.append(page)
+        return page
+
+    def add_image(self, image, format="PNG", **save_options):
+        """Encode a PIL image (PNG by default) and append it"""
+        buffer = io.BytesIO()
+        image.save(buffer, format, **save_options)
+        return self.append(buffer.getvalue())
+
+    def truncate(self, count):
+        """Forget every page from count on - used when resuming a capture"""
+        if count < len(self.pages):
+            self._end = self._records[count]
+            del self.pages[count:]
+            del self._records[count:]
+            _forget_map(self.path)
+            self._file.truncate(self._end)
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            if not self.read_only:
+                self.sync()
+            self._file.close()
+
+
+def pack_path(folder):
+    return os.path.join(folder, PACK_NAME)
+
+
+def open_store(folder):
+    """The PageStore in folder, read-only, or None if the folder has no pack"""
+    path = pack_path(folder)
+    if not os.path.exists(path):
+        return None
+    return PageStore(path, read_only=True)
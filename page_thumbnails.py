@@ -0,0 +1,122 @@
+"""Small previews of the captured pages, made in the background.
+
+A review window with thousands of pages can't decode them all, and can't
+keep a Tk image of every page either. Thumbnails are only asked for the
+pages that are on screen (or about to be), made by a small pool of
+threads, and kept in a bounded least-recently-used cache - scrolling back
+is free, scrolling through a 2000 page book doesn't grow memory.
+
+Decoding is the expensive part, so as little of it as possible is done:
+JPEG pages are decoded straight at 1/2, 1/4 or 1/8 size with draft(), and
+everything else is shrunk with reduce() (a cheap box filter) to near the
+thumbnail size before the proper resize.
+
+Nothing in here touches Tk - the caller turns the finished PIL images into
+ImageTk photos on its own thread (see review_window).
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from page_store import open_page
+
+THUMBNAIL_SIZE = (120, 160)  # Fits a portrait page, in pixels
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_CACHE = 200  # Most thumbnails kept - a few screens' worth
+
+
+def make_thumbnail(source, size=THUMBNAIL_SIZE):
+    """An RGB thumbnail of a page (file path or StoredPage), at most size big"""
+    image = open_page(source)
+    image.draft("RGB", size)  # JPEG only - the other formats ignore it
+    if image.mode not in ("L", "RGB", "RGBA"):
+        image = image.convert("RGB")  # reduce() doesn't do palette or 1-bit images
+    factor = min(image.width // size[0], image.height // size[1])
+    if factor > 1:
+        image = image.reduce(factor)
+    image.thumbnail(size)
+    return image.convert("RGB")
+
+
+class LruCache:
+    """Dictionary that holds at most max_items, dropping the least recently used
+
+    Only used from one thread (the Tk one).
+    """
+
+    def __init__(self, max_items=THUMBNAIL_CACHE):
+        self.max_items = max_items
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+        return item
+
+    def put(self, key, item):
+        self._items[key] = item
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def discard(self, key):
+        self._items.pop(key, None)
+
+
+class ThumbnailLoader:
+    """Makes thumbnails in a thread pool, only for the pages still wanted
+
+    want(sources) says which pages are on screen now, replacing the last
+    call's list - pages that scrolled away before their turn came are
+    skipped, not decoded. on_ready(source, image) is called from a pool
+    thread with each finished thumbnail (image is None if the page can't
+    be read).
+    """
+
+    def __init__(self, on_ready, size=THUMBNAIL_SIZE, workers=THUMBNAIL_WORKERS):
+        self.on_ready = on_ready
+        self.size = size
+        self.made = 0
+        self.skipped = 0  # Requests dropped because the page was no longer wanted
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnails")
+        self._lock = threading.Lock()
+        self._wanted = set()
+        self._pending = set()  # Queued or being made
+
+    def want(self, sources):
+        """Ask for thumbnails of sources (in the order given), forget about the rest"""
+        with self._lock:
+            self._wanted = set(sources)
+            new = [source for source in sources if source not in self._pending]
+            self._pending.update(new)
+        for source in new:
+            self._pool.submit(self._make, source)
+
+    def _make(self, source):
+        with self._lock:
+            wanted = source in self._wanted
+            if not wanted:
+                self._pending.discard(source)
+                self.skipped += 1
+        if not wanted:
+            return
+        try:
+            image = make_thumbnail(source, self.size)
+        except Exception:
+            image = None  # Deleted or broken page - shown as such, not worth stopping for
+        with self._lock:
+            self._pending.discard(source)
+            self.made += 1
+        self.on_ready(source, image)
+
+    def close(self):
+        with self._lock:
+            self._wanted = set()
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,216 @@
+"""Saves captured pages to disk in the background.
+
+PNG compression of a big screen region can take longer than the page turn
+itself, so the capture loop hands every grab to a PageWriter and carries on
+straight away. A small pool of threads does the encoding (Pillow releases
+the GIL while compressing, so threads really do run in parallel).
+
+Pages go to separate files, or with a page_store.PageStore all into one
+pack file - encoded in parallel all the same, then appended in page order.
+
+With dedup on, a page whose pixels are identical to an earlier page's is
+not encoded again: it becomes a hard link to the earlier file, or a
+"same as" record in the pack.
+
+A page_crop.AutoCrop can trim the pages in the same threads, just before
+they are encoded.
+"""
+import io
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from page_analysis import content_key
+from stage_timings import STAGE_ENCODE, STAGE_WRITE
+
+
+class PageWriter:
+    """Bounded pool of background encoders that finishes pages in page order
+
+    submit() blocks once max_pending pages are waiting to be written, so a
+    slow disk slows the capture down instead of filling up memory with
+    screenshots. on_saved(index, path, key) is called for each page in page
+    order, even though the pages may finish encoding out of order - key is
+    the page's content_key(), or None without dedup. It runs outside the
+    writer's lock, so a slow on_saved (a full PDF queue) doesn't hold up
+    the other encoders.
+
+    With store set the filepath given to submit() is ignored, and path is
+    the StoredPage of the page in the store. With cropper set the first few
+    pages wait in it until the crop is locked. With timings (a
+    stage_timings.StageTimings) the encode and write time of every page is
+    recorded.
+    """
+
+    def __init__(self, workers=2, max_pending=8, on_saved=None, store=None, dedup=False,
+                 cropper=None, timings=None):
+        self.on_saved = on_saved
+        self.store = store
+        self.dedup = dedup
+        self.cropper = cropper
+        self.timings = timings
+        self.paths = []  # Saved file paths (or StoredPages), in page order
+        self.duplicates = 0  # Pages saved as a repeat of an earlier page
+        self.duplicate_bytes = 0  # Disk space that saved
+        self._pool = ThreadPoolExecutor(max_workers=workers,
+                                        thread_name_prefix="page-writer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._finished = {}  # index -> (data or path, filepath, key) waiting on an earlier page
+        self._saved = deque()  # (index, path, key) released but not yet passed to on_saved
+        self._delivering = threading.Lock()  # Held by the one thread calling on_saved
+        self._first = {}  # content key -> first page index that had it
+        self._released = {}  # content key -> index of the saved page that has it
+        self._next_index = 0
+        self._error = None
+
+    def submit(self, index, image, filepath, **save_options):
+        """Queue one page for saving; index must count up from 0 without gaps"""
+        self._raise_error()
+        self._slots.acquire()  # Backpressure - wait here if too much is pending
+        try:
+            future = self._pool.submit(self._save, index, image, filepath, save_options)
+        except BaseException:
+            self._slots.release()
+            raise
+        return future
+
+    def _save(self, index, image, filepath, save_options):
+        try:
+            key = None
+            if self.dedup:
+                key = content_key(image)
+                with self._lock:
+                    first = self._first.setdefault(key, index)
+                if first < index:
+                    # An earlier page has the same pixels - nothing to encode
+                    self._complete(index, None, filepath, key)
+                    return
+            if self.cropper is None:
+                ready = [(index, image, (filepath, key, save_options))]
+            else:
+                ready = self.cropper.add(index, image, (filepath, key, save_options))
+            self._encode_ready(ready)
+        except Exception as e:
+            with self._lock:
+                if self._error is None:
+                    self._error = e
+            raise
+        finally:
+            self._slots.release()
+
+    def _encode_ready(self, ready):
+        for index, image, (filepath, key, save_options) in ready:
+            self._complete(index, self._encode(image, filepath, save_options), filepath, key)
+
+    def _record(self, stage, start):
+        if self.timings is not None:
+            self.timings.record(stage, time.perf_counter() - start)
+
+    def _encode(self, image, filepath, save_options):
+        # Encode to memory first, so compressing and writing can be timed apart
+        start = time.perf_counter()
+        if "format" not in save_options:
+            extension = os.path.splitext(filepath)[1].lower() if self.store is None else ""
+            save_options = dict(save_options,
+                                format=Image.registered_extensions().get(extension, "PNG"))
+        buffer = io.BytesIO()
+        image.save(buffer, **save_options)
+        data = buffer.getvalue()
+        self._record(STAGE_ENCODE, start)
+        if self.store is not None:
+            return data  # _complete() appends it to the store in page order
+
+        start = time.perf_counter()
+        if os.path.exists(filepath) and os.stat(filepath).st_nlink > 1:
+            # Left over from an earlier deduplicated capture - writing
+            # into it would change the page it is linked to as well
+            os.remove(filepath)
+        with open(filepath, "wb") as f:
+            f.write(data)
+        self._record(STAGE_WRITE, start)
+        return filepath
+
+    def _complete(self, index, result, filepath, key):
+        # Release pages strictly in order, so paths never has holes in it
+        with self._lock:
+            self._finished[index] = (result, filepath, key)
+            while self._next_index in self._finished:
+                result, filepath, key = self._finished.pop(self._next_index)
+                original = self._released.get(key) if key is not None else None
+                try:
+                    if original is not None:
+                        path = self._save_same(self.paths[original], filepath)
+                    elif self.store is not None:
+                        start = time.perf_counter()
+                        path = self.store.append(result)
+                        self._record(STAGE_WRITE, start)
+                    else:
+                        path = result
+                except Exception as e:
+                    self._error = self._error or e
+                    break
+                if key is not None:
+                    self._released.setdefault(key, self._next_index)
+                self.paths.append(path)
+                if self.on_saved:
+                    self._saved.append((self._next_index, path, key))
+                self._next_index += 1
+        self._deliver()
+
+    def _deliver(self):
+        # One thread at a time calls on_saved, in the order the pages were
+        # released. Anyone who finds it busy leaves their pages to it - the
+        # check after letting go catches pages added just before that
+        while self._saved:
+            if not self._delivering.acquire(blocking=False):
+                return
+            try:
+                while self._saved:
+                    self.on_saved(*self._saved.popleft())
+            finally:
+                self._delivering.release()
+
+    def _save_same(self, original, filepath):
+        """Save a page that repeats the already saved page at original"""
+        self.duplicates += 1
+        if self.store is not None:
+            self.duplicate_bytes += original.length
+            return self.store.append_same(original)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        try:
+            os.link(original, filepath)  # Same file under a second name - no extra space
+            self.duplicate_bytes += os.path.getsize(original)
+        except OSError:
+            shutil.copyfile(original, filepath)  # No hard links here (FAT, some network drives)
+        return filepath
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _finish(self):
+        self._pool.shutdown(wait=True)
+        if self.cropper is not None and self._error is None:
+            # Fewer pages than the cropper wanted to see - save the ones it kept
+            self._encode_ready(self.cropper.flush())
+
+    def close(self):
+        """Wait for every queued page to be written, then shut the pool down"""
+        self._finish()
+        self._raise_error()
+        return self.paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._finish()
+        if exc[0] is None:
+            self._raise_error()
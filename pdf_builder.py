@@ -0,0 +1,282 @@
+"""Builds the PDF page by page while the capture is still running.
+
+Instead of opening every screenshot again once the capture is over, a
+PdfSink adds each page as soon as it has been written to disk. When the
+last page is in, only the final save is left to do.
+
+build_pdf() does the same for a folder of existing images, with the slow
+decode/compress work spread over a pool of processes - and with an
+encode_cache.EncodeCache, only for the pages that changed since last time.
+
+By default pages go through pdf_writer.PdfWriter, which writes them to the
+file as it goes so memory use doesn't grow with the page count. The older
+reportlab Canvas route is still there as writer="reportlab" (in
+canvas_writer, so reportlab is only imported when it is used).
+"""
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from page_encoding import (encode_image_file, CompressionReport, EncodedImage,
+                           PROFILE_LOSSLESS, JPEG_QUALITY, A4_POINTS)
+from encode_cache import page_key
+from page_store import open_store, page_name
+from pdf_writer import PdfAppender, PdfWriter
+from stage_timings import STAGE_PDF
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+
+def fit_to_page(img_width, img_height, page_width, page_height):
+    """Scale an image to fit the page and center it - returns x, y, width, height"""
+    # Use smaller scale so image fits
+    scale = min(page_width / img_width, page_height / img_height)
+    scaled_width = img_width * scale
+    scaled_height = img_height * scale
+    x = (page_width - scaled_width) / 2
+    y = (page_height - scaled_height) / 2
+    return x, y, scaled_width, scaled_height
+
+
+def natural_key(name):
+    """Sort key that orders numbers by value: page_999.png before page_1000.png"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+def find_images(folder):
+    """All image files directly inside folder, in page order (one directory scan)"""
+    with os.scandir(folder) as entries:
+        image_files = [(natural_key(entry.name), entry.path) for entry in entries
+                       if entry.is_file()
+                       and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS]
+    # page_001.png before page_002.png, and page_999.png before page_1000.png
+    image_files.sort()
+    return [path for _, path in image_files]
+
+
+def find_pages(folder):
+    """The pages of a capture folder - from its page pack if it has one, else the image files"""
+    store = open_store(folder)
+    if store is None:
+        return find_images(folder)
+    store.close()
+    return list(store.pages)
+
+
+def _canvas_writer(pdf_path, pagesize):
+    # Imported here - reportlab is slow to import and only this writer needs it
+    from canvas_writer import CanvasPdfWriter
+    return CanvasPdfWriter(pdf_path, pagesize)
+
+
+# The PDF writers PdfSink can use, by name
+PDF_WRITERS = {
+    "stream": PdfWriter,
+    "reportlab": _canvas_writer,
+}
+
+
+class PdfSink:
+    """Adds pages to a PDF in the background, one image per page
+
+    add_page() and add_encoded() only queue the page, so they are safe (and
+    cheap) to call from the capture thread. close() waits for the queued
+    pages and saves the PDF - if the capture was stopped early you still
+    get a valid PDF with every page captured so far.
+
+    The queue is bounded, so a producer that is faster than the disk waits
+    instead of piling encoded pages up in memory.
+
+    Image files are encoded with the given compression profile (see
+    page_encoding), and report adds up how many bytes each profile saved.
+    With target_dpi they are also scaled down to what the page needs.
+
+    Pages with the same content share one image in the PDF. The key that
+    tells which pages are the same is the key passed to add_page() (the
+    capture uses page_analysis.content_key, so repeats aren't even
+    encoded), or else EncodedImage.content_key.
+
+    With timings (a stage_timings.StageTimings) the time each page takes to
+    go into the PDF, encoding included, is recorded as pdf_append.
+
+    With the stream writer, on_written(item, checkpoint) is called from the
+    sink's thread after every page is in the file - item counts the
+    add_page()/add_encoded() calls from 0 (first_item when resuming), and
+    checkpoint is PdfWriter.checkpoint() data. resume_state reopens an
+    unfinished PDF, see PdfWriter.
+
+    With append=True the pages are added after the pages of the existing
+    PDF at pdf_path, as an incremental update (see PdfAppender) - the old
+    pages are not read or written again. Stream writer only, and an
+    incremental update can't be resumed - so no on_written or resume_state.
+    """
+
+    def __init__(self, pdf_path, pagesize=A4_POINTS, writer="stream", max_queued=16,
+                 profile=PROFILE_LOSSLESS, jpeg_quality=JPEG_QUALITY, target_dpi=None,
+                 on_written=None, resume_state=None, first_item=0, timings=None,
+                 append=False):
+        self.pdf_path = pdf_path
+        self.pagesize = pagesize
+        self.profile = profile
+        self.jpeg_quality = jpeg_quality
+        self.target_dpi = target_dpi
+        self.on_written = on_written
+        self.timings = timings
+        self.skipped = []  # Image files that could not be added
+        self.report = CompressionReport()
+        self.append = append
+        if append:
+            if writer != "stream":
+                raise ValueError("Only the stream writer can add pages to an existing PDF")
+            if on_written or resume_state:
+                raise ValueError("Adding pages to an existing PDF can't be resumed")
+            self._writer = PdfAppender(pdf_path, pagesize)
+        elif resume_state:
+            self._writer = PdfWriter(pdf_path, pagesize, resume_state)
+        else:
+            self._writer = PDF_WRITERS[writer](pdf_path, pagesize)
+        self._next_item = first_item
+        self._images = {}  # content key -> (image id or name, width, height, stored bytes)
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = threading.Thread(target=self._run, name="pdf-sink")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def pages(self):
+        """Pages added to the PDF so far"""
+        return self._writer.pages
+
+    def add_page(self, image_path, key=None):
+        """Queue one image file (or StoredPage) to become the next page"""
+        self._queue.put((image_path, key))
+
+    def add_encoded(self, encoded):
+        """Queue an image that was already run through page_encoding"""
+        self._queue.put((encoded, None))
+
+    def _run(self):
+        page_width, page_height = self.pagesize
+        while True:
+            entry = self._queue.get()
+            if entry is None:  # close() was called
+                return
+            item, key = entry
+            item_number = self._next_item
+            self._next_item += 1
+            start = time.perf_counter()
+            try:
+                first_id = self._writer.next_id if self.on_written else None
+                image = self._images.get(key) if key is not None else None
+                if image is None:
+                    if not isinstance(item, EncodedImage):
+                        item = encode_image_file(item, self.profile, self.jpeg_quality,
+                                                 self.target_dpi, self.pagesize)
+                    key = key if key is not None else item.content_key
+                    image = self._images.get(key)
+                if image is None:
+                    image = (self._writer.add_image(item), item.width, item.height, len(item.data))
+                    self._images[key] = image
+                    self.report.add(item)
+                else:
+                    self.report.add_shared(image[3])  # Repeat of an earlier page
+                image_id, image_width, image_height, _ = image
+                x, y, width, height = fit_to_page(image_width, image_height, page_width, page_height)
+                self._writer.add_page(image_id, x, y, width, height)
+                if self.on_written:
+                    self.on_written(item_number, self._writer.checkpoint(first_id))
+                if self.timings is not None:
+                    self.timings.record(STAGE_PDF, time.perf_counter() - start)
+            except Exception as e:
+                print(f"Error processing {item}: {e}")
+                self.skipped.append(item)
+
+    def close(self):
+        """Wait for the queued pages, then save the PDF - returns the page count
+
+        No file is left behind if no page made it into the PDF.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        pages = self._writer.close()
+        if not pages and not self.append and os.path.exists(self.pdf_path):
+            os.remove(self.pdf_path)
+        return pages
+
+
+def build_pdf(image_paths, pdf_path, workers=None, on_progress=None, writer="stream",
+              profile=PROFILE_LOSSLESS, jpeg_quality=JPEG_QUALITY, target_dpi=None,
+              cache=None, append=False):
+    """Build a PDF from image files, encoding them in parallel processes
+
+    Pages are written in the order of image_paths. Only a few pages per
+    worker are in flight at any time, so memory stays small for big
+    folders. on_progress(done, total) is called from this thread after
+    each page. Returns the sink, which knows the page count and the
+    images that had to be skipped.
+
+    With cache (an encode_cache.EncodeCache) pages encoded by an earlier
+    build with the same settings are taken from it instead of being
+    encoded again, and newly encoded pages are added to it.
+
+    With append=True the pages are added to the end of the existing PDF
+    at pdf_path instead of starting a new one.
+    """
+    workers = workers or os.cpu_count() or 1
+    total = len(image_paths)
+    sink = PdfSink(pdf_path, writer=writer, profile=profile, jpeg_quality=jpeg_quality,
+                   target_dpi=target_dpi, append=append)
+    encode = partial(encode_image_file, profile=profile, jpeg_quality=jpeg_quality,
+                     target_dpi=target_dpi, pagesize=sink.pagesize)
+    settings = (profile, jpeg_quality, target_dpi, tuple(sink.pagesize))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()  # (path, cache key, future or cached EncodedImage), in page order
+            paths = iter(image_paths)
+
+            def submit_next():
+                path = next(paths, None)
+                if path is None:
+                    return
+                key = cached = None
+                if cache is not None:
+                    try:
+                        key = page_key(path, settings)
+                    except OSError:
+                        pass  # Gone already - the encoder will report it
+                    else:
+                        cached = cache.get(key)
+                pending.append((path, key, cached or pool.submit(encode, path)))
+
+            for _ in range(workers * 4):
+                submit_next()
+
+            done = 0
+            while pending:
+                path, key, job = pending.popleft()
+                submit_next()  # Keep the pool busy while we wait for this page
+                try:
+                    if isinstance(job, EncodedImage):
+                        encoded = job
+                    else:
+                        encoded = job.result()
+                        if key is not None:
+                            try:
+                                cache.put(key, encoded)
+                            except OSError as e:
+                                print(f"Could not cache {page_name(path)}: {e}")
+                    sink.add_encoded(encoded)
+                except Exception as e:
+                    print(f"Error processing {path}: {e}")
+                    sink.skipped.append(path)
+                done += 1
+                if on_progress:
+                    on_progress(done, total)
+    finally:
+        sink.close()
+    return sink
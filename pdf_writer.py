@@ -0,0 +1,367 @@
+"""A small PDF writer that streams every page straight to the file.
+
+reportlab's Canvas keeps the whole document in memory until save(), which
+is a problem for books with a thousand high resolution pages. This writer
+only supports what the tool needs - one image per page - but writes each
+image, content stream and page object to disk as soon as it is added. All
+it remembers per page is a couple of integers: the file offsets for the
+cross-reference table and the page object numbers for the page tree.
+
+PdfAppender adds pages to a PDF that is already finished, as an
+incremental update: the new objects, the page tree object with the new
+pages added to it and a new cross-reference section go after the end of
+the file, and nothing before it is touched or read apart from the
+trailer, the catalog and the page tree object.
+"""
+import re
+
+CATALOG_ID = 1  # Object numbers reserved up front - both are written in close()
+PAGES_ID = 2
+
+
+def _number(value):
+    """Format a number for PDF without needless decimals"""
+    text = f"{value:.3f}".rstrip("0").rstrip(".")
+    return text if text not in ("", "-0") else "0"
+
+
+def _dictionary(values):
+    """Format a dict of numbers as a PDF dictionary"""
+    items = " ".join(f"/{key} {value}" for key, value in values.items())
+    return f"<< {items} >>"
+
+
+class PdfWriter:
+    """Writes a PDF with one centred image per page, keeping almost nothing in memory
+
+    Usage: writer.add_image_page(encoded, x, y, width, height) for each
+    page, then writer.close(). Until close() has run the file is not a
+    valid PDF yet - but with the checkpoint() data an unfinished file can
+    be reopened and completed (see resume_state).
+    """
+
+    def __init__(self, pdf_path, pagesize, resume_state=None):
+        self.pdf_path = pdf_path
+        self.pagesize = pagesize
+        if resume_state:
+            # Carry on with a file that was never closed, e.g. after a crash.
+            # Anything written after the last checkpoint is thrown away.
+            offsets, page_ids, end = resume_state
+            self._file = open(pdf_path, "r+b")
+            self._file.truncate(end)
+            self._file.seek(end)
+            self._offset = end
+            self._offsets = list(offsets)
+            self._page_ids = list(page_ids)
+            self.pages = len(self._page_ids)
+            self._pages_ref = f"{PAGES_ID} 0 R"
+            return
+
+        self.pages = 0
+        self._pages_ref = f"{PAGES_ID} 0 R"
+        self._file = open(pdf_path, "wb")
+        self._offset = 0
+        self._offsets = [0, 0, 0]  # Index = object number, 0 is the free entry
+        self._page_ids = []
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self._file.write(data)
+        self._offset += len(data)
+
+    def _new_id(self):
+        self._offsets.append(0)
+        return len(self._offsets) - 1
+
+    def _begin_object(self, object_id):
+        self._offsets[object_id] = self._offset
+        self._write(f"{object_id} 0 obj\n".encode("ascii"))
+
+    def _write_object(self, object_id, body):
+        self._begin_object(object_id)
+        self._write(body.encode("ascii") + b"\nendobj\n")
+
+    def _write_stream(self, object_id, dictionary, data):
+        self._begin_object(object_id)
+        self._write(f"<< {dictionary} /Length {len(data)} >>\nstream\n".encode("ascii"))
+        self._write(data)
+        self._write(b"\nendstream\nendobj\n")
+
+    def add_image(self, encoded):
+        """Write an image XObject and return its object number"""
+        image_id = self._new_id()
+        dictionary = (f"/Type /XObject /Subtype /Image"
+                      f" /Width {encoded.width} /Height {encoded.height}"
+                      f" /ColorSpace /{encoded.color_space}"
+                      f" /BitsPerComponent {encoded.bits}"
+                      f" /Filter /{encoded.filter_name}")
+        if encoded.decode_parms:
+            dictionary += f" /DecodeParms {_dictionary(encoded.decode_parms)}"
+        self._write_stream(image_id, dictionary, encoded.data)
+        return image_id
+
+    def add_page(self, image_id, x, y, width, height):
+        """Add a page that draws an already written image into the given box"""
+        page_width, page_height = self.pagesize
+        content = (f"q {_number(width)} 0 0 {_number(height)} {_number(x)} {_number(y)} cm"
+                   f" /Im0 Do Q").encode("ascii")
+        content_id = self._new_id()
+        self._write_stream(content_id, "", content)
+
+        page_id = self._new_id()
+        self._write_object(page_id,
+                           f"<< /Type /Page /Parent {self._pages_ref}"
+                           f" /MediaBox [0 0 {_number(page_width)} {_number(page_height)}]"
+                           f" /Resources << /XObject << /Im0 {image_id} 0 R >> >>"
+                           f" /Contents {content_id} 0 R >>")
+        self._page_ids.append(page_id)
+        self.pages += 1
+        return page_id
+
+    def add_image_page(self, encoded, x, y, width, height):
+        """Write an image and a page showing it in one go"""
+        return self.add_page(self.add_image(encoded), x, y, width, height)
+
+    @property
+    def next_id(self):
+        """Object number the next object will get"""
+        return len(self._offsets)
+
+    def checkpoint(self, first_id):
+        """What was written since object first_id, for picking the file up again later
+
+        Returns the new objects as [object number, offset] pairs, the last
+        page's object number and the current end of the file. Collected in
+        order, these give the resume_state for a new PdfWriter.
+        """
+        self._file.flush()  # So the file really is that long if we crash now
+        return {"objects": [[object_id, self._offsets[object_id]]
+                            for object_id in range(first_id, len(self._offsets))],
+                "page": self._page_ids[-1] if self._page_ids else None,
+                "end": self._offset}
+
+    def close(self):
+        """Write the page tree, cross-reference table and trailer, then close the file"""
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {self.pages} >>")
+        self._write_object(CATALOG_ID, f"<< /Type /Catalog /Pages {PAGES_ID} 0 R >>")
+
+        xref_offset = self._offset
+        lines = [f"xref\n0 {len(self._offsets)}\n", "0000000000 65535 f \n"]
+        lines.extend(f"{offset:010d} 00000 n \n" for offset in self._offsets[1:])
+        lines.append(f"trailer\n<< /Size {len(self._offsets)} /Root {CATALOG_ID} 0 R >>\n"
+                     f"startxref\n{xref_offset}\n%%EOF\n")
+        self._write("".join(lines).encode("ascii"))
+        self._file.close()
+        return self.pages
+
+
+def _find(pattern, text, what):
+    match = re.search(pattern, text)
+    if match is None:
+        raise ValueError(f"Can't add pages to this PDF - no {what} found")
+    return match
+
+
+def _dictionary_text(data, start):
+    """The << ... >> dictionary starting at data[start], nested ones included"""
+    depth = 0
+    for bracket in re.finditer(rb"<<|>>", data[start:]):
+        depth += 1 if bracket.group(0) == b"<<" else -1
+        if depth == 0:
+            return data[start:start + bracket.end()].decode("latin-1")
+    raise ValueError("Can't add pages to this PDF - a dictionary is cut off")
+
+
+class PdfAppender(PdfWriter):
+    """Adds pages to the end of an existing PDF as an incremental update
+
+    Same interface as PdfWriter. The existing pages stay where they are;
+    close() writes the page tree with the new pages added, then a
+    cross-reference section for just the new objects, pointing back to
+    the old one with /Prev. The work is proportional to the new pages
+    (and the length of the page list), not the size of the file.
+
+    Only PDFs with classic cross-reference tables can be appended to -
+    which includes every PDF this tool writes. For others (compressed
+    cross-reference streams, encrypted files) a ValueError is raised
+    straight away.
+    """
+
+    def __init__(self, pdf_path, pagesize):
+        self.pdf_path = pdf_path
+        self.pagesize = pagesize
+        self.pages = 0  # Pages added by this appender
+        self._file = open(pdf_path, "r+b")
+        try:
+            self._read_existing()
+        except BaseException:
+            self._file.close()
+            raise
+        self._file.seek(0, 2)
+        self._offset = self._file.tell()
+        self._new_offsets = {}  # object number -> offset of the objects written here
+        self._page_ids = []
+
+    def _read_existing(self):
+        f = self._file
+        f.seek(0, 2)
+        end = f.tell()
+        f.seek(max(0, end - 1024))
+        tail = f.read()
+        position = tail.rfind(b"startxref")
+        if position < 0:
+            raise ValueError("Can't add pages to this PDF - it has no startxref")
+        self._previous_xref = int(_find(rb"startxref\s+(\d+)", tail[position:],
+                                        "cross-reference offset").group(1))
+
+        trailer = self._read_xref(self._previous_xref, ())[1]
+        if "/Encrypt" in trailer:
+            raise ValueError("Can't add pages to an encrypted PDF")
+        self._size = int(_find(r"/Size\s+(\d+)", trailer, "/Size").group(1))
+        root = _find(r"/Root\s+(\d+)\s+(\d+)\s+R", trailer, "/Root")
+        self._root_ref = f"{root.group(1)} {root.group(2)} R"
+        self._trailer_extra = ""
+        info = re.search(r"/Info\s+\d+\s+\d+\s+R", trailer)
+        if info:
+            self._trailer_extra += " " + info.group(0)
+        file_id = re.search(r"/ID\s*\[[^\]]*\]", trailer)
+        if file_id:
+            self._trailer_extra += " " + file_id.group(0)
+
+        catalog = self._read_object(int(root.group(1)))[1]
+        pages = _find(r"/Pages\s+(\d+)\s+(\d+)\s+R", catalog, "page tree")
+        self._pages_id = int(pages.group(1))
+        self._pages_ref = f"{pages.group(1)} {pages.group(2)} R"
+        self._pages_generation, self._pages_body = self._read_object(self._pages_id)
+        if not re.search(r"/Kids\s*\[", self._pages_body):
+            raise ValueError("Can't add pages to this PDF - its page list is not inline")
+        self.pages_before = int(_find(r"/Count\s+(\d+)", self._pages_body, "page count").group(1))
+
+    def _read_xref(self, offset, wanted):
+        """Look up objects in the cross-reference sections from offset back
+
+        Returns ({object number: (offset, generation)} for the wanted
+        objects, the newest trailer dictionary). Only the subsection
+        headers are read - entries are 20 bytes, so each wanted entry is
+        read directly.
+        """
+        f = self._file
+        found = {}
+        newest = None
+        seen = set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            f.seek(offset)
+            chunk = f.read(64)
+            if not chunk.startswith(b"xref"):
+                raise ValueError("Can't add pages to this PDF - it uses a compressed "
+                                 "cross-reference stream")
+            position = offset + 4
+            while True:
+                f.seek(position)
+                chunk = f.read(64)
+                header = re.match(rb"\s*(\d+)\s+(\d+)[ \t]*(\r\n|\n|\r)", chunk)
+                if header is None:
+                    break
+                first, count = int(header.group(1)), int(header.group(2))
+                entries = position + header.end()
+                for object_id in wanted:
+                    if first <= object_id < first + count and object_id not in found:
+                        f.seek(entries + (object_id - first) * 20)
+                        entry = f.read(20).split()
+                        if len(entry) >= 3 and entry[2] == b"n":
+                            found[object_id] = int(entry[0]), int(entry[1])
+                position = entries + count * 20
+            f.seek(position)
+            chunk = f.read(4096)
+            start = chunk.find(b"trailer")
+            if start < 0:
+                raise ValueError("Can't add pages to this PDF - a trailer is missing")
+            trailer = _dictionary_text(chunk, chunk.index(b"<<", start))
+            if newest is None:
+                newest = trailer
+            previous = re.search(r"/Prev\s+(\d+)", trailer)
+            offset = int(previous.group(1)) if previous else None
+            if all(object_id in found for object_id in wanted):
+                break
+        return found, newest
+
+    def _read_object(self, object_id):
+        """(generation, dictionary text) of an object without a stream"""
+        found = self._read_xref(self._previous_xref, (object_id,))[0]
+        if object_id not in found:
+            raise ValueError(f"Can't add pages to this PDF - object {object_id} is missing")
+        offset, generation = found[object_id]
+        f = self._file
+        f.seek(offset)
+        data = b""
+        while b"endobj" not in data:
+            more = f.read(65536)
+            if not more:
+                raise ValueError(f"Can't add pages to this PDF - object {object_id} is cut off")
+            data += more
+        if not re.match(rb"\s*%d\s+%d\s+obj" % (object_id, generation), data):
+            raise ValueError(f"Can't add pages to this PDF - object {object_id} is not "
+                             f"where the cross-reference table says")
+        return generation, _dictionary_text(data, data.index(b"<<"))
+
+    def _new_id(self):
+        if not self._new_offsets:
+            # First thing written - the update starts on a line of its own
+            self._file.seek(self._offset - 1)
+            if self._file.read(1) not in b"\r\n":
+                self._write(b"\n")
+        object_id = self._size + len(self._new_offsets)
+        self._new_offsets[object_id] = 0
+        return object_id
+
+    def _begin_object(self, object_id):
+        self._new_offsets[object_id] = self._offset
+        self._write(f"{object_id} 0 obj\n".encode("ascii"))
+
+    @property
+    def next_id(self):
+        return self._size + len(self._new_offsets)
+
+    def close(self):
+        """Write the new page tree, cross-reference section and trailer"""
+        if not self._page_ids:
+            self._file.close()  # Nothing added - leave the file exactly as it was
+            return 0
+        # The same page tree object, with the new pages added to the end of its list
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        body = re.sub(r"/Kids\s*\[(.*?)\]", lambda match: f"/Kids [{match.group(1).strip()} {kids}]",
+                      self._pages_body, count=1, flags=re.S)
+        body = re.sub(r"/Count\s+\d+", f"/Count {self.pages_before + self.pages}", body, count=1)
+        pages_offset = self._offset
+        self._write(f"{self._pages_id} {self._pages_generation} obj\n".encode("ascii")
+                    + body.encode("latin-1") + b"\nendobj\n")
+
+        xref_offset = self._offset
+        # Object 0 (head of the free list) first - some readers expect every
+        # section to start there
+        lines = ["xref\n",
+                 "0 1\n",
+                 "0000000000 65535 f \n",
+                 f"{self._pages_id} 1\n",
+                 f"{pages_offset:010d} {self._pages_generation:05d} n \n",
+                 f"{self._size} {self.next_id - self._size}\n"]
+        lines.extend(f"{self._new_offsets[object_id]:010d} 00000 n \n"
+                     for object_id in range(self._size, self.next_id))
+        lines.append(f"trailer\n<< /Size {self.next_id} /Root {self._root_ref}"
+                     f" /Prev {self._previous_xref}{self._trailer_extra} >>\n"
+                     f"startxref\n{xref_offset}\n%%EOF\n")
+        self._write("".join(lines).encode("ascii"))
+        self._file.close()
+        return self.pages
+
+
+def pdf_page_count(pdf_path):
+    """Pages in a PDF that PdfAppender can add to, or None if it can't"""
+    try:
+        appender = PdfAppender(pdf_path, (0, 0))
+    except (OSError, ValueError):
+        return None
+    appender.close()  # Nothing added, so the file is left as it was
+    return appender.pages_before
@@ -0,0 +1,229 @@
+"""A window to look through the captured pages and fix the bad ones.
+
+Shows a scrollable grid of thumbnails of the pages, and keeps up with a
+capture that is still running. Click a page to select it, then delete it
+or capture it again - before the PDF is built from the pages.
+
+Only the rows on screen are drawn: the canvas items are thrown away and
+recreated for the visible range on every scroll, so a 2000 page book costs
+the same to scroll through as a 20 page one. Thumbnails come from a
+page_thumbnails.ThumbnailLoader, and their Tk photos are kept in a bounded
+LRU cache.
+"""
+import tkinter as tk
+from tkinter import messagebox
+
+from page_thumbnails import LruCache, ThumbnailLoader, THUMBNAIL_SIZE
+
+CELL_PADDING = 10
+CELL_WIDTH = THUMBNAIL_SIZE[0] + 2 * CELL_PADDING
+CELL_HEIGHT = THUMBNAIL_SIZE[1] + 2 * CELL_PADDING + 16  # Room for the page number
+PREFETCH_SCREENS = 1  # Thumbnails made ahead of the scroll, in screens
+
+
+class ReviewWindow:
+    """Thumbnail grid of pages, with delete / recapture / build PDF buttons
+
+    pages is the list of page files (or StoredPages). The window doesn't
+    change anything itself - on_delete(index), on_recapture(index) and
+    on_build_pdf() do the work, then hand the new list back with
+    set_pages() or a changed page with refresh(). events is the app's
+    ui_events.UiEventPump, which brings finished thumbnails over to the
+    Tk thread. With follow=True the grid starts at the newest page and
+    stays there as pages come in, until the user scrolls up.
+    """
+
+    def __init__(self, root, events, pages, colors, on_delete, on_recapture, on_build_pdf,
+                 on_close=None, follow=False):
+        self.events = events
+        self.colors = colors
+        self.on_delete = on_delete
+        self.on_recapture = on_recapture
+        self.on_build_pdf = on_build_pdf
+        self.on_close = on_close
+        self.pages = list(pages)
+        self.selected = None
+        self.photos = LruCache()  # source -> ImageTk.PhotoImage
+        self.broken = set()  # Pages that couldn't be read
+        self.loader = ThumbnailLoader(self._thumbnail_ready)
+        self.closed = False
+        self._redraw_job = None
+        self._follow = follow  # Keep the newest pages in view while they come in
+
+        self.window = tk.Toplevel(root)
+        self.window.title("🖼️ Review Pages")
+        self.window.geometry("780x640")
+        self.window.configure(bg=colors['bg'])
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        # Page count and the buttons along the top
+        toolbar = tk.Frame(self.window, bg=colors['surface'])
+        toolbar.pack(fill=tk.X)
+        self.count_var = tk.StringVar()
+        tk.Label(toolbar, textvariable=self.count_var, font=('Segoe UI', 9),
+                 bg=colors['surface'], fg=colors['text_muted']).pack(side=tk.LEFT, padx=15, pady=10)
+        for text, command in (("📄 Build PDF", self._build_pdf),
+                              ("📸 Recapture Page", self._recapture),
+                              ("🗑️ Delete Page", self._delete)):
+            tk.Button(toolbar, text=text, font=('Segoe UI', 9), bg=colors['surface'],
+                      fg=colors['primary'], relief='solid', bd=1, padx=12, pady=4,
+                      cursor='hand2', command=command).pack(side=tk.RIGHT, padx=(0, 10), pady=8)
+
+        # The grid - a canvas that only ever holds the cells on screen
+        grid = tk.Frame(self.window, bg=colors['bg'])
+        grid.pack(fill=tk.BOTH, expand=True)
+        self.scrollbar = tk.Scrollbar(grid, orient=tk.VERTICAL, command=self._yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas = tk.Canvas(grid, bg=colors['bg'], highlightthickness=0,
+                                yscrollcommand=self.scrollbar.set,
+                                yscrollincrement=CELL_HEIGHT // 4)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind('<Configure>', lambda e: self.schedule_redraw())
+        self.canvas.bind('<Button-1>', self._on_click)
+        self.canvas.bind('<MouseWheel>', lambda e: self._scroll(-3 if e.delta > 0 else 3))
+        self.canvas.bind('<Button-4>', lambda e: self._scroll(-3))  # Linux wheel up
+        self.canvas.bind('<Button-5>', lambda e: self._scroll(3))
+        self.window.bind('<Delete>', lambda e: self._delete())
+        self.window.bind('<Left>', lambda e: self._move_selection(-1))
+        self.window.bind('<Right>', lambda e: self._move_selection(1))
+        self.set_pages(self.pages)
+
+    def set_pages(self, pages):
+        """Show a new page list - the capture got further, or a page was deleted"""
+        self.pages = list(pages)
+        if self.selected is not None and self.selected >= len(self.pages):
+            self.selected = len(self.pages) - 1 if self.pages else None
+        self.count_var.set(f"{len(self.pages)} pages • click a page to select it")
+        self.schedule_redraw()
+
+    def refresh(self, source):
+        """A page's image changed (recaptured) - make its thumbnail again"""
+        self.photos.discard(source)
+        self.broken.discard(source)
+        self.schedule_redraw()
+
+    def schedule_redraw(self):
+        # Many changes in a row (thumbnails arriving, fast scrolling) make one redraw
+        if self._redraw_job is None and not self.closed:
+            self._redraw_job = self.window.after_idle(self._redraw)
+
+    def _columns(self):
+        return max(1, self.canvas.winfo_width() // CELL_WIDTH)
+
+    def _redraw(self):
+        self._redraw_job = None
+        if self.closed:
+            return
+        columns = self._columns()
+        height = max(1, self.canvas.winfo_height())
+        rows = -(-len(self.pages) // columns)
+        self.canvas.configure(scrollregion=(0, 0, columns * CELL_WIDTH,
+                                            max(rows * CELL_HEIGHT, height)))
+        if self._follow:
+            self.canvas.yview_moveto(1.0)
+
+        top = int(self.canvas.canvasy(0))
+        first = top // CELL_HEIGHT * columns
+        last = min(len(self.pages), (top + height) // CELL_HEIGHT * columns + columns)
+        self.canvas.delete("cell")
+        for index in range(first, last):
+            self._draw_cell(index, columns)
+
+        # What's on screen first, then the next screen down
+        ahead = min(len(self.pages), last + (last - first) * PREFETCH_SCREENS)
+        self.loader.want([source for source in self.pages[first:ahead]
+                          if source not in self.photos and source not in self.broken])
+
+    def _draw_cell(self, index, columns):
+        row, column = divmod(index, columns)
+        x = column * CELL_WIDTH + CELL_PADDING
+        y = row * CELL_HEIGHT + CELL_PADDING
+        width, height = THUMBNAIL_SIZE
+        source = self.pages[index]
+        photo = self.photos.get(source)
+        if photo is not None:
+            self.canvas.create_image(x + width // 2, y + height // 2, image=photo, tags="cell")
+        else:
+            self.canvas.create_rectangle(x, y, x + width, y + height, fill=self.colors['border'],
+                                         outline="", tags="cell")
+            if source in self.broken:
+                self.canvas.create_text(x + width // 2, y + height // 2, text="⚠️ Can't read",
+                                        fill=self.colors['danger'], tags="cell")
+        if index == self.selected:
+            self.canvas.create_rectangle(x - 4, y - 4, x + width + 4, y + height + 4,
+                                         outline=self.colors['primary'], width=3, tags="cell")
+        self.canvas.create_text(x + width // 2, y + height + 10, text=str(index + 1),
+                                font=('Segoe UI', 8), fill=self.colors['text_muted'], tags="cell")
+
+    def _thumbnail_ready(self, source, image):
+        # Called from a loader thread - ImageTk needs the Tk thread
+        self.events.call(self._add_thumbnail, source, image)
+
+    def _add_thumbnail(self, source, image):
+        if self.closed:
+            return
+        if image is None:
+            self.broken.add(source)
+        else:
+            # Imported here - only the review window needs Pillow's Tk bindings
+            from PIL import ImageTk
+            self.photos.put(source, ImageTk.PhotoImage(image))
+        self.schedule_redraw()
+
+    def _yview(self, *args):
+        self.canvas.yview(*args)
+        self._scrolled()
+
+    def _scroll(self, units):
+        self.canvas.yview_scroll(units, "units")
+        self._scrolled()
+
+    def _scrolled(self):
+        # Scrolled to the bottom - follow new pages again, else stay put
+        self._follow = self.canvas.yview()[1] >= 1.0
+        self.schedule_redraw()
+
+    def _on_click(self, event):
+        column = int(self.canvas.canvasx(event.x)) // CELL_WIDTH
+        row = int(self.canvas.canvasy(event.y)) // CELL_HEIGHT
+        index = row * self._columns() + column
+        if column < self._columns() and index < len(self.pages):
+            self.selected = index
+            self.schedule_redraw()
+        self.window.focus_set()
+
+    def _move_selection(self, step):
+        if self.pages:
+            current = self.selected if self.selected is not None else -step
+            self.selected = min(len(self.pages) - 1, max(0, current + step))
+            self.schedule_redraw()
+
+    def _selection(self):
+        if self.selected is None:
+            messagebox.showinfo("Review Pages", "Click a page first", parent=self.window)
+        return self.selected
+
+    def _delete(self):
+        index = self._selection()
+        if index is not None and messagebox.askyesno(
+                "Delete Page", f"Leave page {index + 1} out of the book?", parent=self.window):
+            self.on_delete(index)
+
+    def _recapture(self):
+        index = self._selection()
+        if index is not None:
+            self.on_recapture(index)
+
+    def _build_pdf(self):
+        self.on_build_pdf()
+
+    def close(self):
+        self.closed = True
+        if self._redraw_job is not None:
+            self.window.after_cancel(self._redraw_job)
+            self._redraw_job = None
+        self.loader.close()
+        self.window.destroy()
+        if self.on_close:
+            self.on_close()
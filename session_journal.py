@@ -0,0 +1,231 @@
+"""Crash-safe record of a capture, kept in the save folder next to the pages.
+
+The first line of session.jsonl holds the settings the capture was started
+with, and every page that is safely on disk adds a line of its own (page
+number, file, size, hash, time). The file is only ever appended to, and
+it is flushed and fsynced every few pages - so if the app crashes at page
+400, or the pyautogui failsafe fires, the journal still knows which pages
+made it and the capture can be resumed from the last one.
+
+While a PDF is built during the capture, the journal also notes where each
+PDF page ends in the file. A resumed capture reopens that unfinished PDF
+and carries on, instead of encoding every page into a new one.
+"""
+import json
+import os
+import threading
+import time
+
+from page_store import StoredPage
+
+JOURNAL_NAME = "session.jsonl"
+SYNC_RECORDS = 10  # fsync after this many new lines...
+SYNC_SECONDS = 2.0  # ...or once the last fsync is this old
+
+
+def journal_path(folder):
+    return os.path.join(folder, JOURNAL_NAME)
+
+
+class SessionJournal:
+    """Append-only journal of one capture, fsynced in batches
+
+    The record_* methods can be called from any thread. Pass resume (a
+    SavedSession) to keep writing to the journal of an earlier capture.
+    """
+
+    def __init__(self, folder, settings=None, resume=None,
+                 sync_records=SYNC_RECORDS, sync_seconds=SYNC_SECONDS):
+        self.path = journal_path(folder)
+        self.sync_records = sync_records
+        self.sync_seconds = sync_seconds
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        if resume is not None:
+            # Drop a half written last line before appending to it
+            self._file = open(self.path, "r+b")
+            self._file.truncate(resume.valid_bytes)
+            self._file.seek(resume.valid_bytes)
+            self._append({"type": "resume", "time": time.time(), "pages": len(resume.pages)})
+        else:
+            self._file = open(self.path, "wb")
+            self._append({"type": "session", "time": time.time(), "settings": settings or {}})
+        self.sync()
+
+    def _append(self, record):
+        # Flushing every line is cheap and survives an app crash; the
+        # fsync that also survives a power cut is what gets batched
+        self._file.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+        self._file.flush()
+        self._unsynced += 1
+
+    def _record(self, record):
+        with self._lock:
+            self._append(record)
+            if self._unsynced >= self.sync_records or \
+                    time.monotonic() - self._last_sync >= self.sync_seconds:
+                self._sync()
+
+    def record_page(self, index, filepath, page_hash):
+        """Note that page index (from 0) is completely written to filepath
+
+        filepath can also be a StoredPage, for pages kept in a page pack.
+        """
+        record = {"type": "page", "index": index}
+        if isinstance(filepath, StoredPage):
+            record.update(file=os.path.basename(filepath.pack_path),
+                          offset=filepath.offset, bytes=filepath.length)
+        else:
+            record.update(file=os.path.basename(filepath), bytes=os.path.getsize(filepath))
+        record.update(hash=f"{page_hash:x}", time=time.time())
+        self._record(record)
+
+    def record_pdf(self, item, checkpoint):
+        """Note that PDF page item (from 0) is in the file - PdfSink's on_written"""
+        record = {"type": "pdf", "item": item}
+        record.update(checkpoint)
+        self._record(record)
+
+    def record_crop(self, box, size):
+        """Note the crop that the pages are trimmed to - AutoCrop's on_locked"""
+        self._record({"type": "crop", "box": list(box), "size": list(size)})
+
+    def finish(self, **details):
+        """Note that the capture ended normally (not a crash)"""
+        record = {"type": "end", "time": time.time()}
+        record.update(details)
+        self._record(record)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """Force everything recorded so far onto the disk"""
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+
+class SavedSession:
+    """What the journal in a folder says about an earlier capture
+
+    Only pages that are really there are trusted: the list stops at the
+    first page whose file is missing or has the wrong size, since the
+    capture has to carry on from a page without gaps before it.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.settings = {}
+        self.pages = []  # {"index", "file", "bytes", "hash", ...}, in page order
+        self.pdf = []  # "pdf" records - the PDF pages that made it into the file
+        self.finished = None  # The "end" record, or None if the capture crashed
+        self.crop = None  # The "crop" record, if the pages were auto-cropped
+        self.valid_bytes = 0  # Length of the journal up to the last complete line
+
+        with open(journal_path(folder), "rb") as f:
+            data = f.read()
+
+        missing_page = False
+        position = 0
+        while True:
+            end = data.find(b"\n", position)
+            if end < 0:
+                break  # Unfinished line from a crash - ignore it
+            try:
+                record = json.loads(data[position:end].decode("utf-8"))
+            except ValueError:
+                break
+            position = end + 1
+            self.valid_bytes = position
+
+            kind = record.get("type")
+            if kind == "session":
+                self.settings = record.get("settings", {})
+            elif kind == "page" and not missing_page:
+                if record["index"] == len(self.pages) and self._page_on_disk(record):
+                    self.pages.append(record)
+                else:
+                    missing_page = True
+            elif kind == "pdf":
+                if record["item"] == len(self.pdf):
+                    self.pdf.append(record)
+            elif kind == "crop":
+                self.crop = record
+            elif kind == "end":
+                self.finished = record
+            elif kind == "resume":
+                self.finished = None
+
+    def _page_on_disk(self, record):
+        path = os.path.join(self.folder, record["file"])
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        if "offset" in record:  # A page inside a page pack
+            return size >= record["offset"] + record["bytes"]
+        return size == record["bytes"]
+
+    @property
+    def paths(self):
+        """Full paths (or StoredPages) of the saved pages, in page order"""
+        paths = []
+        for record in self.pages:
+            path = os.path.join(self.folder, record["file"])
+            if "offset" in record:
+                path = StoredPage(path, record["index"], record["offset"], record["bytes"])
+            paths.append(path)
+        return paths
+
+    @property
+    def hashes(self):
+        return [int(record["hash"], 16) for record in self.pages]
+
+    def pdf_resume_state(self, pdf_path):
+        """PdfWriter resume_state for the unfinished PDF, or None if it can't be reused
+
+        The PDF must still be at least as long as the journal says, and
+        the last recorded page must start where the journal says it does.
+        Pages past the last saved screenshot are not used.
+        """
+        records = self.pdf[:len(self.pages)]
+        if not records or not all(record["objects"] for record in records):
+            return None
+        last = records[-1]
+        first_id, first_offset = last["objects"][0]
+        try:
+            if os.path.getsize(pdf_path) < last["end"]:
+                return None
+            with open(pdf_path, "rb") as f:
+                f.seek(first_offset)
+                if not f.read(32).startswith(f"{first_id} 0 obj".encode("ascii")):
+                    return None
+        except OSError:
+            return None
+
+        offsets = [0, 0, 0]
+        for record in records:
+            for object_id, offset in record["objects"]:
+                while len(offsets) <= object_id:
+                    offsets.append(0)
+                offsets[object_id] = offset
+        page_ids = [record["page"] for record in records]
+        return offsets, page_ids, last["end"]
+
+
+def load_session(folder):
+    """The SavedSession in folder, or None if there is no journal there"""
+    if not os.path.exists(journal_path(folder)):
+        return None
+    return SavedSession(folder)
@@ -0,0 +1,179 @@
+"""Where the time of a capture goes - grab, encode, write, turn, wait, PDF, stitch.
+
+Every stage of every page records its duration into a small histogram:
+a count per power-of-two time bucket (split in 4 for a bit more detail),
+plus count, total, min and max. Recording is a couple of arithmetic
+operations under a lock, so it can stay on in the hot path, and memory
+doesn't grow with the page count.
+
+At the end of a capture the histograms can be written out as JSON or CSV.
+ThroughputMeter gives the live pages/min and time left for the status panel.
+"""
+import csv
+import json
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+STAGE_GRAB = "grab"  # Taking the screenshot
+STAGE_ENCODE = "encode"  # Compressing the page (PNG)
+STAGE_WRITE = "write"  # Putting the encoded page on disk
+STAGE_TURN = "turn"  # Pressing the key / clicking next page
+STAGE_WAIT = "wait"  # Waiting for the next page to show up
+STAGE_PDF = "pdf_append"  # Adding the page to the PDF
+STAGE_STITCH = "stitch"  # Matching a scrolled frame to the last one (scroll capture)
+STAGES = (STAGE_GRAB, STAGE_ENCODE, STAGE_WRITE, STAGE_TURN, STAGE_WAIT, STAGE_PDF,
+          STAGE_STITCH)
+
+BUCKETS_PER_OCTAVE = 4
+PERCENTILES = (50, 90, 99)
+
+
+def _bucket(seconds):
+    """Histogram bucket of a duration - 4 buckets per doubling, from 1 microsecond up"""
+    mantissa, exponent = math.frexp(max(seconds * 1e6, 1.0))
+    return (exponent - 1) * BUCKETS_PER_OCTAVE + int((mantissa - 0.5) * 2 * BUCKETS_PER_OCTAVE)
+
+
+def _bucket_limit(bucket):
+    """Upper end of a bucket, in seconds"""
+    octave, step = divmod(bucket + 1, BUCKETS_PER_OCTAVE)
+    return 2 ** octave * (1 + step / BUCKETS_PER_OCTAVE) / 1e6
+
+
+class StageHistogram:
+    """Durations of one stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = {}  # bucket -> count
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+        bucket = _bucket(seconds)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        """Roughly the duration that percent of the samples stayed under"""
+        if not self.count:
+            return 0.0
+        wanted = self.count * percent / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= wanted:
+                return min(_bucket_limit(bucket), self.max)
+        return self.max
+
+    def summary(self):
+        summary = {"stage": self.name, "count": self.count, "total_s": round(self.total, 6),
+                   "mean_ms": round(self.mean * 1000, 3),
+                   "min_ms": round((self.min or 0) * 1000, 3),
+                   "max_ms": round((self.max or 0) * 1000, 3)}
+        for percent in PERCENTILES:
+            summary[f"p{percent}_ms"] = round(self.percentile(percent) * 1000, 3)
+        return summary
+
+
+class StageTimings:
+    """A StageHistogram per stage, safe to record into from any thread
+
+    Either wrap the work: with timings.measure(STAGE_GRAB): ...
+    or pass a duration you already have to record().
+    """
+
+    def __init__(self, stages=STAGES):
+        self.stages = {name: StageHistogram(name) for name in stages}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = StageHistogram(stage)
+            histogram.add(seconds)
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def summary(self):
+        """One dict per stage: count, total and mean/min/max/percentiles in ms"""
+        with self._lock:
+            return [histogram.summary() for histogram in self.stages.values()]
+
+    def medians_text(self, stages):
+        """Median time of each stage that has samples: 'turn 3.1 ms, wait 142 ms'"""
+        with self._lock:
+            parts = [f"{name} {self.stages[name].percentile(50) * 1000:.3g} ms" for name in stages
+                     if name in self.stages and self.stages[name].count]
+        return ", ".join(parts)
+
+    def to_json(self, path):
+        with self._lock:
+            data = {"started": self.started,
+                    "stages": {name: dict(histogram.summary(),
+                                          buckets_ms={f"{_bucket_limit(b) * 1000:.4g}": n
+                                                      for b, n in sorted(histogram.buckets.items())})
+                               for name, histogram in self.stages.items()}}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+
+    def to_csv(self, path):
+        rows = self.summary()
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+class ThroughputMeter:
+    """Live pages per minute over the last few pages, and the time left"""
+
+    def __init__(self, window=20):
+        self._times = deque(maxlen=window)
+
+    def add(self):
+        """Call once per finished page"""
+        self._times.append(time.monotonic())
+
+    @property
+    def pages_per_minute(self):
+        if len(self._times) < 2:
+            return 0.0
+        elapsed = self._times[-1] - self._times[0]
+        return 60 * (len(self._times) - 1) / elapsed if elapsed > 0 else 0.0
+
+    def eta(self, remaining):
+        """Seconds until remaining more pages are done, or None if unknown"""
+        rate = self.pages_per_minute
+        if remaining is None or not rate:
+            return None
+        return remaining * 60 / rate
+
+
+def format_duration(seconds):
+    """3725 -> '1:02:05', 65 -> '1:05'"""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
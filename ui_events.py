@@ -0,0 +1,73 @@
+"""Hands updates from worker threads to the Tk window, a few times per second.
+
+Tk objects may only be touched from the thread that runs mainloop(). Worker
+threads (the capture, the PDF builder) therefore never call Tk themselves:
+they post events to a UiEventPump, and a root.after() timer on the Tk side
+drains them.
+
+Progress and status updates come in much faster than anyone can read
+them, so those are merged - for each key only the newest update is kept
+until the next refresh. That caps the redraws at max_rate per second,
+however fast the pages go.
+"""
+import itertools
+import sys
+import threading
+
+
+class UiEventPump:
+    """Thread-safe queue of UI updates, applied on the Tk thread by a root.after timer
+
+    latest(key, func, *args) - an update where only the newest one matters
+                               (status text, progress); older ones with the
+                               same key are dropped
+    call(func, *args)        - an event that must happen, in order (capture
+                               finished, show a message box)
+    Both can be called from any thread. Events run in the order they were
+    posted; a merged update takes the place of its newest post. One that
+    raises is reported through Tk's report_callback_exception, and the
+    rest of the batch still runs.
+    """
+
+    def __init__(self, root, max_rate=10):
+        self.root = root
+        self.interval = max(1, int(1000 / max_rate))  # ms between refreshes
+        self.refreshes = 0  # How many times the pump found something to do
+        self._lock = threading.Lock()
+        self._order = itertools.count()
+        self._latest = {}  # key -> (order, func, args)
+        self._calls = []  # (order, func, args)
+        self._job = None
+        self._schedule()
+
+    def latest(self, key, func, *args):
+        with self._lock:
+            self._latest[key] = (next(self._order), func, args)
+
+    def call(self, func, *args):
+        with self._lock:
+            self._calls.append((next(self._order), func, args))
+
+    def _schedule(self):
+        self._job = self.root.after(self.interval, self._pump)
+
+    def _pump(self):
+        with self._lock:
+            events = self._calls + list(self._latest.values())
+            self._calls = []
+            self._latest = {}
+        try:
+            if events:
+                self.refreshes += 1
+            for _, func, args in sorted(events, key=lambda event: event[0]):
+                try:
+                    func(*args)
+                except Exception:
+                    self.root.report_callback_exception(*sys.exc_info())
+        finally:
+            self._schedule()
+
+    def stop(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
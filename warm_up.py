@@ -0,0 +1,46 @@
+"""Imports the slow modules in the background once the window is up.
+
+The window itself only needs tkinter. NumPy, Pillow, reportlab and
+pyautogui are imported where they are first used - which would make the
+first click on Start (or Create PDF) wait for them instead. So right after
+the window is shown, a background thread imports them while the user is
+still picking a folder and a region. Importing a module another thread is
+already importing just waits for it, so it doesn't matter who gets there
+first.
+"""
+import importlib
+import threading
+import time
+
+# Slowest first: what a capture or a PDF build needs
+WARM_UP_MODULES = ("capture_session", "encode_cache", "pyautogui", "canvas_writer",
+                   "PIL.ImageTk")
+
+
+def import_modules(modules=WARM_UP_MODULES):
+    """Import modules, return (seconds taken, names that couldn't be imported)"""
+    start = time.perf_counter()
+    failed = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            # Not installed, or no display for pyautogui - whoever uses it gets the error
+            failed.append(name)
+    return time.perf_counter() - start, failed
+
+
+def warm_up(modules=WARM_UP_MODULES, on_done=None):
+    """Import modules in a background thread, return the thread
+
+    on_done(seconds, failed) is called from that thread when it's finished.
+    """
+    def run():
+        result = import_modules(modules)
+        if on_done:
+            on_done(*result)
+
+    thread = threading.Thread(target=run, name="warm-up")
+    thread.daemon = True
+    thread.start()
+    return thread
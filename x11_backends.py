@@ -0,0 +1,519 @@
+"""Fast native backends for Linux/X11, talking to Xlib directly through ctypes.
+
+pyautogui grabs the screen through pyscreeze, which on Linux may start a
+`scrot` process or grab the whole screen and crop it - for every page. The
+XShmGrabber here keeps one connection to the X server open and copies just
+the capture region into a shared memory segment with XShmGetImage, which
+is about as fast as grabbing the screen gets.
+
+Page turns have the same problem: every pyautogui call sleeps
+pyautogui.PAUSE afterwards, and on Linux goes through python-xlib. The
+XTestTurner sends its key and mouse events with the XTest extension over
+one connection that stays open, and doesn't sleep at all.
+
+Only needs libX11, libXext and libXtst (present on any X11 desktop, and
+in Xvfb).
+"""
+import ctypes
+import ctypes.util
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from backends import GrabBackend, PageTurner, MOUSE_BUTTONS, format_turn_steps, \
+    parse_turn_steps
+
+Z_PIXMAP = 2
+ALL_PLANES = ctypes.c_ulong(-1).value
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+NO_SYMBOL = 0
+SCROLL_UP_BUTTON = 4
+SCROLL_DOWN_BUTTON = 5
+
+# pyautogui key names that aren't X keysym names already
+X_KEYSYMS = {
+    "right": "Right", "left": "Left", "up": "Up", "down": "Down",
+    "pagedown": "Next", "pgdn": "Next", "pageup": "Prior", "pgup": "Prior",
+    "enter": "Return", "return": "Return", "space": "space", "tab": "Tab",
+    "esc": "Escape", "escape": "Escape", "home": "Home", "end": "End",
+    "backspace": "BackSpace", "delete": "Delete", "del": "Delete", "insert": "Insert",
+    "ctrl": "Control_L", "ctrlleft": "Control_L", "ctrlright": "Control_R",
+    "shift": "Shift_L", "shiftleft": "Shift_L", "shiftright": "Shift_R",
+    "alt": "Alt_L", "altleft": "Alt_L", "altright": "Alt_R",
+    "win": "Super_L", "winleft": "Super_L", "winright": "Super_R", "super": "Super_L",
+    **{f"f{number}": f"F{number}" for number in range(1, 25)},
+}
+
+
+class XImage(ctypes.Structure):
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+        ("red_mask", ctypes.c_ulong),
+        ("green_mask", ctypes.c_ulong),
+        ("blue_mask", ctypes.c_ulong),
+        ("obdata", ctypes.c_void_p),
+        ("funcs", ctypes.c_void_p * 6),
+    ]
+
+
+class XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+class XErrorEvent(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("display", ctypes.c_void_p),
+        ("resourceid", ctypes.c_ulong),
+        ("serial", ctypes.c_ulong),
+        ("error_code", ctypes.c_ubyte),
+        ("request_code", ctypes.c_ubyte),
+        ("minor_code", ctypes.c_ubyte),
+    ]
+
+
+X_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XErrorEvent))
+
+_libraries = {}
+
+
+def _load(name):
+    """Load a shared library once, raising OSError if it isn't installed"""
+    if name not in _libraries:
+        path = ctypes.util.find_library(name)
+        if not path:
+            raise OSError(f"lib{name} not found")
+        _libraries[name] = ctypes.CDLL(path)
+    return _libraries[name]
+
+
+def _xlib():
+    xlib = _load("X11")
+    if not hasattr(xlib, "_signatures_set"):
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xlib.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+        xlib.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDefaultVisual.restype = ctypes.c_void_p
+        xlib.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDisplayWidth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDisplayHeight.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XFlush.argtypes = [ctypes.c_void_p]
+        xlib.XGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int, ctypes.c_int,
+                                   ctypes.c_uint, ctypes.c_uint, ctypes.c_ulong, ctypes.c_int]
+        xlib.XGetImage.restype = ctypes.POINTER(XImage)
+        xlib.XDestroyImage.argtypes = [ctypes.POINTER(XImage)]
+        xlib.XSetErrorHandler.argtypes = [X_ERROR_HANDLER]
+        xlib.XSetErrorHandler.restype = ctypes.c_void_p
+        xlib.XStringToKeysym.argtypes = [ctypes.c_char_p]
+        xlib.XStringToKeysym.restype = ctypes.c_ulong
+        xlib.XKeysymToKeycode.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        xlib.XKeysymToKeycode.restype = ctypes.c_ubyte
+        xlib.XQueryPointer.argtypes = [ctypes.c_void_p, ctypes.c_ulong,
+                                       ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_ulong),
+                                       ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int),
+                                       ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int),
+                                       ctypes.POINTER(ctypes.c_uint)]
+        xlib._signatures_set = True
+    return xlib
+
+
+def _xext():
+    xext = _load("Xext")
+    if not hasattr(xext, "_signatures_set"):
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint,
+                                         ctypes.c_int, ctypes.c_void_p,
+                                         ctypes.POINTER(XShmSegmentInfo),
+                                         ctypes.c_uint, ctypes.c_uint]
+        xext.XShmCreateImage.restype = ctypes.POINTER(XImage)
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(XImage),
+                                      ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        xext._signatures_set = True
+    return xext
+
+
+def _xtst():
+    xtst = _load("Xtst")
+    if not hasattr(xtst, "_signatures_set"):
+        xtst.XTestQueryExtension.argtypes = [ctypes.c_void_p] + [ctypes.POINTER(ctypes.c_int)] * 4
+        xtst.XTestFakeKeyEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                                           ctypes.c_ulong]
+        xtst.XTestFakeButtonEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                                              ctypes.c_ulong]
+        xtst.XTestFakeMotionEvent.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int,
+                                              ctypes.c_int, ctypes.c_ulong]
+        xtst._signatures_set = True
+    return xtst
+
+
+def _libc():
+    libc = _load("c")
+    if not hasattr(libc, "_signatures_set"):
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+        libc._signatures_set = True
+    return libc
+
+
+# Xlib's default error handler exits the whole program. Ours just remembers
+# the last error of each of our displays so the caller can check for it
+# after an XSync. The handler is process-wide, so errors on anyone else's
+# display (Tk's, say) go on to the handler that was there before ours, and
+# that one is put back when the last X11Display is closed.
+_errors = {}  # Display pointer -> last error code, for our open displays
+_handler_lock = threading.Lock()
+_handler_users = [0]
+_previous_handler = [None]
+
+
+@X_ERROR_HANDLER
+def _on_x_error(display, event):
+    code = event.contents.error_code
+    if event.contents.display in _errors:
+        _errors[event.contents.display] = code
+        return 0
+    if _previous_handler[0]:
+        return X_ERROR_HANDLER(_previous_handler[0])(display, event)
+    return 0
+
+
+def _install_error_handler(xlib):
+    with _handler_lock:
+        if _handler_users[0] == 0:
+            _previous_handler[0] = xlib.XSetErrorHandler(_on_x_error)
+        _handler_users[0] += 1
+
+
+def _release_error_handler(xlib):
+    with _handler_lock:
+        _handler_users[0] -= 1
+        if _handler_users[0] == 0:
+            previous, _previous_handler[0] = _previous_handler[0], None
+            xlib.XSetErrorHandler(X_ERROR_HANDLER(previous) if previous else X_ERROR_HANDLER())
+
+
+class X11Display:
+    """One open connection to the X server, shared by the X11 backends"""
+
+    def __init__(self, name=None):
+        self.xlib = _xlib()
+        _install_error_handler(self.xlib)
+        self.handle = self.xlib.XOpenDisplay(name.encode() if name else None)
+        if not self.handle:
+            _release_error_handler(self.xlib)
+            raise OSError(f"Cannot open X display {name or '$DISPLAY'}")
+        _errors[self.handle] = 0
+        self.screen = self.xlib.XDefaultScreen(self.handle)
+        self.root = self.xlib.XDefaultRootWindow(self.handle)
+        self.width = self.xlib.XDisplayWidth(self.handle, self.screen)
+        self.height = self.xlib.XDisplayHeight(self.handle, self.screen)
+
+    def sync(self):
+        """Wait for the server to process everything, return the last X error (0 = none)"""
+        _errors[self.handle] = 0
+        self.xlib.XSync(self.handle, 0)
+        return _errors[self.handle]
+
+    def flush(self):
+        """Send everything queued up to the server, without waiting for it"""
+        self.xlib.XFlush(self.handle)
+
+    def pointer(self):
+        """Where the mouse pointer is, as (x, y) on the screen"""
+        window, child = ctypes.c_ulong(), ctypes.c_ulong()
+        x, y, window_x, window_y = (ctypes.c_int() for _ in range(4))
+        mask = ctypes.c_uint()
+        self.xlib.XQueryPointer(self.handle, self.root, ctypes.byref(window), ctypes.byref(child),
+                                ctypes.byref(x), ctypes.byref(y),
+                                ctypes.byref(window_x), ctypes.byref(window_y), ctypes.byref(mask))
+        return x.value, y.value
+
+    def close(self):
+        if self.handle:
+            self.xlib.XCloseDisplay(self.handle)
+            _errors.pop(self.handle, None)
+            self.handle = None
+            _release_error_handler(self.xlib)
+
+
+class XShmGrabber(GrabBackend):
+    """Grabs the capture region over a persistent X connection using shared memory
+
+    The shared memory image is created once per region size and reused for
+    every grab. grab_array() returns a NumPy view straight onto that memory
+    (BGRX byte order, no copy) - it is overwritten by the next grab. grab()
+    makes the one copy needed to turn it into an RGB PIL image that can be
+    kept around, e.g. while the PageWriter saves it.
+
+    Falls back to plain XGetImage when the X server can't share memory with
+    us (for example over ssh -X).
+    """
+
+    def __init__(self, display=None):
+        self.display = display if isinstance(display, X11Display) else X11Display(display)
+        self._owns_display = not isinstance(display, X11Display)
+        self._xext = _xext()
+        self._libc = _libc()
+        self.use_shm = bool(self._xext.XShmQueryExtension(self.display.handle))
+        self._image = None  # The shared XImage, for the current size
+        self._segment = None
+        self._size = None
+
+    def _check_region(self, region):
+        if region is None:
+            return 0, 0, self.display.width, self.display.height
+        x, y, width, height = region
+        if x < 0 or y < 0 or width <= 0 or height <= 0 or \
+                x + width > self.display.width or y + height > self.display.height:
+            raise ValueError(f"Region {region} is outside the "
+                             f"{self.display.width}x{self.display.height} screen")
+        return x, y, width, height
+
+    def _create_shared_image(self, width, height):
+        self._free_shared_image()
+        handle = self.display.handle
+        screen = self.display.screen
+        xlib = self.display.xlib
+
+        segment = XShmSegmentInfo()
+        image = self._xext.XShmCreateImage(
+            handle, xlib.XDefaultVisual(handle, screen), xlib.XDefaultDepth(handle, screen),
+            Z_PIXMAP, None, ctypes.byref(segment), width, height)
+        if not image:
+            raise OSError("XShmCreateImage failed")
+
+        size = image.contents.bytes_per_line * height
+        segment.shmid = self._libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if segment.shmid < 0:
+            xlib.XDestroyImage(image)
+            raise OSError("shmget failed")
+        segment.shmaddr = self._libc.shmat(segment.shmid, None, 0)
+        image.contents.data = segment.shmaddr
+        segment.readOnly = 0
+
+        self._xext.XShmAttach(handle, ctypes.byref(segment))
+        error = self.display.sync()
+        # Mark the segment for removal now - it goes away once both sides detach
+        self._libc.shmctl(segment.shmid, IPC_RMID, None)
+        if error:
+            self._libc.shmdt(segment.shmaddr)
+            image.contents.data = None
+            xlib.XDestroyImage(image)
+            raise OSError(f"XShmAttach failed (X error {error})")
+
+        self._image = image
+        self._segment = segment
+        self._size = (width, height)
+
+    def _free_shared_image(self):
+        if self._image is None:
+            return
+        self._xext.XShmDetach(self.display.handle, ctypes.byref(self._segment))
+        self.display.sync()
+        self._libc.shmdt(self._segment.shmaddr)
+        self._image.contents.data = None  # Don't let Xlib free() shared memory
+        self.display.xlib.XDestroyImage(self._image)
+        self._image = None
+        self._segment = None
+        self._size = None
+
+    def _grab_shm(self, x, y, width, height):
+        if self._size != (width, height):
+            try:
+                self._create_shared_image(width, height)
+            except OSError:
+                self.use_shm = False
+                return None
+        self._xext.XShmGetImage(self.display.handle, self.display.root, self._image,
+                                x, y, ALL_PLANES)
+        error = self.display.sync()
+        if error:
+            raise OSError(f"XShmGetImage failed (X error {error})")
+        return self._image.contents
+
+    def _view(self, image, copy):
+        """Wrap an XImage's pixels as a PIL image (copied to RGB) or a NumPy view"""
+        if image.bits_per_pixel != 32:
+            raise OSError(f"Unsupported screen format: {image.bits_per_pixel} bits per pixel")
+        stride = image.bytes_per_line
+        buffer = (ctypes.c_char * (stride * image.height)).from_address(image.data)
+        if copy:
+            return Image.frombuffer("RGB", (image.width, image.height), buffer,
+                                    "raw", "BGRX", stride, 1)
+        array = np.frombuffer(buffer, dtype=np.uint8).reshape(image.height, stride // 4, 4)
+        return array[:, :image.width]
+
+    def _grab(self, region, copy):
+        x, y, width, height = self._check_region(region)
+        if self.use_shm:
+            image = self._grab_shm(x, y, width, height)
+            if image is not None:
+                return self._view(image, copy)
+
+        # No shared memory - ask the server for a normal image each time
+        image = self.display.xlib.XGetImage(self.display.handle, self.display.root,
+                                            x, y, width, height, ALL_PLANES, Z_PIXMAP)
+        if not image:
+            raise OSError("XGetImage failed")
+        try:
+            result = self._view(image.contents, copy=True)
+            if not copy:
+                result = np.asarray(result)
+            return result
+        finally:
+            self.display.xlib.XDestroyImage(image)
+
+    def grab(self, region):
+        """Return an RGB PIL image of region = (x, y, width, height)"""
+        img = self._grab(region, copy=True)
+        # frombuffer may still point at X's memory - make sure we own the pixels
+        return img.copy() if img.readonly else img
+
+    def grab_array(self, region):
+        """Return the region as a NumPy array without copying
+
+        With shared memory this is a (height, width, 4) BGRX view that the
+        next grab overwrites. Without it, an (height, width, 3) RGB copy.
+        """
+        return self._grab(region, copy=False)
+
+    def close(self):
+        self._free_shared_image()
+        if self._owns_display:
+            self.display.close()
+
+
+class FailSafeError(RuntimeError):
+    """The mouse was pushed into a screen corner to stop the capture - like pyautogui's failsafe"""
+
+
+class XTestTurner(PageTurner):
+    """Turns the page with XTest key and mouse events over a persistent X connection
+
+    steps are the same as for StepTurner (see backends.parse_turn_steps).
+    Key names are turned into keycodes once, up front - an unknown key is a
+    ValueError here rather than halfway through a capture.
+
+    There is no pause after the events: turn() returns as soon as the X
+    server has taken them (one XSync round trip), plus any wait steps. So
+    the turn time the capture records is what the page turn really costs,
+    and the wait after it is all the viewer's own drawing time.
+
+    pyautogui's failsafe still works: with the mouse in a corner of the
+    screen turn() raises FailSafeError instead of turning.
+    """
+
+    def __init__(self, steps, display=None):
+        self.steps = parse_turn_steps(steps)
+        self.display = display if isinstance(display, X11Display) else X11Display(display)
+        self._owns_display = not isinstance(display, X11Display)
+        try:
+            self._xtst = _xtst()
+            numbers = [ctypes.c_int() for _ in range(4)]
+            if not self._xtst.XTestQueryExtension(self.display.handle,
+                                                  *(ctypes.byref(n) for n in numbers)):
+                raise OSError("The X server has no XTest extension")
+            self._actions = [self._action(step) for step in self.steps]
+        except Exception:
+            self.close()
+            raise
+
+    def _keycode(self, name):
+        keysym = self.display.xlib.XStringToKeysym(X_KEYSYMS.get(name.lower(), name).encode())
+        keycode = self.display.xlib.XKeysymToKeycode(self.display.handle, keysym) \
+            if keysym != NO_SYMBOL else 0
+        if not keycode:
+            raise ValueError(f"Unknown key {name!r}")
+        return keycode
+
+    def _action(self, step):
+        """A step with its key names and buttons resolved to what XTest needs"""
+        kind = step[0]
+        if kind == "key":
+            return kind, [self._keycode(name) for name in step[1]]
+        if kind == "click":
+            return kind, (step[1], step[2]), MOUSE_BUTTONS[step[3]]
+        if kind == "move":
+            return kind, (step[1], step[2])
+        if kind == "scroll":
+            button = SCROLL_UP_BUTTON if step[1] > 0 else SCROLL_DOWN_BUTTON
+            return kind, step[2], button, abs(step[1])
+        return step
+
+    def _move(self, position):
+        self._xtst.XTestFakeMotionEvent(self.display.handle, self.display.screen,
+                                        position[0], position[1], 0)
+
+    def _press(self, button, times=1):
+        for _ in range(times):
+            self._xtst.XTestFakeButtonEvent(self.display.handle, button, True, 0)
+            self._xtst.XTestFakeButtonEvent(self.display.handle, button, False, 0)
+
+    def _check_failsafe(self):
+        x, y = self.display.pointer()
+        if x in (0, self.display.width - 1) and y in (0, self.display.height - 1):
+            raise FailSafeError("Failsafe triggered by moving the mouse to a corner of the screen")
+
+    def turn(self):
+        self._check_failsafe()
+        handle = self.display.handle
+        for action in self._actions:
+            kind = action[0]
+            if kind == "key":
+                for keycode in action[1]:
+                    self._xtst.XTestFakeKeyEvent(handle, keycode, True, 0)
+                for keycode in reversed(action[1]):
+                    self._xtst.XTestFakeKeyEvent(handle, keycode, False, 0)
+            elif kind == "click":
+                self._move(action[1])
+                self._press(action[2])
+            elif kind == "move":
+                self._move(action[1])
+            elif kind == "scroll":
+                if action[1]:
+                    self._move(action[1])
+                self._press(action[2], action[3])
+            else:
+                # Whatever came before the wait has to reach the viewer first
+                self.display.flush()
+                time.sleep(action[1])
+        error = self.display.sync()
+        if error:
+            raise OSError(f"XTest page turn failed (X error {error})")
+
+    def settings(self):
+        return {"method": "steps", "steps": format_turn_steps(self.steps)}
+
+    def close(self):
+        if self._owns_display:
+            self.display.close()